@@ -2,11 +2,15 @@ package main
 
 import (
 	"bytes"
+	"container/list"
 	"context"
 	cryptoRand "crypto/rand"
+	"crypto/sha256"
 	"database/sql"
 	"encoding/binary"
+	"encoding/hex"
 	"encoding/json"
+	"errors"
 	"flag"
 	"fmt"
 	"image"
@@ -14,6 +18,7 @@ import (
 	_ "image/gif" // Allow decoding GIFs
 	"image/jpeg"
 	_ "image/png" // Allow decoding PNGs
+	"io"
 	"math"
 	"math/rand"
 	"net"
@@ -23,6 +28,7 @@ import (
 	"path/filepath"
 	"reflect"
 	"strings"
+	"sync"
 	"syscall"
 	"time"
 
@@ -99,6 +105,8 @@ func NewMessageStore(storagePath string) (*MessageStore, error) {
 		CREATE INDEX IF NOT EXISTS idx_messages_chat_timestamp ON messages(chat_jid, timestamp);
 		CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender);
 		CREATE INDEX IF NOT EXISTS idx_chats_name ON chats(name);
+		CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp, id);
+		CREATE INDEX IF NOT EXISTS idx_chats_last_message_time ON chats(last_message_time, jid);
 	`)
 	if err != nil {
 		db.Close()
@@ -139,6 +147,25 @@ func (store *MessageStore) StoreMessage(id, chatJID, sender, content string, tim
 	return err
 }
 
+// HasSentMessage reports whether a message with this ID was already sent to chatJID
+func (store *MessageStore) HasSentMessage(id, chatJID string) bool {
+	var exists int
+	err := store.db.QueryRow(
+		"SELECT 1 FROM messages WHERE id = ? AND chat_jid = ? AND is_from_me = 1",
+		id, chatJID,
+	).Scan(&exists)
+	return err == nil
+}
+
+// sendExtra pins the WhatsApp message ID when the caller supplies one, so a
+// retried request re-sends the same message instead of creating a new one
+func sendExtra(messageID string) []whatsmeow.SendRequestExtra {
+	if messageID == "" {
+		return nil
+	}
+	return []whatsmeow.SendRequestExtra{{ID: types.MessageID(messageID)}}
+}
+
 // Get messages from a chat
 func (store *MessageStore) GetMessages(chatJID string, limit int) ([]Message, error) {
 	rows, err := store.db.Query(
@@ -215,10 +242,97 @@ type SendMessageRequest struct {
 	Recipient string `json:"recipient"`
 	Message   string `json:"message"`
 	MediaPath string `json:"media_path,omitempty"`
+	// Optional JPEG preview shown for images and videos
+	ThumbnailPath string `json:"thumbnail_path,omitempty"`
+	// Optional caller-chosen message ID; retries with the same ID are not sent twice
+	MessageID string `json:"message_id,omitempty"`
+}
+
+// Earlier uploads are reused for uploadCacheTTL (WhatsApp keeps media on its
+// servers far longer), remembering at most maxUploadCacheEntries files
+const (
+	uploadCacheTTL        = 24 * time.Hour
+	maxUploadCacheEntries = 512
+)
+
+type uploadCacheEntry struct {
+	key        string
+	resp       whatsmeow.UploadResponse
+	uploadedAt time.Time
+}
+
+var (
+	uploadCacheMu sync.Mutex
+	uploadCache   = make(map[string]*list.Element)
+	// Most recently used first; values are *uploadCacheEntry
+	uploadOrder = list.New()
+	// One lock per file, so concurrent sends of the same bytes upload them once
+	uploadLocks = &keyedMutex{locks: make(map[string]*refMutex)}
+)
+
+// uploadMedia uploads media to WhatsApp unless the same bytes were uploaded
+// as the same media type recently, in which case the earlier upload (direct
+// path, media key and hashes) is reused. Sending one file to many chats then
+// uploads it once.
+func uploadMedia(client *whatsmeow.Client, data []byte, mediaType whatsmeow.MediaType) (whatsmeow.UploadResponse, bool, error) {
+	sum := sha256.Sum256(data)
+	// The media key is derived per media type, so the type is part of the key
+	key := hex.EncodeToString(sum[:]) + ":" + string(mediaType)
+
+	defer uploadLocks.lock(key)()
+
+	uploadCacheMu.Lock()
+	if elem, ok := uploadCache[key]; ok {
+		entry := elem.Value.(*uploadCacheEntry)
+		if time.Since(entry.uploadedAt) < uploadCacheTTL {
+			uploadOrder.MoveToFront(elem)
+			uploadCacheMu.Unlock()
+			return entry.resp, true, nil
+		}
+	}
+	uploadCacheMu.Unlock()
+
+	resp, err := client.Upload(context.Background(), data, mediaType)
+	if err != nil {
+		return resp, false, err
+	}
+
+	uploadCacheMu.Lock()
+	defer uploadCacheMu.Unlock()
+	entry := &uploadCacheEntry{key: key, resp: resp, uploadedAt: time.Now()}
+	if elem, ok := uploadCache[key]; ok {
+		elem.Value = entry
+		uploadOrder.MoveToFront(elem)
+	} else {
+		uploadCache[key] = uploadOrder.PushFront(entry)
+	}
+	for uploadOrder.Len() > maxUploadCacheEntries {
+		oldest := uploadOrder.Back()
+		uploadOrder.Remove(oldest)
+		delete(uploadCache, oldest.Value.(*uploadCacheEntry).key)
+	}
+	return resp, false, nil
 }
 
 // Function to send a WhatsApp message
-func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, recipient string, message string, mediaPath string) (bool, string) {
+func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, recipient string, message string, mediaPath string, thumbnailPath string, requestedID string) (bool, string) {
+	var thumbnail []byte
+	if thumbnailPath != "" {
+		// A missing preview should not stop the message itself
+		data, err := os.ReadFile(thumbnailPath)
+		if err != nil {
+			fmt.Printf("Ignoring thumbnail %s: %v\n", thumbnailPath, err)
+		} else {
+			thumbnail = data
+		}
+	}
+	return sendWhatsAppContent(client, messageStore, recipient, message, mediaPath, nil, thumbnail, requestedID)
+}
+
+// sendWhatsAppContent sends a text or media message. Media is taken from
+// mediaData when given, with mediaName only naming it; otherwise it is read
+// from the file at mediaName
+func sendWhatsAppContent(client *whatsmeow.Client, messageStore *MessageStore, recipient string, message string, mediaName string, mediaData []byte, thumbnail []byte, requestedID string) (bool, string) {
 	if !client.IsConnected() {
 		return false, "Not connected to WhatsApp"
 	}
@@ -244,21 +358,27 @@ func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, r
 		}
 	}
 
+	if requestedID != "" && messageStore.HasSentMessage(requestedID, recipientJID.String()) {
+		return true, fmt.Sprintf("Message %s already sent", requestedID)
+	}
+
 	msg := &waProto.Message{}
 
 	// Check if we have media to send
-	if mediaPath != "" {
-		// Read media file
-		mediaData, err := os.ReadFile(mediaPath)
-		if err != nil {
-			return false, fmt.Sprintf("Error reading media file: %v", err)
+	if mediaName != "" {
+		// Read media file unless its contents were streamed to us
+		if mediaData == nil {
+			mediaData, err = os.ReadFile(mediaName)
+			if err != nil {
+				return false, fmt.Sprintf("Error reading media file: %v", err)
+			}
 		}
 
 		// Get file base name (without path)
-		fileName := filepath.Base(mediaPath)
+		fileName := filepath.Base(mediaName)
 
 		// Determine media type and mime type based on file extension
-		fileExt := strings.ToLower(filepath.Ext(mediaPath))
+		fileExt := strings.ToLower(filepath.Ext(mediaName))
 		if fileExt != "" && fileExt[0] == '.' {
 			fileExt = fileExt[1:] // Remove the leading dot
 		}
@@ -340,13 +460,17 @@ func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, r
 			}
 		}
 
-		// Upload media to WhatsApp servers
-		resp, err := client.Upload(context.Background(), mediaData, mediaType)
+		// Upload media to WhatsApp servers, or reuse an earlier upload of the same bytes
+		resp, reused, err := uploadMedia(client, mediaData, mediaType)
 		if err != nil {
 			return false, fmt.Sprintf("Error uploading media: %v", err)
 		}
 
-		fmt.Println("Media uploaded", resp)
+		if reused {
+			fmt.Println("Media upload reused", resp.DirectPath)
+		} else {
+			fmt.Println("Media uploaded", resp)
+		}
 
 		// Create the appropriate message type based on media type
 		switch mediaType {
@@ -360,6 +484,7 @@ func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, r
 				FileEncSHA256: resp.FileEncSHA256,
 				FileSHA256:    resp.FileSHA256,
 				FileLength:    &resp.FileLength,
+				JPEGThumbnail: thumbnail,
 			}
 		case whatsmeow.MediaAudio:
 			// Handle ogg audio files
@@ -401,6 +526,7 @@ func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, r
 				FileEncSHA256: resp.FileEncSHA256,
 				FileSHA256:    resp.FileSHA256,
 				FileLength:    &resp.FileLength,
+				JPEGThumbnail: thumbnail,
 			}
 		case whatsmeow.MediaDocument:
 			msg.DocumentMessage = &waProto.DocumentMessage{
@@ -421,7 +547,7 @@ func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, r
 	}
 
 	// Send message
-	respInfo, err := client.SendMessage(context.Background(), recipientJID, msg)
+	respInfo, err := client.SendMessage(context.Background(), recipientJID, msg, sendExtra(requestedID)...)
 
 	if err != nil {
 		return false, fmt.Sprintf("Error sending message: %v", err)
@@ -445,9 +571,9 @@ func sendWhatsAppMessage(client *whatsmeow.Client, messageStore *MessageStore, r
 	var storeMediaKey, storeFileSHA256, storeFileEncSHA256 []byte
 	var storeFileLength uint64
 
-	if mediaPath != "" {
+	if mediaName != "" {
 		// This is a media message, extract info from the constructed `msg`
-		storeFilename = filepath.Base(mediaPath)
+		storeFilename = filepath.Base(mediaName)
 		// Eliminat accesul la respInfo.Resp, folosim doar msg pentru extragere info
 		if msg.ImageMessage != nil {
 			storeMediaType = "image"
@@ -995,7 +1121,7 @@ func createPoll(client *whatsmeow.Client, chatJID, question string, options []st
 	return true, fmt.Sprintf("poll created (ID: %s)", resp.ID)
 }
 
-func sendReply(client *whatsmeow.Client, chatJID, quotedMessageID, quotedSenderJID, message, quotedContent string) (bool, string) {
+func sendReply(client *whatsmeow.Client, messageStore *MessageStore, chatJID, quotedMessageID, quotedSenderJID, message, quotedContent, messageID string) (bool, string) {
 	if !client.IsConnected() {
 		return false, "not connected to WhatsApp"
 	}
@@ -1003,6 +1129,9 @@ func sendReply(client *whatsmeow.Client, chatJID, quotedMessageID, quotedSenderJ
 	if err != nil {
 		return false, fmt.Sprintf("invalid chat JID: %v", err)
 	}
+	if messageID != "" && messageStore.HasSentMessage(messageID, chat.String()) {
+		return true, fmt.Sprintf("reply %s already sent", messageID)
+	}
 	msg := &waProto.Message{
 		ExtendedTextMessage: &waProto.ExtendedTextMessage{
 			Text: proto.String(message),
@@ -1013,10 +1142,18 @@ func sendReply(client *whatsmeow.Client, chatJID, quotedMessageID, quotedSenderJ
 			},
 		},
 	}
-	resp, err := client.SendMessage(context.Background(), chat, msg)
+	resp, err := client.SendMessage(context.Background(), chat, msg, sendExtra(messageID)...)
 	if err != nil {
 		return false, fmt.Sprintf("failed to send reply: %v", err)
 	}
+	// Stored so a retry with the same message ID finds it already sent
+	sender := ""
+	if client.Store != nil && client.Store.ID != nil {
+		sender = client.Store.ID.User
+	}
+	if err := messageStore.StoreMessage(resp.ID, chat.String(), sender, message, time.Now(), true, "", "", "", nil, nil, nil, 0); err != nil {
+		fmt.Printf("Error storing sent reply: %v\n", err)
+	}
 	return true, fmt.Sprintf("reply sent (ID: %s)", resp.ID)
 }
 
@@ -1304,6 +1441,8 @@ type DownloadMediaResponse struct {
 	Message  string `json:"message"`
 	Filename string `json:"filename,omitempty"`
 	Path     string `json:"path,omitempty"`
+	// "existing", "deduplicated" or "downloaded"
+	Source string `json:"source,omitempty"`
 }
 
 // ----- Group management request/response types -----
@@ -1482,6 +1621,7 @@ type SendReplyRequest struct {
 	QuotedSenderJID string `json:"quoted_sender_jid"`
 	Message         string `json:"message"`
 	QuotedContent   string `json:"quoted_content"`
+	MessageID       string `json:"message_id,omitempty"`
 }
 
 type SendPresenceRequest struct {
@@ -1620,7 +1760,7 @@ func (d *MediaDownloader) GetMediaType() whatsmeow.MediaType {
 }
 
 // Function to download media from a message
-func downloadMedia(client *whatsmeow.Client, messageStore *MessageStore, messageID, chatJID string) (bool, string, string, string, error) {
+func downloadMedia(client *whatsmeow.Client, messageStore *MessageStore, messageID, chatJID string) (bool, string, string, string, string, error) {
 	// Query the database for the message
 	var mediaType, filename, url string
 	var mediaKey, fileSHA256, fileEncSHA256 []byte
@@ -1642,18 +1782,18 @@ func downloadMedia(client *whatsmeow.Client, messageStore *MessageStore, message
 		).Scan(&mediaType, &filename)
 
 		if err != nil {
-			return false, "", "", "", fmt.Errorf("failed to find message: %v", err)
+			return false, "", "", "", "", fmt.Errorf("failed to find message: %v", err)
 		}
 	}
 
 	// Check if this is a media message
 	if mediaType == "" {
-		return false, "", "", "", fmt.Errorf("not a media message")
+		return false, "", "", "", "", fmt.Errorf("not a media message")
 	}
 
 	// Create directory for the chat if it doesn't exist
 	if err := os.MkdirAll(chatDir, 0755); err != nil {
-		return false, "", "", "", fmt.Errorf("failed to create chat directory: %v", err)
+		return false, "", "", "", "", fmt.Errorf("failed to create chat directory: %v", err)
 	}
 
 	// Ensure filename includes messageID for uniqueness (fix for old DB entries)
@@ -1669,18 +1809,33 @@ func downloadMedia(client *whatsmeow.Client, messageStore *MessageStore, message
 	// Get absolute path
 	absPath, err := filepath.Abs(localPath)
 	if err != nil {
-		return false, "", "", "", fmt.Errorf("failed to get absolute path: %v", err)
+		return false, "", "", "", "", fmt.Errorf("failed to get absolute path: %v", err)
 	}
 
 	// Check if file already exists
 	if _, err := os.Stat(localPath); err == nil {
 		// File exists, return it
-		return true, mediaType, filename, absPath, nil
+		return true, mediaType, filename, absPath, downloadSourceExisting, nil
+	}
+
+	// Forwarded files have the same content hash in every chat, so they are
+	// stored once and each chat gets a hardlink to that copy
+	contentPath := ""
+	if len(fileSHA256) > 0 {
+		contentPath = mediaContentPath(fileSHA256, filename)
+		defer downloadLocks.lock(contentPath)()
+
+		if _, err := os.Stat(contentPath); err == nil {
+			if err := linkMediaFile(contentPath, localPath); err != nil {
+				return false, "", "", "", "", fmt.Errorf("failed to save media file: %v", err)
+			}
+			return true, mediaType, filename, absPath, downloadSourceDeduplicated, nil
+		}
 	}
 
 	// If we don't have all the media info we need, we can't download
 	if url == "" || len(mediaKey) == 0 || len(fileSHA256) == 0 || len(fileEncSHA256) == 0 || fileLength == 0 {
-		return false, "", "", "", fmt.Errorf("incomplete media information for download")
+		return false, "", "", "", "", fmt.Errorf("incomplete media information for download")
 	}
 
 	fmt.Printf("Attempting to download media for message %s in chat %s...\n", messageID, chatJID)
@@ -1702,7 +1857,7 @@ func downloadMedia(client *whatsmeow.Client, messageStore *MessageStore, message
 	case "sticker":
 		waMediaType = whatsmeow.MediaImage // Stickers are handled as images
 	default:
-		return false, "", "", "", fmt.Errorf("unsupported media type: %s", mediaType)
+		return false, "", "", "", "", fmt.Errorf("unsupported media type: %s", mediaType)
 	}
 
 	downloader := &MediaDownloader{
@@ -1718,16 +1873,115 @@ func downloadMedia(client *whatsmeow.Client, messageStore *MessageStore, message
 	// Download the media using whatsmeow client - Update to use context
 	mediaData, err := client.Download(context.Background(), downloader)
 	if err != nil {
-		return false, "", "", "", fmt.Errorf("failed to download media: %v", err)
+		return false, "", "", "", "", fmt.Errorf("failed to download media: %v", err)
 	}
 
 	// Save the downloaded media to file
-	if err := os.WriteFile(localPath, mediaData, 0644); err != nil {
-		return false, "", "", "", fmt.Errorf("failed to save media file: %v", err)
+	if contentPath != "" {
+		err = writeFileAtomic(contentPath, mediaData)
+		if err == nil {
+			err = linkMediaFile(contentPath, localPath)
+		}
+	} else {
+		err = os.WriteFile(localPath, mediaData, 0644)
+	}
+	if err != nil {
+		return false, "", "", "", "", fmt.Errorf("failed to save media file: %v", err)
 	}
 
 	fmt.Printf("Successfully downloaded %s media to %s (%d bytes)\n", mediaType, absPath, len(mediaData))
-	return true, mediaType, filename, absPath, nil
+	return true, mediaType, filename, absPath, downloadSourceDownloaded, nil
+}
+
+// Where downloadMedia found a file: already in the chat's folder, linked from
+// a copy downloaded for another message, or fetched from WhatsApp
+const (
+	downloadSourceExisting     = "existing"
+	downloadSourceDeduplicated = "deduplicated"
+	downloadSourceDownloaded   = "downloaded"
+)
+
+// keyedMutex hands out one mutex per key. An entry lives only while someone
+// holds or waits for it, so the map does not grow with every key ever used.
+type keyedMutex struct {
+	mu    sync.Mutex
+	locks map[string]*refMutex
+}
+
+type refMutex struct {
+	sync.Mutex
+	refs int
+}
+
+// lock blocks until key is free and returns the function that releases it
+func (k *keyedMutex) lock(key string) func() {
+	k.mu.Lock()
+	m, ok := k.locks[key]
+	if !ok {
+		m = &refMutex{}
+		k.locks[key] = m
+	}
+	m.refs++
+	k.mu.Unlock()
+
+	m.Lock()
+	return func() {
+		m.Unlock()
+		k.mu.Lock()
+		m.refs--
+		if m.refs == 0 {
+			delete(k.locks, key)
+		}
+		k.mu.Unlock()
+	}
+}
+
+// One lock per content file, so concurrent downloads of the same media fetch it once
+var downloadLocks = &keyedMutex{locks: make(map[string]*refMutex)}
+
+// mediaContentPath is the shared copy of a media file, named by its SHA-256
+// under store/media/<first two hex digits>/ to keep directories small
+func mediaContentPath(fileSHA256 []byte, filename string) string {
+	sum := hex.EncodeToString(fileSHA256)
+	return filepath.Join(globalAbsStoragePath, "media", sum[:2], sum+strings.ToLower(filepath.Ext(filename)))
+}
+
+// writeFileAtomic writes through a temporary file and renames it into place,
+// so an interrupted download never leaves a truncated file at path
+func writeFileAtomic(path string, data []byte) error {
+	if err := os.MkdirAll(filepath.Dir(path), 0755); err != nil {
+		return err
+	}
+	tmp, err := os.CreateTemp(filepath.Dir(path), ".download-*")
+	if err != nil {
+		return err
+	}
+	defer os.Remove(tmp.Name())
+	if _, err := tmp.Write(data); err != nil {
+		tmp.Close()
+		return err
+	}
+	if err := tmp.Close(); err != nil {
+		return err
+	}
+	if err := os.Chmod(tmp.Name(), 0644); err != nil {
+		return err
+	}
+	return os.Rename(tmp.Name(), path)
+}
+
+// linkMediaFile hardlinks the chat's file to the shared copy, copying it
+// instead where the filesystem has no hardlinks
+func linkMediaFile(contentPath, localPath string) error {
+	err := os.Link(contentPath, localPath)
+	if err == nil || os.IsExist(err) {
+		return nil
+	}
+	data, err := os.ReadFile(contentPath)
+	if err != nil {
+		return err
+	}
+	return writeFileAtomic(localPath, data)
 }
 
 // Extract direct path from a WhatsApp media URL
@@ -1750,6 +2004,266 @@ func extractDirectPathFromURL(url string) string {
 	return "/" + pathPart
 }
 
+// BatchOperation is one call inside a /api/batch request; Params is the body
+// the operation's own endpoint accepts
+type BatchOperation struct {
+	Op     string          `json:"op"`
+	Params json.RawMessage `json:"params"`
+}
+
+type BatchRequest struct {
+	Operations []BatchOperation `json:"operations"`
+}
+
+type BatchResult struct {
+	Op         string          `json:"op"`
+	StatusCode int             `json:"status_code"`
+	Success    bool            `json:"success"`
+	Message    string          `json:"message,omitempty"`
+	Response   json.RawMessage `json:"response,omitempty"`
+}
+
+type BatchResponse struct {
+	Success bool          `json:"success"`
+	Message string        `json:"message"`
+	Results []BatchResult `json:"results"`
+}
+
+// batchOp runs one batched operation from the body its own endpoint accepts
+// and returns that endpoint's response, or an error for invalid params
+type batchOp func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error)
+
+// Operations /api/batch may run, each calling the same function as its
+// endpoint. Sends, media transfers and connection management stay single
+// calls: they are slow or change session state.
+var batchOps = map[string]batchOp{
+	"mark_read": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req MarkReadRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.ChatJID == "" || len(req.MessageIDs) == 0 {
+			return nil, errors.New("chat_jid and message_ids are required")
+		}
+		success, msg := markRead(client, req.ChatJID, req.SenderJID, req.MessageIDs)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"send_reaction": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req SendReactionRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.ChatJID == "" || req.MessageID == "" {
+			return nil, errors.New("chat_jid and message_id are required")
+		}
+		success, msg := sendReaction(client, req.ChatJID, req.SenderJID, req.MessageID, req.Reaction)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"edit_message": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req EditMessageRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.ChatJID == "" || req.MessageID == "" || req.NewText == "" {
+			return nil, errors.New("chat_jid, message_id, and new_text are required")
+		}
+		success, msg := editMessage(client, req.ChatJID, req.MessageID, req.NewText)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"delete_message": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req DeleteMessageRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.ChatJID == "" || req.MessageID == "" {
+			return nil, errors.New("chat_jid and message_id are required")
+		}
+		success, msg := deleteMessage(client, req.ChatJID, req.SenderJID, req.MessageID)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"is_on_whatsapp": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req IsOnWhatsAppRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if len(req.Phones) == 0 {
+			return nil, errors.New("phones list is required")
+		}
+		success, msg, results := isOnWhatsApp(client, req.Phones)
+		return IsOnWhatsAppResponse{Success: success, Message: msg, Results: results}, nil
+	},
+	"get_group_info": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req GetGroupInfoRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("jid is required")
+		}
+		success, msg, data := getGroupInfo(client, req.JID)
+		return GetGroupInfoResponse{Success: success, Message: msg, Group: data}, nil
+	},
+	"get_contact_groups": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req GetContactGroupsRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("JID is required")
+		}
+		success, msg, groups := getContactGroups(client, req.JID)
+		return GetContactGroupsResponse{Success: success, Message: msg, Groups: groups}, nil
+	},
+	"get_group_invite_link": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req GetGroupInviteLinkRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("jid is required")
+		}
+		success, msg, link := getGroupInviteLink(client, req.JID, req.Reset)
+		return GetGroupInviteLinkResponse{Success: success, Message: msg, Link: link}, nil
+	},
+	"get_sub_groups": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req GetSubGroupsRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("jid is required")
+		}
+		success, msg, groups := getSubGroups(client, req.JID)
+		return GetSubGroupsResponse{Success: success, Message: msg, Groups: groups}, nil
+	},
+	"set_group_name": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req SetGroupNameRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" || req.Name == "" {
+			return nil, errors.New("Group JID and name are required")
+		}
+		success, msg := setGroupName(client, req.JID, req.Name)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"set_group_topic": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req SetGroupTopicRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("jid is required")
+		}
+		success, msg := setGroupTopic(client, req.JID, req.Topic)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"set_group_announce": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req SetGroupAnnounceRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("jid is required")
+		}
+		success, msg := setGroupAnnounce(client, req.JID, req.Announce)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"set_group_locked": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req SetGroupLockedRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("jid is required")
+		}
+		success, msg := setGroupLocked(client, req.JID, req.Locked)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"set_group_join_approval": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req SetGroupJoinApprovalRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" {
+			return nil, errors.New("jid is required")
+		}
+		success, msg := setGroupJoinApproval(client, req.JID, req.Mode)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"update_group_participants": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req UpdateGroupParticipantsRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.JID == "" || req.Action == "" {
+			return nil, errors.New("Group JID and action are required")
+		}
+		success, msg := updateGroupParticipants(client, req.JID, req.Action, req.Participants)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+	"send_presence": func(client *whatsmeow.Client, params json.RawMessage) (interface{}, error) {
+		var req SendPresenceRequest
+		if err := json.Unmarshal(params, &req); err != nil {
+			return nil, errors.New("Invalid request format")
+		}
+		if req.Presence == "" {
+			return nil, errors.New("presence is required")
+		}
+		success, msg := sendPresence(client, req.Presence)
+		return BasicResponse{Success: success, Message: msg}, nil
+	},
+}
+
+// Largest media body accepted by /api/send_media (WhatsApp's own limit is lower for most types)
+const maxStreamedMediaBytes = 100 << 20
+
+const (
+	maxBatchOperations = 500
+	batchWorkers       = 8
+)
+
+// runBatchOperation runs one operation and reports it with the status code
+// and response its own endpoint would have given
+func runBatchOperation(client *whatsmeow.Client, op BatchOperation) BatchResult {
+	result := BatchResult{Op: op.Op}
+	run, ok := batchOps[op.Op]
+	if !ok {
+		result.StatusCode = http.StatusBadRequest
+		result.Message = fmt.Sprintf("operation %q cannot be batched", op.Op)
+		return result
+	}
+	params := op.Params
+	if len(params) == 0 {
+		params = json.RawMessage("{}")
+	}
+	response, err := run(client, params)
+	if err != nil {
+		result.StatusCode = http.StatusBadRequest
+		result.Message = err.Error()
+		return result
+	}
+	body, err := json.Marshal(response)
+	if err != nil {
+		result.StatusCode = http.StatusInternalServerError
+		result.Message = err.Error()
+		return result
+	}
+	var basic struct {
+		Success bool   `json:"success"`
+		Message string `json:"message"`
+	}
+	json.Unmarshal(body, &basic)
+	result.Success = basic.Success
+	result.Message = basic.Message
+	result.Response = json.RawMessage(body)
+	result.StatusCode = http.StatusOK
+	if !basic.Success {
+		result.StatusCode = http.StatusInternalServerError
+	}
+	return result
+}
+
 // Start a REST API server to expose the WhatsApp client functionality
 func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port int) {
 	// Handler for sending messages
@@ -1781,7 +2295,7 @@ func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port
 		fmt.Println("Received request to send message", req.Message, req.MediaPath)
 
 		// Send the message
-		success, message := sendWhatsAppMessage(client, messageStore, req.Recipient, req.Message, req.MediaPath)
+		success, message := sendWhatsAppMessage(client, messageStore, req.Recipient, req.Message, req.MediaPath, req.ThumbnailPath, req.MessageID)
 		fmt.Println("Message sent", success, message)
 		// Set response headers
 		w.Header().Set("Content-Type", "application/json")
@@ -1798,6 +2312,60 @@ func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port
 		})
 	})
 
+	// Handler for sending media streamed in the request body, so callers that
+	// encode in memory (e.g. voice notes piped through ffmpeg) need no file on disk
+	http.HandleFunc("/api/send_media", func(w http.ResponseWriter, r *http.Request) {
+		if r.Method != http.MethodPost {
+			http.Error(w, "Method not allowed", http.StatusMethodNotAllowed)
+			return
+		}
+
+		query := r.URL.Query()
+		recipient := query.Get("recipient")
+		fileName := filepath.Base(query.Get("filename"))
+		if recipient == "" {
+			http.Error(w, "Recipient is required", http.StatusBadRequest)
+			return
+		}
+		if fileName == "." || fileName == "/" || filepath.Ext(fileName) == "" {
+			http.Error(w, "filename with an extension is required", http.StatusBadRequest)
+			return
+		}
+
+		// A retried upload that already went through is answered before reading the body
+		if requestedID := query.Get("message_id"); requestedID != "" {
+			if jid, err := parsePhoneOrJID(recipient); err == nil && messageStore.HasSentMessage(requestedID, jid.String()) {
+				w.Header().Set("Content-Type", "application/json")
+				json.NewEncoder(w).Encode(SendMessageResponse{
+					Success: true,
+					Message: fmt.Sprintf("Message %s already sent", requestedID),
+				})
+				return
+			}
+		}
+
+		mediaData, err := io.ReadAll(http.MaxBytesReader(w, r.Body, maxStreamedMediaBytes))
+		if err != nil {
+			http.Error(w, fmt.Sprintf("Error reading media: %v", err), http.StatusRequestEntityTooLarge)
+			return
+		}
+		if len(mediaData) == 0 {
+			http.Error(w, "Media body is required", http.StatusBadRequest)
+			return
+		}
+
+		fmt.Println("Received streamed media", fileName, len(mediaData), "bytes")
+		success, message := sendWhatsAppContent(client, messageStore, recipient, query.Get("message"), fileName, mediaData, nil, query.Get("message_id"))
+		w.Header().Set("Content-Type", "application/json")
+		if !success {
+			w.WriteHeader(http.StatusInternalServerError)
+		}
+		json.NewEncoder(w).Encode(SendMessageResponse{
+			Success: success,
+			Message: message,
+		})
+	})
+
 	// Handler for downloading media
 	http.HandleFunc("/api/download", func(w http.ResponseWriter, r *http.Request) {
 		// Only allow POST requests
@@ -1820,7 +2388,7 @@ func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port
 		}
 
 		// Download the media
-		success, mediaType, filename, path, err := downloadMedia(client, messageStore, req.MessageID, req.ChatJID)
+		success, mediaType, filename, path, source, err := downloadMedia(client, messageStore, req.MessageID, req.ChatJID)
 
 		// Set response headers
 		w.Header().Set("Content-Type", "application/json")
@@ -1846,6 +2414,7 @@ func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port
 			Message:  fmt.Sprintf("Successfully downloaded %s media", mediaType),
 			Filename: filename,
 			Path:     path,
+			Source:   source,
 		})
 	})
 
@@ -2292,7 +2861,7 @@ func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port
 			http.Error(w, "chat_jid, quoted_message_id, and message are required", http.StatusBadRequest)
 			return
 		}
-		success, msg := sendReply(client, req.ChatJID, req.QuotedMessageID, req.QuotedSenderJID, req.Message, req.QuotedContent)
+		success, msg := sendReply(client, messageStore, req.ChatJID, req.QuotedMessageID, req.QuotedSenderJID, req.Message, req.QuotedContent, req.MessageID)
 		w.Header().Set("Content-Type", "application/json")
 		if !success {
 			w.WriteHeader(http.StatusInternalServerError)
@@ -2489,6 +3058,59 @@ func startRESTServer(client *whatsmeow.Client, messageStore *MessageStore, port
 		json.NewEncoder(w).Encode(GetSubGroupsResponse{Success: success, Message: msg, Groups: groups})
 	})
 
+	// Handler for running many operations in one request
+	http.HandleFunc("/api/batch", func(w http.ResponseWriter, r *http.Request) {
+		if r.Method != http.MethodPost {
+			http.Error(w, "Method not allowed", http.StatusMethodNotAllowed)
+			return
+		}
+		var req BatchRequest
+		if err := json.NewDecoder(r.Body).Decode(&req); err != nil {
+			http.Error(w, "Invalid request format", http.StatusBadRequest)
+			return
+		}
+		if len(req.Operations) == 0 {
+			http.Error(w, "operations list is required", http.StatusBadRequest)
+			return
+		}
+		if len(req.Operations) > maxBatchOperations {
+			http.Error(w, fmt.Sprintf("at most %d operations per batch", maxBatchOperations), http.StatusBadRequest)
+			return
+		}
+
+		// Results keep the request order; a few workers overlap the WhatsApp round trips
+		results := make([]BatchResult, len(req.Operations))
+		indexes := make(chan int)
+		var wg sync.WaitGroup
+		for i := 0; i < batchWorkers && i < len(req.Operations); i++ {
+			wg.Add(1)
+			go func() {
+				defer wg.Done()
+				for idx := range indexes {
+					results[idx] = runBatchOperation(client, req.Operations[idx])
+				}
+			}()
+		}
+		for idx := range req.Operations {
+			indexes <- idx
+		}
+		close(indexes)
+		wg.Wait()
+
+		succeeded := 0
+		for _, result := range results {
+			if result.Success {
+				succeeded++
+			}
+		}
+		w.Header().Set("Content-Type", "application/json")
+		json.NewEncoder(w).Encode(BatchResponse{
+			Success: true,
+			Message: fmt.Sprintf("%d of %d operations succeeded", succeeded, len(results)),
+			Results: results,
+		})
+	})
+
 	// Handler for connection status
 	http.HandleFunc("/api/status", func(w http.ResponseWriter, r *http.Request) {
 		w.Header().Set("Content-Type", "application/json")
@@ -1,6 +1,42 @@
+"""Audio conversion for voice messages.
+
+WhatsApp voice notes must be Opus in an Ogg container, and converting is an
+ffmpeg run at maximum compression. Results are cached by the input's content
+hash and the encoding parameters, so sending the same clip to many chats
+converts it once:
+
+- convert_to_opus_ogg_bytes() reads ffmpeg's output from a pipe and keeps it
+  in a bounded in-memory cache; nothing is written to disk.
+- convert_to_opus_ogg_temp() writes to the on-disk media cache (see media.py),
+  which is bounded in size with least-recently-used eviction.
+
+Conversions run on the media worker pool, and concurrent requests for the
+same clip share one conversion.
+"""
+import hashlib
 import os
 import subprocess
-import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict
+
+import media
+
+# Bumped when the ffmpeg arguments change, so old cached outputs are not reused
+_ENCODER_VERSION = 1
+
+def _opus_args(bitrate, sample_rate):
+    return [
+        "-c:a", "libopus",
+        "-b:a", bitrate,
+        "-ar", str(sample_rate),
+        "-application", "voip",  # Optimize for voice
+        "-vbr", "on",           # Variable bitrate
+        "-compression_level", "10",  # Maximum compression
+        "-frame_duration", "60",     # 60ms frames (good for voice)
+    ]
+
 
 def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate=24000):
     """
@@ -29,20 +65,14 @@ def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate
     
     # Ensure the output directory exists
     output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
     
     # Build the ffmpeg command
     cmd = [
         "ffmpeg",
         "-i", input_file,
-        "-c:a", "libopus",
-        "-b:a", bitrate,
-        "-ar", str(sample_rate),
-        "-application", "voip",  # Optimize for voice
-        "-vbr", "on",           # Variable bitrate
-        "-compression_level", "10",  # Maximum compression
-        "-frame_duration", "60",     # 60ms frames (good for voice)
+        *_opus_args(bitrate, sample_rate),
         "-y",                        # Overwrite output file if it exists
         output_file
     ]
@@ -63,7 +93,10 @@ def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate
 
 def convert_to_opus_ogg_temp(input_file, bitrate="32k", sample_rate=24000):
     """
-    Convert an audio file to Opus format in an Ogg container and store in a temporary file.
+    Convert an audio file to Opus format in an Ogg container, reusing cached results.
+    
+    The returned file lives in the conversion cache and is removed by its
+    eviction, so callers must not delete it.
     
     Args:
         input_file (str): Path to the input audio file
@@ -71,25 +104,128 @@ def convert_to_opus_ogg_temp(input_file, bitrate="32k", sample_rate=24000):
         sample_rate (int, optional): Sample rate for output (default: 24000)
     
     Returns:
-        str: Path to the temporary file with the converted audio
+        str: Path to the converted audio
         
     Raises:
         FileNotFoundError: If the input file doesn't exist
         RuntimeError: If the ffmpeg conversion fails
     """
-    # Create a temporary file with .ogg extension
-    temp_file = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False)
-    temp_file.close()
+    return submit_conversion(input_file, bitrate, sample_rate).result()
+
+
+_lock = threading.Lock()
+# In-memory conversions in progress, so concurrent requests for one clip share the work
+_in_flight: Dict[str, Future] = {}
+
+
+def _cache_key(digest, bitrate, sample_rate):
+    return media.cache_key(digest, f"opus-ogg-v{_ENCODER_VERSION}:{bitrate}:{sample_rate}")
+
+
+def submit_conversion(input_file, bitrate="32k", sample_rate=24000):
+    """
+    Start converting an audio file on the media worker pool, or reuse a cached result.
+    
+    Args:
+        input_file (str): Path to the input audio file
+        bitrate (str, optional): Target bitrate for Opus encoding (default: "32k")
+        sample_rate (int, optional): Sample rate for output (default: 24000)
     
+    Returns:
+        Future: Resolves to the path of the converted file in the cache
+        
+    Raises:
+        FileNotFoundError: If the input file doesn't exist
+    """
+    if not os.path.isfile(input_file):
+        raise FileNotFoundError(f"Input file not found: {input_file}")
+    key = _cache_key(media.file_digest(input_file), bitrate, sample_rate)
+    return media.cached(key, ".ogg", lambda output: convert_to_opus_ogg(input_file, output, bitrate, sample_rate))
+
+
+# Encoded clips kept in memory by convert_to_opus_ogg_bytes
+MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_memory: "OrderedDict[str, bytes]" = OrderedDict()
+_memory_bytes = 0
+
+
+def convert_to_opus_ogg_bytes(source, bitrate="32k", sample_rate=24000):
+    """
+    Convert audio to Opus in an Ogg container through ffmpeg's pipes, without temp files.
+    
+    Raw bytes are fed to ffmpeg on stdin; a path is opened by ffmpeg itself, as
+    containers such as m4a cannot be read from a pipe. The encoded audio is
+    read from stdout and kept in a bounded in-memory cache, so sending one
+    clip to many chats encodes it once.
+    
+    Args:
+        source (str or bytes): Path to the input audio file, or its contents
+        bitrate (str, optional): Target bitrate for Opus encoding (default: "32k")
+        sample_rate (int, optional): Sample rate for output (default: 24000)
+    
+    Returns:
+        bytes: The encoded Ogg Opus audio
+        
+    Raises:
+        FileNotFoundError: If the input file doesn't exist
+        RuntimeError: If the ffmpeg conversion fails
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = bytes(source)
+        digest = hashlib.sha256(source).hexdigest()
+    elif os.path.isfile(source):
+        digest = media.file_digest(source)
+    else:
+        raise FileNotFoundError(f"Input file not found: {source}")
+    key = "pipe:" + _cache_key(digest, bitrate, sample_rate)
+
+    started = False
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return _memory[key]
+        future = _in_flight.get(key)
+        if future is None:
+            future = media.executor().submit(_pipe_convert, source, bitrate, sample_rate)
+            _in_flight[key] = future
+            started = True
+    if started:
+        future.add_done_callback(lambda done: _remember(key, done))
+    return future.result()
+
+
+def _pipe_convert(source, bitrate, sample_rate):
+    from_stdin = isinstance(source, bytes)
+    cmd = [
+        "ffmpeg",
+        "-i", "pipe:0" if from_stdin else source,
+        *_opus_args(bitrate, sample_rate),
+        "-f", "ogg",
+        "pipe:1",
+    ]
+    stdin = {"input": source} if from_stdin else {"stdin": subprocess.DEVNULL}
     try:
-        # Convert the audio
-        convert_to_opus_ogg(input_file, temp_file.name, bitrate, sample_rate)
-        return temp_file.name
-    except Exception as e:
-        # Clean up the temporary file if conversion fails
-        if os.path.exists(temp_file.name):
-            os.unlink(temp_file.name)
-        raise e
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, **stdin)
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode("utf-8", errors="replace") if e.stderr else ""
+        raise RuntimeError(f"Failed to convert audio. You likely need to install ffmpeg {stderr}")
+    return process.stdout
+
+
+def _remember(key, future):
+    global _memory_bytes
+    with _lock:
+        _in_flight.pop(key, None)
+        if future.exception() is not None:
+            return
+        data = future.result()
+        if len(data) > MEMORY_CACHE_MAX_BYTES:
+            return
+        _memory[key] = data
+        _memory_bytes += len(data)
+        while _memory_bytes > MEMORY_CACHE_MAX_BYTES:
+            _, evicted = _memory.popitem(last=False)
+            _memory_bytes -= len(evicted)
 
 
 if __name__ == "__main__":
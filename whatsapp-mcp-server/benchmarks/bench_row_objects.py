@@ -0,0 +1,82 @@
+"""Compare row-object memory and build time with and without __slots__.
+
+Builds Message objects for N rows shaped like a messages.db query result,
+once with the slotted Message used by whatsapp.py and once with an otherwise
+identical dataclass that keeps a per-instance __dict__.
+
+Usage: python benchmarks/bench_row_objects.py [rows]
+"""
+import dataclasses
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import whatsapp  # noqa: E402
+
+DictMessage = dataclasses.make_dataclass(
+    "DictMessage", [(field.name, field.type) for field in dataclasses.fields(whatsapp.Message)]
+)
+
+
+def fetch_rows(count):
+    """Rows in the (timestamp, sender, chat_name, content, is_from_me, chat_jid, id, media_type) layout."""
+    conn = sqlite3.connect(":memory:")
+    rows = conn.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        SELECT
+            printf('2024-03-05 10:%02d:%02d.123456789+02:00', (i / 60) % 60, i % 60),
+            printf('407%08d', i % 500),
+            'Coaching',
+            printf('message body number %d', i),
+            i % 2,
+            '120363000000000001@g.us',
+            printf('3EB0%012X', i),
+            NULL
+        FROM n
+    """, (count,)).fetchall()
+    conn.close()
+    return rows
+
+
+def builder(cls):
+    """Same field mapping as whatsapp._message_from_row, for the given class."""
+    def build(row):
+        return cls(
+            timestamp=row[0],
+            sender=row[1],
+            chat_name=row[2],
+            content=row[3],
+            is_from_me=row[4],
+            chat_jid=row[5],
+            id=row[6],
+            media_type=row[7]
+        )
+    return build
+
+
+def measure(label, build, rows):
+    started = time.perf_counter()
+    objects = [build(row) for row in rows]
+    elapsed = time.perf_counter() - started
+    del objects
+
+    tracemalloc.start()
+    objects = [build(row) for row in rows]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed * 1000:8.1f} ms  {peak / 2**20:8.1f} MiB peak  ({len(objects)} objects)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = fetch_rows(count)
+    measure("__dict__", builder(DictMessage), rows)
+    measure("__slots__", builder(whatsapp.Message), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+"""Pooled HTTP client for the Go bridge.
+
+Every helper in whatsapp.py talks to the bridge on localhost. Opening a fresh
+TCP connection per call and waiting without a deadline made a hung bridge
+block the server indefinitely, so all calls go through one keep-alive client
+with per-endpoint timeouts. Idempotent calls are retried with jittered
+backoff, and a circuit breaker fails fast while the bridge is down instead of
+letting every caller wait out its own timeout.
+
+Async tools use arequest(), which applies the same timeouts, retry policy and
+breaker through an httpx.AsyncClient.
+
+Small operations (read receipts, reactions, group settings) can share one
+round trip: batch() sends an explicit list to /api/batch, and coalesced()
+gathers calls that concurrent threads make while another is in flight into one
+batch.
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+import httpx
+
+BASE_URL = "http://localhost:8080/api"
+
+# Seconds to wait for a response; the connect phase is always short on localhost.
+DEFAULT_TIMEOUT = 30.0
+CONNECT_TIMEOUT = 3.0
+ENDPOINT_TIMEOUTS = {
+    "status": 5.0,
+    "reconnect": 15.0,
+    "is_on_whatsapp": 60.0,
+    # Media uploads and downloads move whole files through the bridge
+    "send": 120.0,
+    "download": 120.0,
+    "set_group_photo": 60.0,
+    "batch": 120.0,
+    "send_media": 120.0,
+}
+
+MAX_KEEPALIVE_CONNECTIONS = 8
+MAX_CONNECTIONS = 32
+
+# Retries after the first attempt; the n-th waits up to RETRY_BACKOFF * 2**n seconds.
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.25
+RETRY_STATUS_CODES = frozenset({502, 503, 504})
+
+# Operations per /api/batch request (the bridge accepts up to 500), and how long
+# coalesced() holds a call made during another one, waiting for more to join it.
+BATCH_MAX_OPERATIONS = 100
+BATCH_WINDOW_SECONDS = 0.01
+
+# Consecutive transport failures that open the circuit, and how long it stays open.
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 10.0
+
+
+class BridgeError(Exception):
+    """The bridge could not be reached or returned an unusable response."""
+
+
+class BridgeUnavailable(BridgeError):
+    """The request never reached the bridge, so it is safe to send again later."""
+
+
+class CircuitOpenError(BridgeUnavailable):
+    """Raised without contacting the bridge while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Counts consecutive transport failures and short-circuits calls after too many.
+
+    Once open, calls fail immediately until the cooldown passes; the next call
+    is then let through as a probe and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError if the call may not go through; True if it is the probe."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(
+                    f"Bridge unavailable: circuit open after {self._failures} failures, "
+                    f"retrying in {max(remaining, 0):.0f}s"
+                )
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """Let the next call probe after this one ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._opened_at is None:
+                state = "closed"
+            elif self._probing or time.monotonic() >= self._opened_at + self.cooldown:
+                state = "half_open"
+            else:
+                state = "open"
+            return {"state": state, "consecutive_failures": self._failures}
+
+
+breaker = CircuitBreaker()
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        "base_url": BASE_URL,
+        "timeout": httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            max_connections=MAX_CONNECTIONS,
+        ),
+    }
+
+
+def _build_client(transport: Optional[httpx.BaseTransport] = None) -> httpx.Client:
+    return httpx.Client(transport=transport, **_client_options())
+
+
+def _build_async_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=transport, **_client_options())
+
+
+def get_client() -> httpx.Client:
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the shared async client, creating it on first use.
+
+    The client is tied to the event loop it first runs on; the server runs a
+    single loop, so one instance is shared by every async tool.
+    """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = _build_async_client()
+    return _async_client
+
+
+def close() -> None:
+    """Close the shared sync client, drop the async one and reset the circuit breaker."""
+    global _client, _async_client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        # An AsyncClient can only be closed from its loop; dropping it releases the pool
+        _async_client = None
+    breaker.record_success()
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter keeps concurrent callers from retrying in lockstep
+    return random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+
+
+def _timeout_for(endpoint: str, timeout: Optional[float]) -> httpx.Timeout:
+    if timeout is None:
+        timeout = ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+    return httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout))
+
+
+def _retry_after_error(error: httpx.TransportError, idempotent: bool, attempt: int) -> bool:
+    breaker.record_failure()
+    return (idempotent or isinstance(error, httpx.ConnectError)) and attempt < MAX_RETRIES
+
+
+def _retry_after_response(response: httpx.Response, idempotent: bool, attempt: int) -> bool:
+    breaker.record_success()
+    return response.status_code in RETRY_STATUS_CODES and idempotent and attempt < MAX_RETRIES
+
+
+def _decode(response: httpx.Response) -> Dict[str, Any]:
+    if response.status_code != 200:
+        raise BridgeError(f"HTTP {response.status_code}: {response.text}")
+    try:
+        return response.json()
+    except ValueError as e:
+        raise BridgeError(f"Error parsing response: {response.text}") from e
+
+
+def _transport_error(error: httpx.TransportError) -> BridgeError:
+    # A timeout may fire after the bridge acted, so only refused connections are "unavailable"
+    cls = BridgeUnavailable if isinstance(error, httpx.ConnectError) else BridgeError
+    return cls(f"Request error: {str(error) or type(error).__name__}")
+
+
+def request(
+    endpoint: str,
+    payload: Optional[Dict[str, Any]] = None,
+    method: str = "POST",
+    idempotent: bool = False,
+    timeout: Optional[float] = None,
+    content: Optional[bytes] = None,
+    params: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """Call a bridge endpoint and return its decoded JSON body.
+
+    Connection failures are retried for every call, since the request never
+    reached the bridge. Timeouts and gateway errors are retried only when
+    idempotent is set, as the bridge may already have acted on the request.
+
+    Args:
+        endpoint: Path under /api, e.g. "send" or "get_group_info"
+        payload: JSON body (sent for POST requests)
+        method: HTTP method
+        idempotent: Whether the call is safe to repeat
+        timeout: Seconds to wait for a response; defaults per endpoint
+        content: Raw request body, sent instead of payload
+        params: Query string parameters
+
+    Raises:
+        BridgeUnavailable: If the bridge could not be reached or the circuit is open
+        BridgeError: If the request timed out, the bridge answered with a
+            non-200 status, or returned a body that is not JSON
+    """
+    request_timeout = _timeout_for(endpoint, timeout)
+    if content is not None:
+        body_args: Dict[str, Any] = {"content": content, "headers": {"Content-Type": "application/octet-stream"}}
+    else:
+        body_args = {"json": None if method == "GET" else (payload if payload is not None else {})}
+
+    attempt = 0
+    while True:
+        probe = breaker.before_call()
+        try:
+            response = get_client().request(method, f"/{endpoint}", params=params, timeout=request_timeout, **body_args)
+        except httpx.TransportError as e:
+            if not _retry_after_error(e, idempotent, attempt):
+                raise _transport_error(e) from e
+        except BaseException:
+            if probe:
+                breaker.release_probe()
+            raise
+        else:
+            if not _retry_after_response(response, idempotent, attempt):
+                return _decode(response)
+        time.sleep(_backoff(attempt))
+        attempt += 1
+
+
+async def arequest(
+    endpoint: str,
+    payload: Optional[Dict[str, Any]] = None,
+    method: str = "POST",
+    idempotent: bool = False,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Async counterpart of request(), sharing its retry policy and breaker."""
+    request_timeout = _timeout_for(endpoint, timeout)
+    body = None if method == "GET" else (payload if payload is not None else {})
+
+    attempt = 0
+    while True:
+        probe = breaker.before_call()
+        try:
+            response = await get_async_client().request(method, f"/{endpoint}", json=body, timeout=request_timeout)
+        except httpx.TransportError as e:
+            if not _retry_after_error(e, idempotent, attempt):
+                raise _transport_error(e) from e
+        except BaseException:
+            if probe:
+                breaker.release_probe()
+            raise
+        else:
+            if not _retry_after_response(response, idempotent, attempt):
+                return _decode(response)
+        await anyio.sleep(_backoff(attempt))
+        attempt += 1
+
+
+def post(endpoint: str, payload: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+    """POST payload to endpoint; see request()."""
+    return request(endpoint, payload, method="POST", **kwargs)
+
+
+def upload(endpoint: str, content: bytes, params: Dict[str, str], **kwargs: Any) -> Dict[str, Any]:
+    """POST raw bytes to endpoint with params in the query string; see request()."""
+    return request(endpoint, method="POST", content=content, params=params, **kwargs)
+
+
+def stats() -> Dict[str, Any]:
+    """Circuit breaker state, for diagnostics."""
+    return breaker.state()
+
+
+def _batch_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape one /api/batch result like the response of a direct call."""
+    if item.get("response") is not None:
+        return item["response"]
+    return {"success": False, "message": f"HTTP {item.get('status_code')}: {item.get('message', '')}"}
+
+
+def batch(operations: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Run (endpoint, payload) operations through /api/batch, in order.
+
+    Every operation gets the body its own endpoint would have returned, or a
+    {"success": False, "message": ...} dict if the bridge rejected it. Bridges
+    without /api/batch get the operations one request at a time.
+
+    Raises:
+        BridgeError: If a batch request itself fails
+    """
+    results: List[Dict[str, Any]] = []
+    for start in range(0, len(operations), BATCH_MAX_OPERATIONS):
+        chunk = operations[start:start + BATCH_MAX_OPERATIONS]
+        body = {"operations": [{"op": endpoint, "params": payload} for endpoint, payload in chunk]}
+        try:
+            response = post("batch", body)
+        except BridgeError as e:
+            if not str(e).startswith("HTTP 404"):
+                raise
+            results.extend(_post_each(chunk))
+            continue
+        items = response.get("results", [])
+        missing = {"status_code": 502, "message": "missing from batch response"}
+        results.extend(
+            _batch_item(items[i] if i < len(items) else missing)
+            for i in range(len(chunk))
+        )
+    return results
+
+
+def _post_each(operations: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    results = []
+    for endpoint, payload in operations:
+        try:
+            results.append(post(endpoint, payload))
+        except BridgeError as e:
+            results.append({"success": False, "message": str(e)})
+    return results
+
+
+class Coalescer:
+    """Merges calls from concurrent threads into shared /api/batch requests.
+
+    A call made while no other is in flight is sent at once. Calls arriving
+    meanwhile queue up: the first of them waits `window` seconds for others to
+    join, and a full batch is sent at once. Each caller gets its own result as
+    if it had called post().
+    """
+
+    def __init__(self, window: float = BATCH_WINDOW_SECONDS, max_operations: int = BATCH_MAX_OPERATIONS):
+        self.window = window
+        self.max_operations = max_operations
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, Dict[str, Any], Future]] = []
+        self._timer: Optional[threading.Timer] = None
+        self._in_flight = 0
+
+    def call(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            alone = self._in_flight == 0 and not self._pending
+            if alone:
+                self._in_flight += 1
+        if alone:
+            # Nothing to share a request with yet; calls made meanwhile gather behind this one
+            try:
+                return post(endpoint, payload)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((endpoint, payload, future))
+            if len(self._pending) >= self.max_operations:
+                flush_now = True
+            else:
+                flush_now = False
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if flush_now:
+            self.flush()
+        return future.result()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            if len(pending) == 1:
+                # Nothing to share the request with; skip the batch envelope
+                endpoint, payload, _ = pending[0]
+                results = [post(endpoint, payload)]
+            else:
+                results = batch([(endpoint, payload) for endpoint, payload, _ in pending])
+        except Exception as e:
+            # Every waiting caller must be released, whatever went wrong
+            for _, _, future in pending:
+                future.set_exception(e)
+            return
+        for (_, _, future), result in zip(pending, results):
+            future.set_result(result)
+
+
+coalescer = Coalescer()
+
+
+def coalesced(endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """post() that may share a /api/batch request with concurrent calls.
+
+    Raises:
+        BridgeError: If the bridge cannot be reached or rejects the request
+    """
+    return coalescer.call(endpoint, payload)
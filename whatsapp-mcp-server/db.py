@@ -0,0 +1,174 @@
+"""Pooled SQLite connections for the MCP server.
+
+Opening a connection means opening the file, taking locks and parsing the
+schema, which on large stores costs more than the queries themselves. Instead
+of connecting per call, each thread keeps one long-lived connection per
+database file and reuses it for every read.
+
+Worker threads come and go (anyio's pool, job and media executors), so a
+thread's connections are closed when the thread exits rather than kept open
+for the life of the server.
+"""
+import os
+import sqlite3
+import threading
+import weakref
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+# Wait this long for the bridge to release a write lock before failing a read.
+BUSY_TIMEOUT_MS = 5000
+# Map up to 256 MiB of the database file instead of copying pages through read().
+MMAP_SIZE = 256 * 1024 * 1024
+# Page cache per connection, in KiB (negative values are KiB for cache_size).
+CACHE_SIZE_KIB = 64 * 1024
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+# Bumped by close_all_connections() so other threads drop their closed handles.
+_generation = 0
+
+
+class _ThreadPool:
+    """One thread's connections. Only the thread-local refers to it, so it is
+    collected when the thread exits, and its finalizer closes the connections."""
+
+    __slots__ = ("connections", "generation", "__weakref__")
+
+    def __init__(self, generation: int):
+        self.connections: Dict[Tuple[str, bool], sqlite3.Connection] = {}
+        self.generation = generation
+        weakref.finalize(self, _close_connections, self.connections)
+
+
+# Live pools, for close_all_connections(); weak so exited threads drop out
+_pools: "weakref.WeakSet[_ThreadPool]" = weakref.WeakSet()
+
+
+def _close_connections(connections: Dict[Tuple[str, bool], sqlite3.Connection]) -> None:
+    for conn in list(connections.values()):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    connections.clear()
+
+
+def readonly_uri(path: str) -> str:
+    """Build a read-only URI for path, for connecting or ATTACHing."""
+    return Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def _thread_pool() -> Dict[Tuple[str, bool], sqlite3.Connection]:
+    pool = getattr(_local, "pool", None)
+    if pool is None or pool.generation != _generation:
+        with _registry_lock:
+            pool = _ThreadPool(_generation)
+            _pools.add(pool)
+        _local.pool = pool
+    return pool.connections
+
+
+def get_readonly_connection(
+    path: str,
+    on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+) -> sqlite3.Connection:
+    """Return this thread's read-only connection to path, opening it on first use.
+
+    Args:
+        path: Database file to open
+        on_connect: Optional hook run once when the connection is created
+            (e.g. to register SQL functions)
+
+    Raises:
+        sqlite3.Error: If the database cannot be opened
+    """
+    key = (os.path.abspath(path), True)
+    pool = _thread_pool()
+    conn = pool.get(key)
+    if conn is not None:
+        return conn
+
+    conn = sqlite3.connect(
+        readonly_uri(path),
+        uri=True,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+    )
+    try:
+        _apply_pragmas(conn)
+        conn.execute("PRAGMA query_only = ON")
+        if on_connect is not None:
+            on_connect(conn)
+    except sqlite3.Error:
+        conn.close()
+        raise
+
+    pool[key] = conn
+    return conn
+
+
+def get_connection(
+    path: str,
+    on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+) -> sqlite3.Connection:
+    """Return this thread's read-write connection to path, creating the file if needed.
+
+    Used for the server's own sidecar databases, never for the bridge's stores.
+    The database is switched to WAL so readers are not blocked by index updates.
+
+    Raises:
+        sqlite3.Error: If the database cannot be opened
+    """
+    key = (os.path.abspath(path), False)
+    pool = _thread_pool()
+    conn = pool.get(key)
+    if conn is not None:
+        return conn
+
+    conn = sqlite3.connect(
+        os.path.abspath(path),
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        uri=True,
+    )
+    try:
+        _apply_pragmas(conn)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        if on_connect is not None:
+            on_connect(conn)
+    except sqlite3.Error:
+        conn.close()
+        raise
+
+    pool[key] = conn
+    return conn
+
+
+def discard_connection(path: str, readonly: bool = True) -> None:
+    """Close and forget this thread's connection to path, if any."""
+    conn = _thread_pool().pop((os.path.abspath(path), readonly), None)
+    if conn is not None:
+        conn.close()
+
+
+def close_all_connections() -> None:
+    """Close every pooled connection in every thread.
+
+    Threads lazily reopen connections on their next call.
+    """
+    global _generation
+    with _registry_lock:
+        pools = list(_pools)
+        _pools.clear()
+        _generation += 1
+    for pool in pools:
+        _close_connections(pool.connections)
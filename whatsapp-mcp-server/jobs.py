@@ -0,0 +1,404 @@
+"""Background jobs persisted in the server's state database.
+
+Long-running sends, like a broadcast to hundreds of groups, used to run inline
+and hold the calling tool for minutes. A job records all of its targets when
+it is submitted. A worker thread then sends them at a rate set by a token
+bucket, with a bounded number in flight. Each target's outcome is written as
+soon as it completes, so status queries read progress from the table, and a
+restarted server resumes where it stopped without resending.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+
+STATE_DB_NAME = "mcp_state.db"
+
+# Wait this long before sending again after a handler asks to retry later.
+RETRY_LATER_SECONDS = 15.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    rate REAL NOT NULL,
+    concurrency INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT,
+    updated_at REAL,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items(job_id, status, seq);
+"""
+
+# Job states: queued -> running -> completed, or cancelled (resumable) at any point.
+ACTIVE_STATUSES = ("queued", "running")
+# Item states: pending -> sending -> sent | failed. An item found "sending" after a
+# restart may or may not have been delivered, so it becomes "unknown" rather than
+# being sent again.
+ITEM_STATUSES = ("pending", "sending", "sent", "failed", "unknown")
+
+Handler = Callable[[str, Dict[str, Any]], Tuple[bool, str]]
+
+
+class RetryLater(Exception):
+    """Raised by a handler when the target was not attempted and should be retried."""
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts up to `capacity`.
+
+    A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop: threading.Event) -> bool:
+        """Block until a token is available. Returns False if stop is set first."""
+        if self.rate <= 0:
+            return not stop.is_set()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if stop.wait(wait):
+                return False
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(_SCHEMA)
+
+
+def _iso(epoch: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(epoch).isoformat(timespec="seconds") if epoch else None
+
+
+class _Run:
+    """Bookkeeping for one job's worker thread."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.stop = threading.Event()
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.retry_at = 0.0
+        self.thread: Optional[threading.Thread] = None
+
+
+class JobEngine:
+    """Runs persisted jobs, one worker thread per active job.
+
+    Args:
+        db_path: State database file (created if missing)
+        handlers: Maps a job kind to the function that processes one target;
+            it returns (success, message) or raises RetryLater
+        repeatable: Kinds whose targets are safe to process twice (downloads,
+            not sends); their interrupted items are retried on recovery
+    """
+
+    def __init__(self, db_path: str, handlers: Dict[str, Handler], repeatable: Tuple[str, ...] = ()):
+        self.db_path = db_path
+        self.handlers = handlers
+        self.repeatable = repeatable
+        self._runs: Dict[str, _Run] = {}
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _db(self) -> sqlite3.Connection:
+        # The state database is shared with the outbox, so the schema is not
+        # tied to whichever module happens to open a thread's connection first
+        conn = db.get_connection(self.db_path)
+        if not self._schema_ready:
+            _ensure_schema(conn)
+            self._schema_ready = True
+        return conn
+
+    # ── Public API ──────────────────────────────────────────────────────────
+
+    def submit(self, kind: str, targets: List[str], params: Dict[str, Any], rate: float = 0.0, concurrency: int = 1) -> str:
+        """Persist a job with one item per target, start it and return its id."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        conn = self._db()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, rate, concurrency, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), rate, max(1, concurrency), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, seq, target, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+                [(job_id, seq, target, now) for seq, target in enumerate(targets)],
+            )
+        self._start(job_id)
+        return job_id
+
+    def status(self, job_id: str, include_items: bool = False) -> Optional[Dict[str, Any]]:
+        """Progress for a job, or None if no such job exists."""
+        conn = self._db()
+        row = conn.execute(
+            "SELECT id, kind, status, rate, concurrency, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        counts = dict.fromkeys(ITEM_STATUSES, 0)
+        counts.update(conn.execute(
+            "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        total = sum(counts.values())
+        result = {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "total": total,
+            "done": total - counts["pending"] - counts["sending"],
+            "counts": counts,
+            "rate_per_minute": round(row[3] * 60, 2) if row[3] > 0 else None,
+            "concurrency": row[4],
+            "created_at": _iso(row[5]),
+            "updated_at": _iso(row[6]),
+        }
+        if include_items:
+            result["items"] = [
+                {"target": target, "status": status, "message": message}
+                for target, status, message in conn.execute(
+                    "SELECT target, status, message FROM job_items WHERE job_id = ? ORDER BY seq", (job_id,)
+                )
+            ]
+        else:
+            result["failures"] = [
+                {"target": target, "status": status, "message": message}
+                for target, status, message in conn.execute(
+                    "SELECT target, status, message FROM job_items "
+                    "WHERE job_id = ? AND status IN ('failed', 'unknown') ORDER BY seq LIMIT 20",
+                    (job_id,),
+                )
+            ]
+        return result
+
+    def list_jobs(self, limit: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent jobs first, optionally only those in one status."""
+        sql = "SELECT id FROM jobs"
+        params: List[Any] = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        return [self.status(job_id) for (job_id,) in self._db().execute(sql, params).fetchall()]
+
+    def cancel(self, job_id: str) -> Tuple[bool, str]:
+        """Stop a job after its in-flight sends; pending items stay pending for resume()."""
+        conn = self._db()
+        with conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            ).rowcount
+        with self._lock:
+            run = self._runs.get(job_id)
+        if run is not None:
+            run.stop.set()
+        if not updated:
+            return False, f"Job {job_id} not found or not active"
+        return True, f"Job {job_id} cancelled"
+
+    def resume(self, job_id: str, retry_failed: bool = False) -> Tuple[bool, str]:
+        """Restart a cancelled or finished job's remaining items.
+
+        Args:
+            job_id: Job to resume
+            retry_failed: Also send again to targets that failed (not those
+                in "unknown" state, which may have been delivered)
+        """
+        conn = self._db()
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return False, f"Job {job_id} not found"
+        with self._lock:
+            run = self._runs.get(job_id)
+        if run is not None and not run.stop.is_set():
+            return False, f"Job {job_id} is already running"
+        if run is not None and run.thread is not None:
+            run.thread.join()
+        with conn:
+            if retry_failed:
+                conn.execute(
+                    "UPDATE job_items SET status = 'pending', message = NULL WHERE job_id = ? AND status = 'failed'",
+                    (job_id,),
+                )
+            conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ?", (time.time(), job_id))
+        self._start(job_id)
+        return True, f"Job {job_id} resumed"
+
+    def recover(self) -> List[str]:
+        """Restart jobs that were active when the server last stopped. Returns their ids."""
+        conn = self._db()
+        kinds = dict(conn.execute(
+            "SELECT id, kind FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+        ).fetchall())
+        with self._lock:
+            job_ids = [job_id for job_id in kinds if job_id not in self._runs]
+        with conn:
+            for job_id in job_ids:
+                if kinds[job_id] in self.repeatable:
+                    conn.execute(
+                        "UPDATE job_items SET status = 'pending', message = NULL WHERE job_id = ? AND status = 'sending'",
+                        (job_id,),
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE job_items SET status = 'unknown', message = 'Interrupted while sending; not resent' "
+                    "WHERE job_id = ? AND status = 'sending'",
+                    (job_id,),
+                )
+        for job_id in job_ids:
+            self._start(job_id)
+        return job_ids
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until the job's worker exits. Returns False on timeout."""
+        with self._lock:
+            run = self._runs.get(job_id)
+        if run is None or run.thread is None:
+            return True
+        run.thread.join(timeout)
+        return not run.thread.is_alive()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Stop every worker, leaving their jobs active so recover() picks them up."""
+        with self._lock:
+            runs = list(self._runs.values())
+        for run in runs:
+            run.stop.set()
+        for run in runs:
+            if run.thread is not None:
+                run.thread.join(timeout)
+
+    # ── Worker ──────────────────────────────────────────────────────────────
+
+    def _start(self, job_id: str) -> None:
+        concurrency = self._db().execute("SELECT concurrency FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        run = _Run(concurrency)
+        run.thread = threading.Thread(target=self._run, args=(job_id, run), name=f"job-{job_id}", daemon=True)
+        with self._lock:
+            self._runs[job_id] = run
+        run.thread.start()
+
+    def _next_pending(self, job_id: str) -> Optional[Tuple[int, str]]:
+        return self._db().execute(
+            "SELECT seq, target FROM job_items WHERE job_id = ? AND status = 'pending' ORDER BY seq LIMIT 1",
+            (job_id,),
+        ).fetchone()
+
+    def _set_item(self, job_id: str, seq: int, status: str, message: Optional[str] = None) -> None:
+        now = time.time()
+        conn = self._db()
+        with conn:
+            conn.execute(
+                "UPDATE job_items SET status = ?, message = ?, updated_at = ? WHERE job_id = ? AND seq = ?",
+                (status, message, now, job_id, seq),
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def _set_job_status(self, job_id: str, status: str, only_if: Tuple[str, ...]) -> None:
+        conn = self._db()
+        placeholders = ",".join("?" * len(only_if))
+        with conn:
+            conn.execute(
+                f"UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN ({placeholders})",
+                (status, time.time(), job_id, *only_if),
+            )
+
+    def _process(self, handler: Handler, job_id: str, seq: int, target: str, params: Dict[str, Any], run: _Run) -> None:
+        try:
+            success, message = handler(target, params)
+            self._set_item(job_id, seq, "sent" if success else "failed", message)
+        except RetryLater as e:
+            self._set_item(job_id, seq, "pending", str(e))
+            with run.cond:
+                run.retry_at = time.monotonic() + RETRY_LATER_SECONDS
+        except Exception as e:
+            self._set_item(job_id, seq, "failed", f"Unexpected error: {e}")
+        finally:
+            with run.cond:
+                run.in_flight -= 1
+                run.cond.notify_all()
+
+    def _run(self, job_id: str, run: _Run) -> None:
+        try:
+            kind, params_json, rate = self._db().execute(
+                "SELECT kind, params, rate FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            handler = self.handlers[kind]
+            params = json.loads(params_json)
+            bucket = TokenBucket(rate)
+            self._set_job_status(job_id, "running", ("queued",))
+
+            with ThreadPoolExecutor(max_workers=run.concurrency, thread_name_prefix=f"job-{job_id}") as pool:
+                while not run.stop.is_set():
+                    with run.cond:
+                        while run.in_flight >= run.concurrency and not run.stop.is_set():
+                            run.cond.wait(0.5)
+                        delay = run.retry_at - time.monotonic()
+                    if run.stop.is_set():
+                        break
+                    if delay > 0:
+                        run.stop.wait(delay)
+                        continue
+
+                    item = self._next_pending(job_id)
+                    if item is None:
+                        with run.cond:
+                            if run.in_flight:
+                                run.cond.wait(0.5)
+                                continue
+                        # Nothing in flight can put an item back now, so re-checking is final
+                        if self._next_pending(job_id) is None:
+                            break
+                        continue
+
+                    if not bucket.acquire(run.stop):
+                        break
+                    seq, target = item
+                    self._set_item(job_id, seq, "sending")
+                    with run.cond:
+                        run.in_flight += 1
+                    pool.submit(self._process, handler, job_id, seq, target, params, run)
+
+            if not run.stop.is_set():
+                self._set_job_status(job_id, "completed", ACTIVE_STATUSES)
+        except sqlite3.Error as e:
+            print(f"Job {job_id} stopped on database error: {e}")
+        finally:
+            with self._lock:
+                if self._runs.get(job_id) is run:
+                    del self._runs[job_id]
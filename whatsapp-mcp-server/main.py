@@ -1,23 +1,33 @@
 import argparse
+import threading
+from functools import partial, wraps
 from typing import List, Dict, Any, Optional
+import anyio
+import anyio.to_thread
 from mcp.server.fastmcp import FastMCP
 import whatsapp
 from whatsapp import (
-    connection_status as whatsapp_connection_status,
-    reconnect as whatsapp_reconnect,
+    aconnection_status as whatsapp_aconnection_status,
+    metadata_cache_stats as whatsapp_metadata_cache_stats,
+    areconnect as whatsapp_areconnect,
     search_contacts as whatsapp_search_contacts,
     list_messages as whatsapp_list_messages,
     list_chats as whatsapp_list_chats,
+    list_chats_page as whatsapp_list_chats_page,
     get_chat as whatsapp_get_chat,
     get_direct_chat_by_contact as whatsapp_get_direct_chat_by_contact,
     get_contact_chats as whatsapp_get_contact_chats,
+    get_contact_chats_page as whatsapp_get_contact_chats_page,
     get_contact_groups as whatsapp_get_contact_groups,
     get_last_interaction as whatsapp_get_last_interaction,
+    get_inbox as whatsapp_get_inbox,
+    get_inbox_page as whatsapp_get_inbox_page,
     get_message_context as whatsapp_get_message_context,
     send_message as whatsapp_send_message,
     send_file as whatsapp_send_file,
     send_audio_message as whatsapp_audio_voice_message,
     download_media as whatsapp_download_media,
+    download_chat_media as whatsapp_download_chat_media,
     create_group as whatsapp_create_group,
     join_group_with_link as whatsapp_join_group_with_link,
     leave_group as whatsapp_leave_group,
@@ -48,19 +58,74 @@ from whatsapp import (
     get_sub_groups as whatsapp_get_sub_groups,
     get_group_activity_report as whatsapp_get_group_activity_report,
     get_member_engagement as whatsapp_get_member_engagement,
+    get_group_activity_batch as whatsapp_get_group_activity_batch,
+    get_member_engagement_batch as whatsapp_get_member_engagement_batch,
     cross_group_search as whatsapp_cross_group_search,
     get_participant_journey as whatsapp_get_participant_journey,
     broadcast_to_groups as whatsapp_broadcast_to_groups,
+    get_job_status as whatsapp_get_job_status,
+    get_delivery_status as whatsapp_get_delivery_status,
+    list_outbox as whatsapp_list_outbox,
+    retry_outbox as whatsapp_retry_outbox,
+    run_batch as whatsapp_run_batch,
+    list_jobs as whatsapp_list_jobs,
+    cancel_job as whatsapp_cancel_job,
+    resume_job as whatsapp_resume_job,
     get_group_overlap as whatsapp_get_group_overlap,
 )
 
 mcp = FastMCP("whatsapp")
 
+# Worker threads shared by all tools for blocking work: SQLite scans, ffmpeg and
+# bridge helpers that mix HTTP with local reads. Bounded so a burst of parallel
+# calls cannot exhaust file handles or the bridge connection pool.
+TOOL_WORKER_THREADS = 8
+_tool_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _worker_limiter() -> anyio.CapacityLimiter:
+    global _tool_limiter
+    if _tool_limiter is None:
+        _tool_limiter = anyio.CapacityLimiter(TOOL_WORKER_THREADS)
+    return _tool_limiter
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    """Run fn on the worker pool so the event loop keeps serving other calls."""
+    return await anyio.to_thread.run_sync(partial(fn, *args, **kwargs), limiter=_worker_limiter())
+
+
+def _offloaded(fn):
+    """Turn a blocking tool into an async one that runs on the worker pool."""
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await _run_blocking(fn, *args, **kwargs)
+    return wrapper
+
+
+def _chats_out(result: Any) -> Any:
+    """Parse chat times in a tool result: a Chat, a list of them, or {"chats", "next_cursor"}."""
+    if isinstance(result, whatsapp.Chat):
+        return whatsapp.chat_with_datetimes(result)
+    if isinstance(result, list):
+        return [_chats_out(item) for item in result]
+    if isinstance(result, dict) and "chats" in result:
+        return {**result, "chats": _chats_out(result["chats"])}
+    return result
+
 
 # ── Hidden tool implementations (NOT exposed via MCP, called through execute_tool) ───
 
 
-def _download_media(message_id: str, chat_jid: str) -> Dict[str, Any]:
+def _download_media(
+    chat_jid: str,
+    message_id: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    media_types: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    if not message_id:
+        return whatsapp_download_chat_media(chat_jid, after=after, before=before, media_types=media_types)
     file_path = whatsapp_download_media(message_id, chat_jid)
     if file_path:
         return {"success": True, "message": "Media downloaded successfully", "url": f"file://{file_path}"}
@@ -74,19 +139,25 @@ def _get_chat_info(
     include_last_message: bool = True,
     limit: int = 20,
     page: int = 0,
+    cursor: Optional[str] = None,
+    include_groups: bool = False,
+    paginate: bool = False,
 ) -> Any:
     if action == "get_chat":
         if not jid:
             return {"success": False, "message": "jid required for 'get_chat'"}
-        return whatsapp_get_chat(jid, include_last_message)
+        return _chats_out(whatsapp_get_chat(jid, include_last_message))
     if action == "get_direct_chat":
         if not phone_number:
             return {"success": False, "message": "phone_number required for 'get_direct_chat'"}
-        return whatsapp_get_direct_chat_by_contact(phone_number)
+        return _chats_out(whatsapp_get_direct_chat_by_contact(phone_number))
     if action == "get_contact_chats":
         if not jid:
             return {"success": False, "message": "jid required for 'get_contact_chats'"}
-        return whatsapp_get_contact_chats(jid, limit, page)
+        if paginate or cursor is not None:
+            chats, next_cursor = whatsapp_get_contact_chats_page(jid, limit, page, cursor or None)
+            return {"chats": _chats_out(chats), "next_cursor": next_cursor}
+        return _chats_out(whatsapp_get_contact_chats(jid, limit, page))
     if action == "get_contact_groups":
         if not jid:
             return {"success": False, "message": "jid required for 'get_contact_groups'"}
@@ -95,7 +166,12 @@ def _get_chat_info(
         if not jid:
             return {"success": False, "message": "jid required for 'get_last_interaction'"}
         return whatsapp_get_last_interaction(jid)
-    return {"success": False, "message": f"Unknown action '{action}'. Valid: get_chat, get_direct_chat, get_contact_chats, get_contact_groups, get_last_interaction"}
+    if action == "inbox":
+        if paginate or cursor is not None:
+            chats, next_cursor = whatsapp_get_inbox_page(limit, page, include_groups, cursor or None)
+            return {"chats": _chats_out(chats), "next_cursor": next_cursor}
+        return _chats_out(whatsapp_get_inbox(limit, page, include_groups))
+    return {"success": False, "message": f"Unknown action '{action}'. Valid: get_chat, get_direct_chat, get_contact_chats, get_contact_groups, get_last_interaction, inbox"}
 
 
 def _message_action(
@@ -246,15 +322,23 @@ def _analytics(
     days: int = 30,
     include_empty: bool = False,
     include_members: bool = False,
+    include_timeseries: bool = False,
+    chat_jid_pattern: Optional[str] = None,
+    community_jid: Optional[str] = None,
+    include_matrix: bool = True,
 ) -> Any:
     if action == "group_activity":
         if not chat_jid:
             return {"success": False, "message": "chat_jid required for 'group_activity'"}
-        return whatsapp_get_group_activity_report(chat_jid, days)
+        return whatsapp_get_group_activity_report(chat_jid, days, include_timeseries)
     if action == "member_engagement":
         if not chat_jid:
             return {"success": False, "message": "chat_jid required for 'member_engagement'"}
         return whatsapp_get_member_engagement(chat_jid, days)
+    if action == "group_activity_batch":
+        return whatsapp_get_group_activity_batch(group_jids, chat_jid_pattern, community_jid, days, include_timeseries)
+    if action == "member_engagement_batch":
+        return whatsapp_get_member_engagement_batch(group_jids, chat_jid_pattern, community_jid, days, include_members)
     if action == "participant_journey":
         if not jid:
             return {"success": False, "message": "jid required for 'participant_journey'"}
@@ -262,8 +346,8 @@ def _analytics(
     if action == "group_overlap":
         if not group_jids:
             return {"success": False, "message": "group_jids required for 'group_overlap'"}
-        return whatsapp_get_group_overlap(group_jids, include_members)
-    return {"success": False, "message": f"Unknown action '{action}'. Valid: group_activity, member_engagement, participant_journey, group_overlap"}
+        return whatsapp_get_group_overlap(group_jids, include_members, include_matrix)
+    return {"success": False, "message": f"Unknown action '{action}'. Valid: group_activity, member_engagement, group_activity_batch, member_engagement_batch, participant_journey, group_overlap"}
 
 
 def _manage_profile(
@@ -271,6 +355,7 @@ def _manage_profile(
     presence: Optional[str] = None,
     message: Optional[str] = None,
     phones: Optional[List[str]] = None,
+    max_age_seconds: Optional[int] = None,
 ) -> Dict[str, Any]:
     if action == "set_presence":
         if not presence:
@@ -292,7 +377,7 @@ def _manage_profile(
     if action == "check_registration":
         if not phones:
             return {"success": False, "message": "phones required for 'check_registration'"}
-        return whatsapp_is_on_whatsapp(phones)
+        return whatsapp_is_on_whatsapp(phones, max_age=max_age_seconds)
     return {"success": False, "message": f"Unknown action '{action}'. Valid: set_presence, set_about, post_status, check_registration"}
 
 
@@ -304,6 +389,7 @@ def _manage_channel(
     message: Optional[str] = None,
     parent_jid: Optional[str] = None,
     child_jid: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
 ) -> Any:
     if action == "create_newsletter":
         if not name:
@@ -314,7 +400,7 @@ def _manage_channel(
     if action == "send_newsletter":
         if not jid or not message:
             return {"success": False, "message": "jid and message required for 'send_newsletter'"}
-        success, msg = whatsapp_newsletter_send(jid, message)
+        success, msg = whatsapp_newsletter_send(jid, message, idempotency_key)
         return {"success": success, "message": msg}
     if action == "link_group":
         if not parent_jid or not child_jid:
@@ -333,31 +419,84 @@ def _manage_channel(
     return {"success": False, "message": f"Unknown action '{action}'. Valid: create_newsletter, list_newsletters, send_newsletter, link_group, unlink_group, get_sub_groups"}
 
 
+def _manage_jobs(
+    action: str = "list",
+    job_id: Optional[str] = None,
+    include_items: bool = False,
+    retry_failed: bool = False,
+    status: Optional[str] = None,
+    limit: int = 20,
+) -> Any:
+    if action == "list":
+        return whatsapp_list_jobs(limit=limit, status=status)
+    if not job_id:
+        return {"success": False, "message": f"job_id required for '{action}'"}
+    if action == "status":
+        return whatsapp_get_job_status(job_id, include_items=include_items)
+    if action == "cancel":
+        success, msg = whatsapp_cancel_job(job_id)
+        return {"success": success, "message": msg}
+    if action == "resume":
+        success, msg = whatsapp_resume_job(job_id, retry_failed=retry_failed)
+        return {"success": success, "message": msg}
+    return {"success": False, "message": f"Unknown action '{action}'. Valid: list, status, cancel, resume"}
+
+
+def _outbox(
+    action: str = "list",
+    outbox_id: Optional[int] = None,
+    idempotency_key: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 20,
+) -> Any:
+    if action == "list":
+        return whatsapp_list_outbox(status=status, limit=limit)
+    if action == "status":
+        if outbox_id is None and not idempotency_key:
+            return {"success": False, "message": "outbox_id or idempotency_key required for 'status'"}
+        return whatsapp_get_delivery_status(outbox_id=outbox_id, idempotency_key=idempotency_key)
+    if action == "retry":
+        if outbox_id is None:
+            return {"success": False, "message": "outbox_id required for 'retry'"}
+        success, msg = whatsapp_retry_outbox(outbox_id)
+        return {"success": success, "message": msg}
+    return {"success": False, "message": f"Unknown action '{action}'. Valid: list, status, retry"}
+
+
+def _batch(operations: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    return whatsapp_run_batch(operations or [])
+
+
 # ── Tool registry (indexed for search, not exposed to LLM) ──────────────────
 
 TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {
     "download_media": {
         "fn": _download_media,
-        "summary": "Download media (image/video/doc) from a message to local file",
-        "tags": ["media", "download", "file", "image", "video", "document", "photo", "attachment"],
+        "summary": "Download media (image/video/doc) from a message, or all media in a chat, to local files",
+        "tags": ["media", "download", "file", "image", "video", "document", "photo", "attachment", "bulk", "archive"],
         "description": (
-            "Download media from a WhatsApp message and get the local file path.\n\n"
+            "Download media from a WhatsApp message and get the local file path.\n"
+            "Without message_id, queues a background job downloading all media in the chat\n"
+            "(files already downloaded are skipped); track it with execute_tool(\"manage_jobs\").\n\n"
             "Params:\n"
-            "  message_id (required): The message ID containing the media\n"
-            "  chat_jid (required): The chat JID containing the message"
+            "  chat_jid (required): The chat JID containing the message\n"
+            "  message_id: The message ID containing the media\n"
+            "  after / before: Bulk only. ISO-8601 date bounds\n"
+            "  media_types: Bulk only. Subset of image, video, audio, document, sticker"
         ),
     },
     "get_chat_info": {
         "fn": _get_chat_info,
-        "summary": "Look up chat or contact info by JID or phone number",
-        "tags": ["chat", "contact", "lookup", "info", "groups", "interaction", "phone"],
+        "summary": "Look up chat or contact info by JID or phone number, or list chats awaiting a reply",
+        "tags": ["chat", "contact", "lookup", "info", "groups", "interaction", "phone", "inbox", "unanswered", "reply"],
         "description": (
             "Look up chat/contact info. Pick ONE action:\n\n"
             '- "get_chat": Get chat metadata by JID. Requires: jid\n'
             '- "get_direct_chat": Get chat by phone number. Requires: phone_number\n'
-            '- "get_contact_chats": All chats involving a contact. Requires: jid (optional: limit, page)\n'
+            '- "get_contact_chats": All chats involving a contact. Requires: jid (optional: limit, page, paginate — true returns {chats, next_cursor}, then pass next_cursor as cursor for the following page)\n'
             '- "get_contact_groups": Groups shared with a contact (live data). Requires: jid\n'
-            '- "get_last_interaction": Most recent message with a contact. Requires: jid'
+            '- "get_last_interaction": Most recent message with a contact. Requires: jid\n'
+            '- "inbox": Chats whose last message is from the other side (awaiting my reply), newest first, with unanswered_count. Optional: limit, page, include_groups (default false), paginate (true returns {chats, next_cursor}, then pass next_cursor as cursor for the following page)'
         ),
     },
     "message_action": {
@@ -400,19 +539,21 @@ TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {
         "description": (
             "Search or get context around WhatsApp messages. Pick ONE action:\n\n"
             '- "context": Get messages around a specific message. Requires: message_id (optional: before=5, after=5)\n'
-            '- "cross_group": Search messages across all groups. Requires: query (optional: chat_jid_pattern, limit, max_content_length)'
+            '- "cross_group": Search messages across all groups, best matches first. Requires: query (optional: chat_jid_pattern, limit, max_content_length)'
         ),
     },
     "analytics": {
         "fn": _analytics,
-        "summary": "Group activity reports, member engagement, participant journey, group overlap",
-        "tags": ["analytics", "activity", "engagement", "stats", "report", "overlap", "journey", "members"],
+        "summary": "Group activity reports, member engagement (single or batch/community), participant journey, group overlap",
+        "tags": ["analytics", "activity", "engagement", "stats", "report", "overlap", "journey", "members", "batch", "community"],
         "description": (
             "WhatsApp analytics and engagement data. Pick ONE action:\n\n"
-            '- "group_activity": Activity report for a group. Requires: chat_jid (optional: days=30)\n'
+            '- "group_activity": Activity report for a group. Requires: chat_jid (optional: days=30, include_timeseries — adds daily_counts and an hour_of_week_heatmap)\n'
             '- "member_engagement": Per-member engagement stats. Requires: chat_jid (optional: days=30)\n'
+            '- "group_activity_batch": Activity reports for many chats in one pass, plus totals. Requires ONE OR MORE of: group_jids (list), chat_jid_pattern (SQL LIKE, e.g. "%@g.us"), community_jid (uses its sub-groups) (optional: days=30, include_timeseries)\n'
+            '- "member_engagement_batch": Engagement tiers per chat plus community-wide member ranking. Same selection as group_activity_batch (optional: days=30, include_members for per-chat member lists)\n'
             '- "participant_journey": All groups and activity for a contact. Requires: jid (optional: include_empty)\n'
-            '- "group_overlap": Compare members across groups. Requires: group_jids (list, 2+) (optional: include_members)'
+            '- "group_overlap": Compare members across groups: common/unique counts plus pairwise overlap and Jaccard matrices. Requires: group_jids (list, 2+) (optional: include_members, include_matrix=true)'
         ),
     },
     "manage_profile": {
@@ -424,7 +565,8 @@ TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {
             '- "set_presence": Set online/offline. Requires: presence ("available" or "unavailable")\n'
             '- "set_about": Change About text. Requires: message (max 139 chars)\n'
             '- "post_status": Post to Status/stories (24h). Requires: message\n'
-            '- "check_registration": Check if phones are on WhatsApp. Requires: phones (list, e.g. ["+40730883388"])'
+            '- "check_registration": Check if phones are on WhatsApp. Requires: phones (list, e.g. ["+40730883388"]). '
+            "Results are cached for days; optional: max_age_seconds (0 forces a fresh check). Reports cache_hits and elapsed_ms"
         ),
     },
     "manage_channel": {
@@ -435,12 +577,50 @@ TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {
             "Manage WhatsApp channels/newsletters and community groups. Pick ONE action:\n\n"
             '- "create_newsletter": Create a channel. Requires: name (optional: description)\n'
             '- "list_newsletters": List subscribed channels. No params needed.\n'
-            '- "send_newsletter": Send to a channel. Requires: jid, message\n'
+            '- "send_newsletter": Send to a channel. Requires: jid, message (optional: idempotency_key)\n'
             '- "link_group": Link group to community. Requires: parent_jid, child_jid\n'
             '- "unlink_group": Unlink group from community. Requires: parent_jid, child_jid\n'
             '- "get_sub_groups": Get community sub-groups. Requires: jid'
         ),
     },
+    "manage_jobs": {
+        "fn": _manage_jobs,
+        "summary": "Progress, cancel and resume for background jobs such as broadcasts and bulk downloads",
+        "tags": ["jobs", "job", "broadcast", "progress", "status", "cancel", "resume", "background"],
+        "description": (
+            "Track background jobs (broadcasts started by send_message, bulk downloads by download_media). Pick ONE action:\n\n"
+            '- "list": Recent jobs with progress. Optional: status (queued/running/completed/cancelled), limit=20\n'
+            '- "status": Progress counts and failures for one job. Requires: job_id (optional: include_items for every recipient)\n'
+            '- "cancel": Stop a job after in-flight sends. Requires: job_id\n'
+            '- "resume": Continue a cancelled job. Requires: job_id (optional: retry_failed to resend failed recipients)'
+        ),
+    },
+    "outbox": {
+        "fn": _outbox,
+        "summary": "Delivery state of sent messages, queued retries, and re-queueing failed sends",
+        "tags": ["outbox", "delivery", "delivered", "queued", "retry", "sent", "pending", "idempotency"],
+        "description": (
+            "Every send goes through a durable outbox that retries while the bridge is down. Pick ONE action:\n\n"
+            '- "list": Recent sends with status (queued/sending/sent/failed/unknown). Optional: status, limit=20\n'
+            '- "status": Delivery state of one send. Requires: outbox_id or idempotency_key\n'
+            '- "retry": Queue a failed send again. Requires: outbox_id'
+        ),
+    },
+    "batch": {
+        "fn": _batch,
+        "summary": "Run many read receipts, reactions, lookups or group setting changes in one bridge request",
+        "tags": ["batch", "bulk", "many", "mark_read", "read", "react", "group", "settings", "participants"],
+        "description": (
+            "Run up to hundreds of small operations in one call instead of one tool call each.\n\n"
+            "Params:\n"
+            '  operations (required): list of {"op": ..., "params": {...}}, params being what the op takes on its own\n'
+            "  ops: mark_read, send_reaction, edit_message, delete_message, send_presence, is_on_whatsapp,\n"
+            "       get_group_info, get_contact_groups, get_group_invite_link, get_sub_groups, set_group_name,\n"
+            "       set_group_topic, set_group_announce, set_group_locked, set_group_join_approval, update_group_participants\n\n"
+            'Example, mark two chats read: [{"op": "mark_read", "params": {"chat_jid": "...", "sender_jid": "...", "message_ids": ["..."]}}, ...]\n'
+            "Returns one result per operation, in order, plus succeeded/failed counts."
+        ),
+    },
 }
 
 
@@ -483,18 +663,21 @@ def _search_registry(query: str, limit: int = 5) -> List[Dict[str, Any]]:
 
 
 @mcp.tool()
-def connection(action: str = "status") -> Dict[str, Any]:
+async def connection(action: str = "status") -> Dict[str, Any]:
     """Check WhatsApp connection status or reconnect.
 
     Args:
-        action: "status" (default) to check, or "reconnect" to reconnect a dropped session
+        action: "status" (default) to check, "reconnect" to reconnect a dropped session, or "cache_stats" for metadata cache hit/miss counters
     """
     if action == "reconnect":
-        return whatsapp_reconnect()
-    return whatsapp_connection_status()
+        return await whatsapp_areconnect()
+    if action == "cache_stats":
+        return whatsapp_metadata_cache_stats()
+    return await whatsapp_aconnection_status()
 
 
 @mcp.tool()
+@_offloaded
 def search_contacts(query: str) -> List[Dict[str, Any]]:
     """Search WhatsApp contacts by name or phone number.
 
@@ -505,6 +688,7 @@ def search_contacts(query: str) -> List[Dict[str, Any]]:
 
 
 @mcp.tool()
+@_offloaded
 def list_messages(
     after: Optional[str] = None,
     before: Optional[str] = None,
@@ -515,7 +699,9 @@ def list_messages(
     page: int = 0,
     include_context: bool = True,
     context_before: int = 1,
-    context_after: int = 1
+    context_after: int = 1,
+    cursor: Optional[str] = None,
+    max_chars: int = whatsapp.MAX_RESPONSE_CHARS
 ) -> List[Dict[str, Any]]:
     """Get WhatsApp messages matching specified criteria with optional context.
 
@@ -530,23 +716,28 @@ def list_messages(
         include_context: Whether to include messages before and after matches (default True)
         context_before: Number of messages to include before each match (default 1)
         context_after: Number of messages to include after each match (default 1)
+        cursor: Token from the "Next cursor:" line of a previous call; returns the next page (faster and more stable than page)
+        max_chars: Response size budget in characters (defaults to the server-wide response limit); output stops before it and the cursor continues from there
     """
     return whatsapp_list_messages(
         after=after, before=before, sender_phone_number=sender_phone_number,
         chat_jid=chat_jid, query=query, limit=limit, page=page,
         include_context=include_context, context_before=context_before,
-        context_after=context_after,
+        context_after=context_after, cursor=cursor, max_chars=max_chars,
     )
 
 
 @mcp.tool()
+@_offloaded
 def list_chats(
     query: Optional[str] = None,
     limit: int = 20,
     page: int = 0,
     include_last_message: bool = True,
-    sort_by: str = "last_active"
-) -> List[Dict[str, Any]]:
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None,
+    paginate: bool = False
+) -> Any:
     """Get WhatsApp chats matching specified criteria.
 
     Args:
@@ -555,15 +746,23 @@ def list_chats(
         page: Page number for pagination (default 0)
         include_last_message: Whether to include the last message in each chat (default True)
         sort_by: Field to sort results by, either "last_active" or "name" (default "last_active")
+        cursor: next_cursor from a previous paginated call; returns the following page
+        paginate: Return {"chats", "next_cursor"} instead of a list; next_cursor is set while more chats follow (default False)
     """
-    return whatsapp_list_chats(
+    if paginate or cursor is not None:
+        chats, next_cursor = whatsapp_list_chats_page(
+            query=query, limit=limit, page=page,
+            include_last_message=include_last_message, sort_by=sort_by, cursor=cursor or None,
+        )
+        return {"chats": _chats_out(chats), "next_cursor": next_cursor}
+    return _chats_out(whatsapp_list_chats(
         query=query, limit=limit, page=page,
         include_last_message=include_last_message, sort_by=sort_by,
-    )
+    ))
 
 
 @mcp.tool()
-def send_message(
+async def send_message(
     action: str = "text",
     recipient: Optional[str] = None,
     message: Optional[str] = None,
@@ -574,6 +773,7 @@ def send_message(
     quoted_content: str = "",
     group_jids: Optional[List[str]] = None,
     delay_seconds: int = 3,
+    idempotency_key: Optional[str] = None,
 ) -> Any:
     """Send a WhatsApp message. Pick ONE action:
 
@@ -581,34 +781,36 @@ def send_message(
     - "file": Send a file (image/video/doc). Requires: recipient, media_path
     - "audio": Send an audio voice message. Requires: recipient, media_path
     - "reply": Reply to a specific message. Requires: chat_jid, quoted_message_id, quoted_sender_jid, message
-    - "broadcast": Send same message to multiple groups. Requires: group_jids, message (optional: delay_seconds)
+    - "broadcast": Send same message or file to multiple chats in the background. Requires: group_jids, and message and/or media_path (message becomes the file's caption; optional: delay_seconds between sends). A file is uploaded once for all recipients. Returns a job_id; track it with execute_tool("manage_jobs")
 
     recipient: phone number (no + or symbols) or JID (e.g. "123@s.whatsapp.net" or group JID)
+    idempotency_key: optional unique string for text/file/audio/reply; repeating a send with the same key never sends twice.
+    Sends go through a durable outbox: if one is reported as queued, it is retried automatically — check it with execute_tool("outbox") instead of sending again.
     """
     if action == "text":
         if not recipient or not message:
             return {"success": False, "message": "recipient and message required for 'text'"}
-        success, msg = whatsapp_send_message(recipient, message)
+        success, msg = await _run_blocking(whatsapp_send_message, recipient, message, idempotency_key)
         return {"success": success, "message": msg}
     if action == "file":
         if not recipient or not media_path:
             return {"success": False, "message": "recipient and media_path required for 'file'"}
-        success, msg = whatsapp_send_file(recipient, media_path)
+        success, msg = await _run_blocking(whatsapp_send_file, recipient, media_path, idempotency_key)
         return {"success": success, "message": msg}
     if action == "audio":
         if not recipient or not media_path:
             return {"success": False, "message": "recipient and media_path required for 'audio'"}
-        success, msg = whatsapp_audio_voice_message(recipient, media_path)
+        success, msg = await _run_blocking(whatsapp_audio_voice_message, recipient, media_path, idempotency_key)
         return {"success": success, "message": msg}
     if action == "reply":
         if not chat_jid or not quoted_message_id or not quoted_sender_jid or not message:
             return {"success": False, "message": "chat_jid, quoted_message_id, quoted_sender_jid, and message required for 'reply'"}
-        success, msg = whatsapp_send_reply(chat_jid, quoted_message_id, quoted_sender_jid, message, quoted_content)
+        success, msg = await _run_blocking(whatsapp_send_reply, chat_jid, quoted_message_id, quoted_sender_jid, message, quoted_content, idempotency_key)
         return {"success": success, "message": msg}
     if action == "broadcast":
-        if not group_jids or not message:
-            return {"success": False, "message": "group_jids and message required for 'broadcast'"}
-        return whatsapp_broadcast_to_groups(group_jids, message, delay_seconds)
+        if not group_jids or not (message or media_path):
+            return {"success": False, "message": "group_jids and message or media_path required for 'broadcast'"}
+        return await _run_blocking(whatsapp_broadcast_to_groups, group_jids, message or "", delay_seconds, media_path)
     return {"success": False, "message": f"Unknown action '{action}'. Valid: text, file, audio, reply, broadcast"}
 
 
@@ -619,7 +821,7 @@ def send_message(
 def search_tools(query: str) -> List[Dict[str, Any]]:
     """Find additional WhatsApp tools not listed above. Returns tool name + full usage docs so you can call execute_tool immediately.
 
-    Hidden tools cover: media download, chat/contact lookup, message actions (react/edit/delete/read receipts/polls), group management (create/join/leave/settings/participants), cross-group message search, analytics & engagement reports, profile/presence, channels/newsletters & communities.
+    Hidden tools cover: media download, chat/contact lookup, message actions (react/edit/delete/read receipts/polls), group management (create/join/leave/settings/participants), cross-group message search, analytics & engagement reports, profile/presence, channels/newsletters & communities, background job progress (broadcasts), outbox delivery state, batched bulk operations.
 
     Workflow: search_tools("your need") → read description → execute_tool(tool_name, params={...})
 
@@ -628,12 +830,12 @@ def search_tools(query: str) -> List[Dict[str, Any]]:
     """
     results = _search_registry(query)
     if not results:
-        return [{"message": f"No tools found for '{query}'. Try broader terms. Categories: media, chat, message, group, search, analytics, profile, channel"}]
+        return [{"message": f"No tools found for '{query}'. Try broader terms. Categories: media, chat, message, group, search, analytics, profile, channel, jobs, batch"}]
     return results
 
 
 @mcp.tool()
-def execute_tool(tool_name: str, params: Optional[Dict[str, Any]] = None) -> Any:
+async def execute_tool(tool_name: str, params: Optional[Dict[str, Any]] = None) -> Any:
     """Run a WhatsApp tool found via search_tools. Pass the tool name and its parameters.
 
     Args:
@@ -644,7 +846,7 @@ def execute_tool(tool_name: str, params: Optional[Dict[str, Any]] = None) -> Any
         available = ", ".join(TOOL_REGISTRY.keys())
         return {"success": False, "message": f"Unknown tool '{tool_name}'. Available: {available}"}
     try:
-        return TOOL_REGISTRY[tool_name]["fn"](**(params or {}))
+        return await _run_blocking(TOOL_REGISTRY[tool_name]["fn"], **(params or {}))
     except TypeError as e:
         return {"success": False, "message": f"Invalid parameters for '{tool_name}': {e}. Use search_tools('{tool_name}') to see required parameters."}
 
@@ -660,4 +862,9 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     whatsapp.initialize_attachments_path(args.attachments_path)
+    # Build/refresh the search index in the background so the first query doesn't pay for it
+    threading.Thread(target=whatsapp.sync_message_index, daemon=True).start()
+    # Pick up broadcasts interrupted by the last shutdown; sent recipients are not resent
+    whatsapp.resume_interrupted_jobs()
+    whatsapp.start_outbox()
     mcp.run(transport='stdio')
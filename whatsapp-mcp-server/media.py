@@ -0,0 +1,309 @@
+"""Media preprocessing for outgoing files.
+
+The bridge uploads files exactly as given, so a 12 MB phone photo or a .mov
+screen recording goes to WhatsApp untouched: slow to upload and sometimes
+rejected. prepare() turns a file into what WhatsApp expects before it is sent:
+
+- images larger than IMAGE_MAX_DIMENSION or IMAGE_MAX_BYTES are scaled down
+  and re-encoded as JPEG (PNGs with transparency stay PNG)
+- videos that are not H.264/AAC in MP4, are taller than VIDEO_MAX_HEIGHT or
+  larger than VIDEO_MAX_BYTES are transcoded to a faststart MP4
+- images and videos get a small JPEG thumbnail for the chat preview
+
+Everything runs through ffmpeg and ffprobe, like the voice note conversion in
+audio.py, on a shared pool of WORKERS threads. Outputs are cached on disk under
+CACHE_DIR, keyed by the input's content hash and the processing parameters, so
+a campaign sending one video to many chats transcodes it once. Concurrent
+requests for the same output share one run. The cache is bounded by
+CACHE_MAX_BYTES, evicting the least recently used files; files used within
+CACHE_MIN_AGE_SECONDS are kept, since a queued send may still need them.
+
+If ffmpeg is missing or fails, the original file is sent unchanged.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "whatsapp-mcp-media")
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+CACHE_MIN_AGE_SECONDS = 3600
+# ffmpeg processes allowed to run at the same time
+WORKERS = 4
+
+IMAGE_EXTENSIONS = frozenset({"jpg", "jpeg", "png", "webp"})
+VIDEO_EXTENSIONS = frozenset({"mp4", "m4v", "mov", "avi", "mkv", "webm", "3gp"})
+# WhatsApp shows photos at up to 1600px on the long side
+IMAGE_MAX_DIMENSION = 1600
+IMAGE_MAX_BYTES = 1024 * 1024
+IMAGE_JPEG_QUALITY = 4  # ffmpeg -q:v, 2 (best) to 31
+VIDEO_MAX_HEIGHT = 720
+VIDEO_MAX_BYTES = 16 * 1024 * 1024
+VIDEO_CRF = 28
+THUMBNAIL_SIZE = 100
+
+# Bumped when the ffmpeg arguments change, so old cached outputs are not reused
+_PIPELINE_VERSION = 1
+
+_pool: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+# Cache entries being produced, so concurrent requests share the work
+_in_flight: Dict[str, Future] = {}
+# (path, size, mtime_ns) -> content hash, so a file sent to many chats is read once
+_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+# content hash -> ffprobe output
+_probes: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_MEMO_SIZE = 256
+
+
+@dataclass
+class PreparedMedia:
+    path: str
+    thumbnail_path: Optional[str] = None
+    processed: bool = False
+
+
+def executor() -> ThreadPoolExecutor:
+    """The worker pool shared by every media conversion."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="media")
+        return _pool
+
+
+def _remember(memo: OrderedDict, key: Any, value: Any) -> None:
+    with _lock:
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > _MEMO_SIZE:
+            memo.popitem(last=False)
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, memoized while the file is unchanged."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if memo_key in _digests:
+            _digests.move_to_end(memo_key)
+            return _digests[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    _remember(_digests, memo_key, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def cache_key(digest: str, params: str) -> str:
+    return hashlib.sha256(f"{digest}:{params}".encode()).hexdigest()
+
+
+def cached(key: str, suffix: str, produce: Callable[[str], Any]) -> Future:
+    """Future for the cache file key + suffix, calling produce(path) on the pool
+    to write it if it is not cached yet."""
+    output_file = os.path.join(CACHE_DIR, key + suffix)
+    with _lock:
+        if os.path.isfile(output_file):
+            _touch(output_file)
+            future: Future = Future()
+            future.set_result(output_file)
+            return future
+        if key in _in_flight:
+            return _in_flight[key]
+    pool = executor()
+    with _lock:
+        if key in _in_flight:
+            return _in_flight[key]
+        future = pool.submit(_produce_into_cache, output_file, suffix, produce)
+        _in_flight[key] = future
+    future.add_done_callback(lambda _: _forget(key))
+    return future
+
+
+def _forget(key: str) -> None:
+    with _lock:
+        _in_flight.pop(key, None)
+
+
+def _touch(path: str) -> None:
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _produce_into_cache(output_file: str, suffix: str, produce: Callable[[str], Any]) -> str:
+    # Write next to the final name and rename, so a crash never leaves a truncated entry
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    partial_file = f"{output_file}.{threading.get_ident()}.part{suffix}"
+    try:
+        produce(partial_file)
+        os.replace(partial_file, output_file)
+    finally:
+        if os.path.exists(partial_file):
+            os.unlink(partial_file)
+    evict()
+    return output_file
+
+
+def evict(max_bytes: Optional[int] = None, min_age: Optional[float] = None) -> int:
+    """Delete the least recently used cache files until the cache fits.
+
+    Leftover partial outputs from interrupted conversions are removed as well.
+
+    Args:
+        max_bytes: Size budget (default: CACHE_MAX_BYTES)
+        min_age: Files used more recently than this many seconds ago are kept
+            (default: CACHE_MIN_AGE_SECONDS)
+
+    Returns:
+        Number of files deleted
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    min_age = CACHE_MIN_AGE_SECONDS if min_age is None else min_age
+    cutoff = time.time() - min_age
+    entries = []
+    try:
+        names = os.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path, ".part." in name))
+
+    deleted = 0
+    total = sum(size for _, size, _, partial in entries if not partial)
+    for mtime, size, path, partial in sorted(entries):
+        if mtime > cutoff:
+            break
+        if not partial and total <= max_bytes:
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        deleted += 1
+        if not partial:
+            total -= size
+    return deleted
+
+
+def _ffmpeg(args: list) -> None:
+    try:
+        subprocess.run(["ffmpeg", "-v", "error", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       stdin=subprocess.DEVNULL, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.strip()}")
+
+
+def probe(path: str) -> Dict[str, Any]:
+    """ffprobe's view of a file: {"format": {...}, "streams": [...]}.
+
+    Raises:
+        RuntimeError: If ffprobe is missing or cannot read the file
+    """
+    digest = file_digest(path)
+    with _lock:
+        if digest in _probes:
+            return _probes[digest]
+    try:
+        process = subprocess.run(
+            ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True, check=True,
+        )
+        info = json.loads(process.stdout)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"ffprobe failed for {path}: {e}")
+    _remember(_probes, digest, info)
+    return info
+
+
+def _stream(info: Dict[str, Any], codec_type: str) -> Dict[str, Any]:
+    return next((s for s in info.get("streams", []) if s.get("codec_type") == codec_type), {})
+
+
+def _extension(path: str) -> str:
+    return os.path.splitext(path)[1].lower().lstrip(".")
+
+
+def _image_job(path: str, info: Dict[str, Any]) -> Optional[Tuple[str, str, list]]:
+    """(params, suffix, ffmpeg args) if the image needs processing, else None."""
+    video = _stream(info, "video")
+    width, height = video.get("width") or 0, video.get("height") or 0
+    if max(width, height) <= IMAGE_MAX_DIMENSION and os.path.getsize(path) <= IMAGE_MAX_BYTES:
+        return None
+    scale = min(1.0, IMAGE_MAX_DIMENSION / max(width, height, 1))
+    filters = ["-vf", f"scale={max(1, round(width * scale))}:{max(1, round(height * scale))}"] if scale < 1 else []
+    # JPEG has no alpha channel; transparent images are only scaled
+    if "a" in (video.get("pix_fmt") or "") and _extension(path) == "png":
+        return f"image-png:{IMAGE_MAX_DIMENSION}", ".png", filters
+    return f"image-jpeg:{IMAGE_MAX_DIMENSION}:{IMAGE_JPEG_QUALITY}", ".jpg", [*filters, "-q:v", str(IMAGE_JPEG_QUALITY)]
+
+
+def _video_job(path: str, info: Dict[str, Any]) -> Optional[Tuple[str, str, list]]:
+    video, audio = _stream(info, "video"), _stream(info, "audio")
+    height = video.get("height") or 0
+    compatible = (
+        _extension(path) in ("mp4", "m4v")
+        and video.get("codec_name") == "h264"
+        and audio.get("codec_name", "aac") == "aac"
+        and height <= VIDEO_MAX_HEIGHT
+        and os.path.getsize(path) <= VIDEO_MAX_BYTES
+    )
+    if compatible:
+        return None
+    filters = ["-vf", f"scale=-2:{min(height, VIDEO_MAX_HEIGHT) // 2 * 2}"] if height else []
+    args = [
+        *filters,
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(VIDEO_CRF),
+        "-pix_fmt", "yuv420p",           # The only pixel format every WhatsApp client plays
+        "-c:a", "aac", "-b:a", "128k",
+        "-movflags", "+faststart",       # Index first, so playback starts before the download ends
+    ]
+    return f"video-mp4:{VIDEO_MAX_HEIGHT}:{VIDEO_CRF}", ".mp4", args
+
+
+def _submit(path: str, digest: str, params: str, suffix: str, args: list) -> Future:
+    key = cache_key(digest, f"v{_PIPELINE_VERSION}:{params}")
+    return cached(key, suffix, lambda output: _ffmpeg(["-i", path, *args, "-y", output]))
+
+
+def prepare(path: str) -> PreparedMedia:
+    """Make a file ready to send: convert it if needed and add a thumbnail.
+
+    Files that are neither images nor videos, or that ffmpeg cannot handle,
+    come back unchanged.
+    """
+    extension = _extension(path)
+    if extension not in IMAGE_EXTENSIONS and extension not in VIDEO_EXTENSIONS:
+        return PreparedMedia(path)
+    try:
+        digest = file_digest(path)
+        info = probe(path)
+        job = (_image_job if extension in IMAGE_EXTENSIONS else _video_job)(path, info)
+        converted = _submit(path, digest, *job) if job else None
+        thumbnail_filter = f"thumbnail,scale={THUMBNAIL_SIZE}:{THUMBNAIL_SIZE}:force_original_aspect_ratio=decrease"
+        thumbnail = _submit(path, digest, f"thumbnail:{THUMBNAIL_SIZE}", ".jpg",
+                            ["-vf", thumbnail_filter, "-frames:v", "1", "-q:v", "5"])
+        prepared = PreparedMedia(converted.result() if converted else path, processed=converted is not None)
+    except (OSError, RuntimeError) as e:
+        print(f"Media preprocessing skipped for {path}: {e}")
+        return PreparedMedia(path)
+    try:
+        prepared.thumbnail_path = thumbnail.result()
+    except (OSError, RuntimeError) as e:
+        print(f"Thumbnail skipped for {path}: {e}")
+    return prepared
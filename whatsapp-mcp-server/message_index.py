@@ -0,0 +1,386 @@
+"""Python-maintained sidecar index over the bridge's messages.db.
+
+The bridge owns messages.db and the MCP server only reads it, so derived
+structures live in a separate database next to it (mcp_index.db). The index
+connection ATTACHes messages.db read-only as ``src``; because the sidecar never
+defines ``messages`` or ``chats`` tables, unqualified queries written against
+messages.db run unchanged on it.
+
+The index is refreshed incrementally: every sync reads only the messages rows
+whose rowid is above the stored watermark. The bridge writes with
+INSERT OR REPLACE, so a re-stored message gets a new rowid; ``message_keys``
+maps (chat_jid, id) to the rowid last indexed so stale entries can be dropped.
+"""
+import sqlite3
+import threading
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+import db
+
+INDEX_DB_NAME = "mcp_index.db"
+
+# Bump when the derived tables change; the index is then rebuilt from scratch.
+SCHEMA_VERSION = 5
+
+# Rows read from messages.db per sync transaction.
+SYNC_BATCH_SIZE = 5000
+# A query catches the index up itself only when at most this many rows are
+# missing; a cold or far-behind index is left to the background sync.
+INLINE_SYNC_MAX_ROWS = SYNC_BATCH_SIZE
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS index_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS message_keys (
+        msg_rowid INTEGER PRIMARY KEY,
+        chat_jid TEXT NOT NULL,
+        id TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_message_keys_key ON message_keys(chat_jid, id);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        content,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+
+    -- messages.timestamp is text with a timezone suffix; ts is the same instant as Unix epoch seconds
+    CREATE TABLE IF NOT EXISTS message_times (
+        msg_rowid INTEGER PRIMARY KEY,
+        chat_jid TEXT NOT NULL,
+        ts INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_message_times_ts ON message_times(ts);
+    CREATE INDEX IF NOT EXISTS idx_message_times_chat_ts ON message_times(chat_jid, ts);
+
+    -- One row per chat: the latest message plus counters, so chat listings need no join on messages.
+    -- *_ts columns are epoch seconds for ordering, *_time the bridge's original text.
+    -- unanswered_count counts incoming messages newer than my last outgoing one.
+    CREATE TABLE IF NOT EXISTS chat_summary (
+        chat_jid TEXT PRIMARY KEY,
+        message_count INTEGER NOT NULL,
+        unanswered_count INTEGER NOT NULL,
+        last_rowid INTEGER,
+        last_ts INTEGER,
+        last_time TEXT,
+        last_message_id TEXT,
+        last_content TEXT,
+        last_sender TEXT,
+        last_is_from_me INTEGER,
+        last_inbound_ts INTEGER,
+        last_inbound_time TEXT,
+        last_outbound_ts INTEGER,
+        last_outbound_time TEXT,
+        awaiting_reply INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_chat_summary_inbox ON chat_summary(awaiting_reply, last_inbound_ts);
+
+    -- Who wrote where: one row per (sender phone, chat), keyed for lookups by contact
+    CREATE TABLE IF NOT EXISTS participation (
+        sender TEXT NOT NULL,
+        chat_jid TEXT NOT NULL,
+        message_count INTEGER NOT NULL,
+        first_ts INTEGER,
+        first_time TEXT,
+        last_ts INTEGER,
+        last_time TEXT,
+        last_rowid INTEGER,
+        PRIMARY KEY (sender, chat_jid)
+    ) WITHOUT ROWID;
+
+    -- Hourly activity rollup per (chat, sender); hour_ts is the UTC hour start in epoch seconds
+    CREATE TABLE IF NOT EXISTS activity_hours (
+        chat_jid TEXT NOT NULL,
+        hour_ts INTEGER NOT NULL,
+        sender TEXT NOT NULL,
+        message_count INTEGER NOT NULL,
+        first_ts INTEGER,
+        first_time TEXT,
+        last_ts INTEGER,
+        last_time TEXT,
+        last_rowid INTEGER,
+        PRIMARY KEY (chat_jid, hour_ts, sender)
+    ) WITHOUT ROWID;
+"""
+
+_DERIVED_TABLES = (
+    "message_keys", "message_fts", "message_times", "chat_summary", "participation", "activity_hours",
+)
+
+# Columns read from src.messages for every new row
+_SourceRow = namedtuple("_SourceRow", "rowid chat_jid id content ts timestamp sender is_from_me")
+
+_SUMMARY_FIELDS = (
+    "message_count", "unanswered_count", "last_rowid", "last_ts", "last_time",
+    "last_message_id", "last_content", "last_sender", "last_is_from_me",
+    "last_inbound_ts", "last_inbound_time", "last_outbound_ts", "last_outbound_time",
+    "awaiting_reply",
+)
+
+_sync_lock = threading.Lock()
+
+
+def _attach_source(messages_db_path: str):
+    def on_connect(conn: sqlite3.Connection) -> None:
+        _ensure_schema(conn)
+        conn.execute("ATTACH DATABASE ? AS src", (db.readonly_uri(messages_db_path),))
+    return on_connect
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    """Create the index tables, dropping them first if they were built by another schema version."""
+    conn.execute("CREATE TABLE IF NOT EXISTS index_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    if _get_state(conn, "schema_version") != SCHEMA_VERSION:
+        with conn:
+            for table in _DERIVED_TABLES:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute("DELETE FROM index_state")
+    conn.executescript(_SCHEMA)
+    with conn:
+        _set_state(conn, "schema_version", SCHEMA_VERSION)
+
+
+def open_index(index_db_path: str, messages_db_path: str) -> sqlite3.Connection:
+    """Return this thread's connection to the sidecar index with messages.db attached as src.
+
+    Raises:
+        sqlite3.Error: If either database cannot be opened or FTS5 is not
+            compiled into the SQLite library
+    """
+    return db.get_connection(index_db_path, _attach_source(messages_db_path))
+
+
+def _get_state(conn: sqlite3.Connection, name: str) -> int:
+    row = conn.execute("SELECT value FROM index_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_state(conn: sqlite3.Connection, name: str, value: int) -> None:
+    conn.execute(
+        "INSERT INTO index_state (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+        (name, value),
+    )
+
+
+def _replaced_rowids(conn: sqlite3.Connection, low: int, high: int) -> Dict[Tuple[str, str], int]:
+    """Previously indexed rowids of messages re-stored in the rowid range (low, high]."""
+    rows = conn.execute("""
+        SELECT k.chat_jid, k.id, k.msg_rowid
+        FROM src.messages m
+        JOIN message_keys k ON k.chat_jid = m.chat_jid AND k.id = m.id
+        WHERE m.rowid > ? AND m.rowid <= ?
+    """, (low, high)).fetchall()
+    return {(chat_jid, msg_id): rowid for chat_jid, msg_id, rowid in rows}
+
+
+def _update_chat_summary(
+    conn: sqlite3.Connection,
+    chat_jid: str,
+    rows: List[_SourceRow],
+    replaced: Dict[Tuple[str, str], int],
+) -> None:
+    """Fold one chat's new rows into its chat_summary row."""
+    current = conn.execute(
+        f"SELECT {', '.join(_SUMMARY_FIELDS)} FROM chat_summary WHERE chat_jid = ?", (chat_jid,)
+    ).fetchone()
+    if current:
+        state = dict(zip(_SUMMARY_FIELDS, current))
+    else:
+        state = dict.fromkeys(_SUMMARY_FIELDS)
+        state.update(message_count=0, unanswered_count=0, awaiting_reply=0)
+    previous_outbound_ts = state["last_outbound_ts"]
+
+    # Re-stored messages were counted when first indexed
+    fresh = [row for row in rows if (row.chat_jid, row.id) not in replaced]
+    state["message_count"] += len(fresh)
+
+    for row in rows:
+        if row.ts is None:
+            continue
+        if state["last_ts"] is None or (row.ts, row.rowid) >= (state["last_ts"], state["last_rowid"]):
+            state.update(
+                last_rowid=row.rowid, last_ts=row.ts, last_time=row.timestamp, last_message_id=row.id,
+                last_content=row.content, last_sender=row.sender, last_is_from_me=row.is_from_me,
+            )
+        direction = "outbound" if row.is_from_me else "inbound"
+        if state[f"last_{direction}_ts"] is None or row.ts >= state[f"last_{direction}_ts"]:
+            state[f"last_{direction}_ts"] = row.ts
+            state[f"last_{direction}_time"] = row.timestamp
+
+    if state["last_outbound_ts"] != previous_outbound_ts:
+        # A newer reply answers earlier messages; recount from it (a short range via the index)
+        state["unanswered_count"] = conn.execute("""
+            SELECT COUNT(*)
+            FROM message_times t
+            JOIN src.messages m ON m.rowid = t.msg_rowid
+            WHERE t.chat_jid = ? AND t.ts > ? AND NOT m.is_from_me
+        """, (chat_jid, state["last_outbound_ts"])).fetchone()[0]
+    else:
+        floor = state["last_outbound_ts"]
+        state["unanswered_count"] += sum(
+            1 for row in fresh
+            if not row.is_from_me and row.ts is not None and (floor is None or row.ts > floor)
+        )
+    state["awaiting_reply"] = int(state["last_is_from_me"] is not None and not state["last_is_from_me"])
+
+    conn.execute(
+        f"INSERT OR REPLACE INTO chat_summary (chat_jid, {', '.join(_SUMMARY_FIELDS)}) "
+        f"VALUES (?{', ?' * len(_SUMMARY_FIELDS)})",
+        (chat_jid, *(state[field] for field in _SUMMARY_FIELDS)),
+    )
+
+
+def sender_key(jid: str) -> str:
+    """Normalize a sender or contact JID to the phone/user part the bridge stores in messages.sender."""
+    return jid.split("@", 1)[0].split(":", 1)[0]
+
+
+def _rollup_upsert(table: str, key_columns: Tuple[str, ...]) -> str:
+    """Upsert merging a batch aggregate into a rollup table keyed by key_columns.
+
+    Rollup tables share the columns message_count, first_ts/first_time and
+    last_ts/last_time/last_rowid. In the UPDATE every right-hand side sees the old row.
+    """
+    columns = (*key_columns, "message_count", "first_ts", "first_time", "last_ts", "last_time", "last_rowid")
+    earlier = "first_ts IS NULL OR excluded.first_ts < first_ts"
+    later = "last_ts IS NULL OR excluded.last_ts >= last_ts"
+    return f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET
+            message_count = message_count + excluded.message_count,
+            first_ts = CASE WHEN {earlier} THEN excluded.first_ts ELSE first_ts END,
+            first_time = CASE WHEN {earlier} THEN excluded.first_time ELSE first_time END,
+            last_ts = CASE WHEN {later} THEN excluded.last_ts ELSE last_ts END,
+            last_time = CASE WHEN {later} THEN excluded.last_time ELSE last_time END,
+            last_rowid = CASE WHEN {later} THEN excluded.last_rowid ELSE last_rowid END
+    """
+
+
+_PARTICIPATION_UPSERT = _rollup_upsert("participation", ("sender", "chat_jid"))
+_ACTIVITY_UPSERT = _rollup_upsert("activity_hours", ("chat_jid", "hour_ts", "sender"))
+
+
+def _rollup(
+    rows: List[_SourceRow],
+    replaced: Dict[Tuple[str, str], int],
+    key: Callable[[_SourceRow], Optional[tuple]],
+) -> List[tuple]:
+    """Aggregate a batch per key(row) into upsert parameters for _rollup_upsert.
+
+    Rows whose key is None are skipped; re-stored messages update times but are not counted again.
+    """
+    # key -> [count, first_ts, first_time, last_ts, last_time, last_rowid]
+    totals: Dict[tuple, list] = {}
+    for row in rows:
+        row_key = key(row)
+        if row_key is None:
+            continue
+        entry = totals.setdefault(row_key, [0, None, None, None, None, None])
+        if (row.chat_jid, row.id) not in replaced:
+            entry[0] += 1
+        if row.ts is None:
+            continue
+        if entry[1] is None or row.ts < entry[1]:
+            entry[1:3] = row.ts, row.timestamp
+        if entry[3] is None or row.ts >= entry[3]:
+            entry[3:6] = row.ts, row.timestamp, row.rowid
+    return [(*row_key, *entry) for row_key, entry in totals.items()]
+
+
+def _participation_key(row: _SourceRow) -> Optional[tuple]:
+    return (sender_key(row.sender), row.chat_jid) if row.sender else None
+
+
+def _activity_key(row: _SourceRow) -> Optional[tuple]:
+    if row.ts is None:
+        return None
+    return row.chat_jid, row.ts - row.ts % 3600, sender_key(row.sender or "")
+
+
+def _apply_batch(
+    conn: sqlite3.Connection,
+    rows: List[_SourceRow],
+    replaced: Dict[Tuple[str, str], int],
+) -> None:
+    stale = [(rowid,) for rowid in replaced.values()]
+    for table in ("message_fts", "message_times"):
+        conn.executemany(f"DELETE FROM {table} WHERE rowid = ?", stale)
+    conn.executemany("DELETE FROM message_keys WHERE msg_rowid = ?", stale)
+    conn.executemany(
+        "INSERT OR REPLACE INTO message_keys (msg_rowid, chat_jid, id) VALUES (?, ?, ?)",
+        [(row.rowid, row.chat_jid, row.id) for row in rows],
+    )
+    conn.executemany(
+        "INSERT INTO message_fts (rowid, content) VALUES (?, ?)",
+        [(row.rowid, row.content) for row in rows if row.content],
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO message_times (msg_rowid, chat_jid, ts) VALUES (?, ?, ?)",
+        [(row.rowid, row.chat_jid, row.ts) for row in rows if row.ts is not None],
+    )
+
+    by_chat: Dict[str, List[_SourceRow]] = {}
+    for row in rows:
+        by_chat.setdefault(row.chat_jid, []).append(row)
+    for chat_jid, chat_rows in by_chat.items():
+        _update_chat_summary(conn, chat_jid, chat_rows, replaced)
+    conn.executemany(_PARTICIPATION_UPSERT, _rollup(rows, replaced, _participation_key))
+    conn.executemany(_ACTIVITY_UPSERT, _rollup(rows, replaced, _activity_key))
+
+
+def pending_rows(conn: sqlite3.Connection) -> int:
+    """Roughly how many messages.db rows the index is missing (rowid gaps count too)."""
+    high = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM src.messages").fetchone()[0]
+    return max(0, high - _get_state(conn, "messages_rowid"))
+
+
+def sync(conn: sqlite3.Connection, wait: bool = True) -> Optional[int]:
+    """Index messages added since the last sync. Returns the number of rows read.
+
+    With wait=False, returns None at once if another thread is already syncing.
+    """
+    if not _sync_lock.acquire(blocking=wait):
+        return None
+    try:
+        return _sync_locked(conn)
+    finally:
+        _sync_lock.release()
+
+
+def _sync_locked(conn: sqlite3.Connection) -> int:
+    total = 0
+    watermark = _get_state(conn, "messages_rowid")
+    while True:
+        rows = [_SourceRow(*row) for row in conn.execute("""
+            SELECT rowid, chat_jid, id, content, CAST(strftime('%s', timestamp) AS INTEGER),
+                   timestamp, sender, is_from_me
+            FROM src.messages
+            WHERE rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+        """, (watermark, SYNC_BATCH_SIZE))]
+        if not rows:
+            break
+        high = rows[-1].rowid
+        with conn:
+            _apply_batch(conn, rows, _replaced_rowids(conn, watermark, high))
+            _set_state(conn, "messages_rowid", high)
+        watermark = high
+        total += len(rows)
+    return total
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 phrase-prefix query, or None if it has no searchable tokens.
+
+    The whole input is matched as one phrase and the last word as a prefix, which
+    keeps the old "content contains this text" behaviour for typical queries.
+    """
+    if not text or not any(char.isalnum() for char in text):
+        return None
+    return '"' + text.replace('"', '""') + '"*'
@@ -0,0 +1,396 @@
+"""Durable outbox for outgoing messages.
+
+Sends used to be one-shot bridge calls. A timeout or a disconnected bridge
+either lost the message or led the agent to retry and send it twice. Every
+send is now written to the outbox table in the state database first. A single
+worker drains the table at a steady rate and retries transient failures with
+backoff. Callers wait a bounded time for the outcome and can look up any
+send's delivery state afterwards.
+
+Duplicates are suppressed at two levels. A send carrying an idempotency key
+that was already used returns the original record. Sends also carry a fixed
+WhatsApp message ID, chosen when they are queued. The bridge skips an ID it
+has already sent, so retrying after a timeout cannot deliver the message
+twice. Sends without a key are never matched by content: a repeated "ok", or
+a new file saved over an old path, is a new message.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import bridge
+import db
+from jobs import TokenBucket
+
+# Average sends per second and the burst allowed on top of it.
+SENDS_PER_SECOND = 1.0
+SEND_BURST = 5
+# Attempts before a send is marked failed; waits double from RETRY_BASE_SECONDS.
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 5.0
+RETRY_MAX_SECONDS = 300.0
+# Pause after a database error before the worker tries again.
+DB_ERROR_BACKOFF_SECONDS = 5.0
+# Endpoints that accept a caller-chosen message_id, making them safe to repeat.
+PINNED_ID_ENDPOINTS = frozenset({"send", "send_reply", "send_media"})
+
+FINAL_STATUSES = ("sent", "failed", "unknown")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    endpoint TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+"""
+
+_COLUMNS = "id, idempotency_key, endpoint, payload, status, attempts, next_attempt_at, last_error, result, created_at, updated_at"
+
+
+def _drop_content_hash(conn: sqlite3.Connection) -> None:
+    """Rebuild an outbox table created with the old content_hash column.
+
+    The column was NOT NULL, so inserts that leave it out would fail. A copy is
+    used instead of DROP COLUMN, which older SQLite libraries lack.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(outbox)")]
+    if "content_hash" not in columns:
+        return
+    conn.execute("BEGIN")
+    with conn:
+        conn.execute("DROP INDEX IF EXISTS idx_outbox_content")
+        conn.execute("DROP INDEX IF EXISTS idx_outbox_due")
+        conn.execute("ALTER TABLE outbox RENAME TO outbox_old")
+        for statement in _SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        conn.execute(f"INSERT INTO outbox ({_COLUMNS}) SELECT {_COLUMNS} FROM outbox_old")
+        conn.execute("DROP TABLE outbox_old")
+
+
+def _new_message_id() -> str:
+    # Same shape as the IDs WhatsApp clients generate
+    return "3EB0" + uuid.uuid4().hex[:16].upper()
+
+
+def _iso(epoch: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(epoch).isoformat(timespec="seconds") if epoch else None
+
+
+def _record(row: Tuple) -> Dict[str, Any]:
+    payload = json.loads(row[3])
+    return {
+        "outbox_id": row[0],
+        "idempotency_key": row[1],
+        "endpoint": row[2],
+        "recipient": payload.get("recipient") or payload.get("chat_jid") or payload.get("jid"),
+        "message_id": payload.get("message_id"),
+        "status": row[4],
+        "attempts": row[5],
+        "next_attempt_at": _iso(row[6]) if row[4] == "queued" else None,
+        "last_error": row[7],
+        "result": row[8],
+        "created_at": _iso(row[9]),
+        "updated_at": _iso(row[10]),
+    }
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+Sender = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+# The bridge answers every failed send with HTTP 500. Only these causes can
+# clear up on their own; a bad JID or unreadable file fails the same way again.
+TRANSIENT_SEND_ERRORS = (
+    "not connected",
+    "error uploading media",
+    "error sending message",
+    "failed to send reply",
+    "timeout",
+    "deadline exceeded",
+)
+
+
+def _server_error_reason(message: str) -> Optional[str]:
+    """The bridge's own message from an "HTTP 5xx: {json}" error, if it sent one."""
+    if not message.startswith("HTTP 5"):
+        return None
+    try:
+        body = json.loads(message.split(": ", 1)[1])
+    except (IndexError, ValueError):
+        return None
+    return body.get("message") if isinstance(body, dict) else None
+
+
+def _classify(endpoint: str, payload: Dict[str, Any], send: Optional[Sender] = None) -> Tuple[str, str]:
+    """Send once and decide what happens next: ("sent" | "retry" | "failed" | "unknown", detail)."""
+    pinned = endpoint in PINNED_ID_ENDPOINTS
+    try:
+        result = send(payload) if send else bridge.post(endpoint, payload, idempotent=pinned)
+    except bridge.BridgeUnavailable as e:
+        return "retry", str(e)
+    except bridge.BridgeError as e:
+        message = str(e)
+        if message.startswith("HTTP 4"):
+            return "failed", message
+        reason = _server_error_reason(message)
+        if reason is not None and not any(cause in reason.lower() for cause in TRANSIENT_SEND_ERRORS):
+            return "failed", reason
+        if pinned or "not connected" in message.lower():
+            return "retry", message
+        # The bridge may have sent it before failing; repeating could duplicate it
+        return "unknown", message
+    if result.get("success", False):
+        return "sent", result.get("message", "")
+    return "failed", result.get("message", "Unknown response")
+
+
+class Outbox:
+    """Persistent send queue with one background worker.
+
+    Args:
+        db_path: State database file (created if missing)
+        rate: Average sends per second (0 disables pacing)
+        burst: Sends allowed back to back before pacing applies
+        senders: Functions delivering endpoints that are not a plain JSON post,
+            called with the payload; they return or raise like bridge.post
+    """
+
+    def __init__(self, db_path: str, rate: float = SENDS_PER_SECOND, burst: int = SEND_BURST,
+                 senders: Optional[Dict[str, Sender]] = None):
+        self.db_path = db_path
+        self._senders = dict(senders or {})
+        self._bucket = TokenBucket(rate, capacity=burst)
+        self._changed = threading.Condition()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _db(self) -> sqlite3.Connection:
+        conn = db.get_connection(self.db_path)
+        if not self._schema_ready:
+            _drop_content_hash(conn)
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    # ── Public API ──────────────────────────────────────────────────────────
+
+    def enqueue(self, endpoint: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Queue a send unless its idempotency key was already used.
+
+        Returns:
+            (record, duplicate): duplicate is True when an existing record was
+            returned instead of queueing a new send
+        """
+        now = time.time()
+        conn = self._db()
+        with conn:
+            if idempotency_key:
+                row = conn.execute(f"SELECT {_COLUMNS} FROM outbox WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+                if row is not None:
+                    return _record(row), True
+
+            payload = dict(payload)
+            if endpoint in PINNED_ID_ENDPOINTS:
+                payload["message_id"] = _new_message_id()
+            try:
+                cursor = conn.execute(
+                    "INSERT INTO outbox (idempotency_key, endpoint, payload, status, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                    (idempotency_key, endpoint, json.dumps(payload), now, now, now),
+                )
+            except sqlite3.IntegrityError:
+                # Another thread queued the same key between the lookup and the insert
+                row = conn.execute(f"SELECT {_COLUMNS} FROM outbox WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+                return _record(row), True
+            row = conn.execute(f"SELECT {_COLUMNS} FROM outbox WHERE id = ?", (cursor.lastrowid,)).fetchone()
+        self.start()
+        self._wakeup.set()
+        return _record(row), False
+
+    def get(self, outbox_id: Optional[int] = None, idempotency_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Delivery state of one send, looked up by id or idempotency key."""
+        if outbox_id is not None:
+            row = self._db().execute(f"SELECT {_COLUMNS} FROM outbox WHERE id = ?", (outbox_id,)).fetchone()
+        elif idempotency_key:
+            row = self._db().execute(f"SELECT {_COLUMNS} FROM outbox WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        else:
+            return None
+        return _record(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent sends first, optionally only those in one status."""
+        sql = f"SELECT {_COLUMNS} FROM outbox"
+        params: List[Any] = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return [_record(row) for row in self._db().execute(sql, params).fetchall()]
+
+    def retry(self, outbox_id: int) -> Tuple[bool, str]:
+        """Queue a failed send again."""
+        conn = self._db()
+        with conn:
+            updated = conn.execute(
+                "UPDATE outbox SET status = 'queued', attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'failed'",
+                (time.time(), time.time(), outbox_id),
+            ).rowcount
+        if not updated:
+            return False, f"Outbox entry {outbox_id} not found or not failed"
+        self.start()
+        self._wakeup.set()
+        return True, f"Outbox entry {outbox_id} queued again"
+
+    def wait(self, outbox_id: int, timeout: float) -> Dict[str, Any]:
+        """Block until the send's first attempt has an outcome or timeout passes; returns its record.
+
+        A send that was attempted and rescheduled comes back "queued" rather
+        than holding the caller through every backoff.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.get(outbox_id)
+            remaining = deadline - time.monotonic()
+            if record is None or remaining <= 0 or record["status"] in FINAL_STATUSES:
+                return record
+            if record["status"] == "queued" and record["attempts"] > 0:
+                return record
+            with self._changed:
+                self._changed.wait(min(remaining, 1.0))
+
+    def start(self) -> None:
+        """Start the worker if it is not running, recovering sends interrupted by a restart."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._recover()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker after its current send."""
+        self._stop.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    # ── Worker ──────────────────────────────────────────────────────────────
+
+    def _recover(self) -> None:
+        # A send cut off mid-flight is only safe to repeat if its message ID is pinned
+        conn = self._db()
+        with conn:
+            for row_id, endpoint in conn.execute("SELECT id, endpoint FROM outbox WHERE status = 'sending'").fetchall():
+                if endpoint in PINNED_ID_ENDPOINTS:
+                    conn.execute("UPDATE outbox SET status = 'queued' WHERE id = ?", (row_id,))
+                else:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'unknown', last_error = 'Interrupted while sending; not resent' WHERE id = ?",
+                        (row_id,),
+                    )
+
+    def _next_due(self) -> Tuple[Optional[Tuple], Optional[float]]:
+        """The next send that is due, or how long until one will be."""
+        conn = self._db()
+        row = conn.execute(
+            "SELECT id, endpoint, payload, attempts, next_attempt_at FROM outbox "
+            "WHERE status = 'queued' ORDER BY next_attempt_at, id LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None, None
+        wait = row[4] - time.time()
+        return (row, None) if wait <= 0 else (None, wait)
+
+    def _update(self, row_id: int, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._db()
+        with conn:
+            conn.execute(f"UPDATE outbox SET {assignments} WHERE id = ?", (*fields.values(), row_id))
+        with self._changed:
+            self._changed.notify_all()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Cleared before looking, so a send queued meanwhile still wakes the wait below
+            self._wakeup.clear()
+            try:
+                row, wait = self._next_due()
+            except sqlite3.Error as e:
+                print(f"Outbox database error, retrying in {DB_ERROR_BACKOFF_SECONDS:.0f}s: {e}")
+                self._stop.wait(DB_ERROR_BACKOFF_SECONDS)
+                continue
+            if row is None:
+                self._wakeup.wait(min(wait, 30.0) if wait is not None else 30.0)
+                continue
+            if not self._bucket.acquire(self._stop):
+                return
+            try:
+                self._deliver(row)
+            except Exception as e:
+                # One bad send must not stop the queue behind it
+                print(f"Outbox error on entry {row[0]}: {e}")
+                self._abandon(row[0], f"Outbox error: {e}")
+                if isinstance(e, sqlite3.Error):
+                    self._stop.wait(DB_ERROR_BACKOFF_SECONDS)
+
+    def _deliver(self, row: Tuple) -> None:
+        row_id, endpoint, payload_json, attempts, _ = row
+        attempts += 1
+        self._update(row_id, status="sending", attempts=attempts)
+        try:
+            payload = json.loads(payload_json)
+        except ValueError as e:
+            self._update(row_id, status="failed", last_error=f"Unreadable payload: {e}")
+            return
+        try:
+            outcome, detail = _classify(endpoint, payload, self._senders.get(endpoint))
+        except Exception as e:
+            # A sender failing in an unexpected way may have delivered before it did
+            outcome, detail = "unknown", f"Unexpected error: {e}"
+        if outcome == "retry" and attempts < MAX_ATTEMPTS:
+            self._update(row_id, status="queued", last_error=detail,
+                         next_attempt_at=time.time() + _retry_delay(attempts))
+        elif outcome == "sent":
+            self._update(row_id, status="sent", result=detail, last_error=None)
+        else:
+            self._update(row_id, status="unknown" if outcome == "unknown" else "failed", last_error=detail)
+
+    def _abandon(self, row_id: int, error: str) -> None:
+        """Settle a send left in 'sending' by an unexpected error, so waiters get an answer."""
+        try:
+            conn = self._db()
+            with conn:
+                conn.execute(
+                    "UPDATE outbox SET status = 'unknown', last_error = ?, updated_at = ? WHERE id = ? AND status = 'sending'",
+                    (error, time.time(), row_id),
+                )
+        except sqlite3.Error as e:
+            print(f"Could not record outbox error for entry {row_id}: {e}")
+        with self._changed:
+            self._changed.notify_all()
@@ -0,0 +1,197 @@
+"""WhatsApp registration checks for large phone lists.
+
+A single is_on_whatsapp request with tens of thousands of numbers is slow and
+fails as a whole. Lists are now split into chunks that run a few at a time, and
+a chunk that fails is reported without losing the others.
+
+Results are kept in the state database, keyed by the number in E.164 form, so
+the same number written differently ("0040 730 883 388", "+40730883388") is
+one entry. A repeat check within the TTL is answered locally. Numbers that are
+not registered get a shorter TTL, since they may join WhatsApp at any time.
+"""
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import bridge
+import db
+
+# Numbers per bridge request, and how many requests run at once.
+CHUNK_SIZE = 500
+PARALLEL_CHUNKS = 4
+# Seconds a cached result is trusted, for registered and unregistered numbers.
+REGISTRATION_TTL_SECONDS = 7 * 24 * 3600
+UNREGISTERED_TTL_SECONDS = 24 * 3600
+
+# SQLite's default limit on bound parameters is 32766; stay well below it.
+_LOOKUP_CHUNK = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    phone TEXT PRIMARY KEY,
+    registered INTEGER NOT NULL,
+    jid TEXT,
+    checked_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """E.164 form of a phone number ("+40730883388"), or None if it cannot be one.
+
+    Numbers must include the country code; a leading "00" is read as "+".
+    """
+    text = str(phone).strip()
+    digits = re.sub(r"\D", "", text)
+    if not text.startswith("+") and digits.startswith("00"):
+        digits = digits[2:]
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return "+" + digits
+
+
+class Registrations:
+    """Chunked, cached is_on_whatsapp checks.
+
+    Args:
+        db_path: State database file (created if missing)
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._schema_ready = False
+
+    def _db(self) -> sqlite3.Connection:
+        conn = db.get_connection(self.db_path)
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def check(self, phones: List[str], max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Check which numbers are registered on WhatsApp.
+
+        Args:
+            phones: Numbers with country code, in any common format
+            max_age: Seconds a cached result may be old; 0 skips the cache.
+                Defaults to the registered/unregistered TTLs.
+
+        Returns:
+            Dict with one result per distinct valid number plus cache_hits,
+            checked, failed, invalid and elapsed_ms
+        """
+        started = time.monotonic()
+        numbers: Dict[str, str] = {}
+        invalid = []
+        for phone in phones:
+            normalized = normalize_phone(phone)
+            if normalized is None:
+                invalid.append(phone)
+            else:
+                numbers.setdefault(normalized, phone)
+
+        found = self._lookup(list(numbers), max_age)
+        cache_hits = len(found)
+        missing = [number for number in numbers if number not in found]
+
+        checked, failed, errors = self._check_with_bridge(missing)
+        found.update(checked)
+        self._store(checked)
+
+        results = []
+        for number, phone in numbers.items():
+            if number not in found:
+                continue
+            registered, jid = found[number]
+            result = {"phone": phone, "normalized": number, "is_on_whatsapp": registered, "cached": number not in checked}
+            if jid:
+                result["jid"] = jid
+            results.append(result)
+
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        message = f"checked {len(results)} numbers ({cache_hits} from cache) in {elapsed_ms / 1000:.1f}s"
+        if failed:
+            message += f"; {len(failed)} could not be checked: {errors[0]}"
+        if invalid:
+            message += f"; {len(invalid)} invalid"
+        return {
+            "success": bool(results) or not failed,
+            "message": message,
+            "results": results,
+            "cache_hits": cache_hits,
+            "checked": len(checked),
+            "failed": failed,
+            "invalid": invalid,
+            "elapsed_ms": elapsed_ms,
+        }
+
+    def _lookup(self, numbers: List[str], max_age: Optional[float]) -> Dict[str, Tuple[bool, Optional[str]]]:
+        if not numbers or max_age == 0:
+            return {}
+        now = time.time()
+        if max_age is None:
+            registered_since, unregistered_since = now - REGISTRATION_TTL_SECONDS, now - UNREGISTERED_TTL_SECONDS
+        else:
+            registered_since = unregistered_since = now - max_age
+        found = {}
+        conn = self._db()
+        for start in range(0, len(numbers), _LOOKUP_CHUNK):
+            chunk = numbers[start:start + _LOOKUP_CHUNK]
+            rows = conn.execute(
+                f"SELECT phone, registered, jid FROM registrations WHERE phone IN ({','.join('?' * len(chunk))}) "
+                "AND checked_at > CASE WHEN registered THEN ? ELSE ? END",
+                (*chunk, registered_since, unregistered_since),
+            )
+            for phone, registered, jid in rows:
+                found[phone] = (bool(registered), jid)
+        return found
+
+    def _store(self, checked: Dict[str, Tuple[bool, Optional[str]]]) -> None:
+        if not checked:
+            return
+        now = time.time()
+        conn = self._db()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO registrations (phone, registered, jid, checked_at) VALUES (?, ?, ?, ?)",
+                [(number, int(registered), jid, now) for number, (registered, jid) in checked.items()],
+            )
+
+    def _check_with_bridge(self, numbers: List[str]) -> Tuple[Dict[str, Tuple[bool, Optional[str]]], List[str], List[str]]:
+        """Returns (results by number, numbers that could not be checked, error messages)."""
+        checked: Dict[str, Tuple[bool, Optional[str]]] = {}
+        failed: List[str] = []
+        errors: List[str] = []
+        if not numbers:
+            return checked, failed, errors
+        chunks = [numbers[start:start + CHUNK_SIZE] for start in range(0, len(numbers), CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_CHUNKS, len(chunks))) as pool:
+            for chunk, outcome in zip(chunks, pool.map(_check_chunk, chunks)):
+                if isinstance(outcome, str):
+                    failed.extend(chunk)
+                    errors.append(outcome)
+                    continue
+                checked.update(outcome)
+                # The bridge leaves out numbers it could not resolve; report rather than guess
+                failed.extend(number for number in chunk if number not in outcome)
+        if failed and not errors:
+            errors.append("no answer from WhatsApp")
+        return checked, failed, errors
+
+
+def _check_chunk(numbers: List[str]) -> Any:
+    """Results by number for one bridge request, or the error message if it failed."""
+    try:
+        response = bridge.post("is_on_whatsapp", {"phones": numbers}, idempotent=True)
+    except bridge.BridgeError as e:
+        return str(e)
+    if not response.get("success", False):
+        return response.get("message", "Unknown response")
+    results = {}
+    for item in response.get("results") or []:
+        number = normalize_phone(item.get("phone", ""))
+        if number is not None:
+            results[number] = (bool(item.get("is_on_whatsapp")), item.get("jid") or None)
+    return results
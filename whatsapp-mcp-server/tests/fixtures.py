@@ -0,0 +1,49 @@
+"""Helpers for building a messages.db with the Go bridge's schema."""
+import os
+import sqlite3
+
+BRIDGE_SCHEMA = """
+    CREATE TABLE chats (jid TEXT PRIMARY KEY, name TEXT, last_message_time TIMESTAMP);
+    CREATE TABLE messages (
+        id TEXT, chat_jid TEXT, sender TEXT, content TEXT, timestamp TIMESTAMP,
+        is_from_me BOOLEAN, media_type TEXT, filename TEXT, url TEXT, media_key BLOB,
+        file_sha256 BLOB, file_enc_sha256 BLOB, file_length INTEGER,
+        PRIMARY KEY (id, chat_jid)
+    );
+"""
+
+
+def create_bridge_db(directory, chats=(), messages=()):
+    """Create messages.db in directory.
+
+    chats: (jid, name, last_message_time) tuples
+    messages: (id, chat_jid, sender, content, timestamp, is_from_me) tuples
+    """
+    path = os.path.join(directory, "messages.db")
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(BRIDGE_SCHEMA)
+        conn.executemany("INSERT INTO chats VALUES (?, ?, ?)", chats)
+        insert_messages(conn, messages)
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def insert_messages(conn, messages, replace=False):
+    verb = "INSERT OR REPLACE" if replace else "INSERT"
+    conn.executemany(
+        f"{verb} INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)",
+        messages,
+    )
+
+
+def write(path, sql, params=()):
+    """Run one write statement through a separate connection, as the bridge would."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
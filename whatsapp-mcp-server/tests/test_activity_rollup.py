@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import db
+import whatsapp
+from fixtures import create_bridge_db, write
+
+
+GROUP = "120363000000000001@g.us"
+OTHER_GROUP = "120363000000000002@g.us"
+
+INSERT = "INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def _ago(**delta):
+    return (datetime.now(timezone.utc) - timedelta(**delta)).isoformat(sep=" ")
+
+
+class ActivityRollupTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        messages = [(f"a{i}", GROUP, "40711111111", "text", _ago(days=1, minutes=i), 0) for i in range(6)]
+        messages += [(f"b{i}", GROUP, "40722222222", "text", _ago(days=3, minutes=i), 0) for i in range(2)]
+        messages.append(("old", GROUP, "40733333333", "text", _ago(days=90), 0))
+        messages.append(("o1", OTHER_GROUP, "40711111111", "text", _ago(days=2), 0))
+        chats = [(GROUP, "Coaching", _ago(days=1)), (OTHER_GROUP, "Alumni", _ago(days=2))]
+        self.db_path = create_bridge_db(self.temp_dir.name, chats=chats, messages=messages)
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_report_counts_window_from_rollup(self):
+        report = whatsapp.get_group_activity_report(GROUP, days=30, include_timeseries=True)
+
+        self.assertEqual(report["total_messages"], 8)
+        self.assertEqual(report["unique_senders"], 2)
+        self.assertEqual(sum(day["count"] for day in report["daily_counts"]), 8)
+        self.assertEqual(sum(sum(hours) for hours in report["hour_of_week_heatmap"].values()), 8)
+        self.assertEqual(len(report["daily_counts"]), 31)
+
+    def test_engagement_tiers_follow_new_messages(self):
+        before = whatsapp.get_member_engagement(GROUP, days=30)
+        write(self.db_path, INSERT, ("b9", GROUP, "40722222222", "text", _ago(minutes=5), 0))
+        after = whatsapp.get_member_engagement(GROUP, days=30)
+
+        self.assertEqual([(m["sender"], m["message_count"], m["classification"]) for m in before["members"]],
+                         [("40711111111", 6, "moderate"), ("40722222222", 2, "inactive")])
+        self.assertEqual(after["total_messages"], 9)
+        self.assertEqual(after["members"][1]["message_count"], 3)
+
+    def test_fallback_without_index_matches_rollup(self):
+        indexed = whatsapp.get_group_activity_report(GROUP, days=30)
+        with mock.patch.object(whatsapp, "_message_index_db", return_value=None):
+            scanned = whatsapp.get_group_activity_report(GROUP, days=30)
+
+        self.assertEqual(indexed, scanned)
+
+    def test_batch_reports_per_chat_and_totals(self):
+        report = whatsapp.get_group_activity_batch(chat_jid_pattern="%@g.us", days=30)
+
+        self.assertEqual(report["chats_analyzed"], 2)
+        self.assertEqual(report["chats"][GROUP]["total_messages"], 8)
+        self.assertEqual(report["chats"][OTHER_GROUP]["total_messages"], 1)
+        self.assertEqual(report["totals"]["total_messages"], 9)
+        self.assertEqual(report["totals"]["unique_senders"], 2)
+
+    def test_engagement_batch_uses_community_sub_groups(self):
+        sub_groups = {"success": True, "groups": [{"jid": GROUP, "name": "Coaching"}, {"jid": OTHER_GROUP, "name": "Alumni"}]}
+        with mock.patch.object(whatsapp, "get_sub_groups", return_value=sub_groups):
+            report = whatsapp.get_member_engagement_batch(community_jid="120363000000000000@g.us", days=30)
+
+        self.assertEqual(report["chats"][GROUP]["tiers"]["moderate"], 1)
+        self.assertNotIn("members", report["chats"][GROUP])
+        self.assertEqual(report["totals"]["members"][0]["message_count"], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
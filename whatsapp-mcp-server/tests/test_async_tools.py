@@ -0,0 +1,60 @@
+import threading
+import unittest
+from unittest import mock
+
+import anyio
+import httpx
+
+import bridge
+import main
+
+
+class AsyncToolTests(unittest.TestCase):
+    def test_parallel_execute_tool_calls_overlap(self):
+        both_running = threading.Barrier(2, timeout=5)
+
+        def slow_tool():
+            # Only returns if the second call is running at the same time
+            both_running.wait()
+            return "done"
+
+        registry = {"slow_tool": {"fn": slow_tool, "description": "", "tags": []}}
+        results = []
+
+        async def call():
+            results.append(await main.execute_tool("slow_tool"))
+
+        async def run_both():
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(call)
+                tg.start_soon(call)
+
+        with mock.patch.dict(main.TOOL_REGISTRY, registry):
+            anyio.run(run_both)
+
+        self.assertEqual(results, ["done", "done"])
+
+    def test_offloaded_tools_keep_their_parameter_schema(self):
+        tools = {tool.name: tool for tool in anyio.run(main.mcp.list_tools)}
+
+        self.assertIn("cursor", tools["list_messages"].inputSchema["properties"])
+        self.assertIn("sort_by", tools["list_chats"].inputSchema["properties"])
+
+    def test_connection_status_uses_async_client(self):
+        def handle(request):
+            return httpx.Response(200, json={"connected": True, "logged_in": True})
+
+        async def status():
+            bridge._async_client = bridge._build_async_client(httpx.MockTransport(handle))
+            try:
+                return await main.connection()
+            finally:
+                await bridge._async_client.aclose()
+
+        bridge.close()
+        self.addCleanup(bridge.close)
+        self.assertTrue(anyio.run(status)["connected"])
+
+
+if __name__ == "__main__":
+    unittest.main()
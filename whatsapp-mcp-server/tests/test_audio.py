@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+import audio
+import bridge
+import db
+import media
+import whatsapp
+
+
+def fake_ffmpeg(cmd, **kwargs):
+    # Stand-in for ffmpeg: "encodes" by copying the input to the output path
+    time.sleep(0.05)
+    shutil.copyfile(cmd[cmd.index("-i") + 1], cmd[-1])
+    return mock.Mock(returncode=0)
+
+
+def fake_ffmpeg_pipe(cmd, **kwargs):
+    # Stand-in for ffmpeg writing to stdout: "encodes" by prefixing the input
+    source = cmd[cmd.index("-i") + 1]
+    if source == "pipe:0":
+        data = kwargs["input"]
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+    assert cmd[-1] == "pipe:1"
+    return mock.Mock(returncode=0, stdout=b"OggS" + data)
+
+
+class AudioCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        cache_dir = mock.patch.object(media, "CACHE_DIR", os.path.join(self.temp_dir.name, "cache"))
+        cache_dir.start()
+        self.addCleanup(cache_dir.stop)
+        self.clip = self.write("clip.mp3", b"voice" * 100)
+
+    def write(self, name, content):
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_same_clip_is_converted_once_for_concurrent_sends(self):
+        paths = []
+        with mock.patch.object(audio.subprocess, "run", side_effect=fake_ffmpeg) as run:
+            threads = [threading.Thread(target=lambda: paths.append(audio.convert_to_opus_ogg_temp(self.clip))) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+            paths.append(audio.convert_to_opus_ogg_temp(self.clip))
+
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertTrue(os.path.isfile(paths[0]))
+        self.assertEqual([name for name in os.listdir(media.CACHE_DIR) if name.endswith(".part.ogg")], [])
+
+    def test_cache_key_covers_content_and_encoding(self):
+        copy = self.write("copy.wav", b"voice" * 100)
+        with mock.patch.object(audio.subprocess, "run", side_effect=fake_ffmpeg) as run:
+            first = audio.convert_to_opus_ogg_temp(self.clip)
+            self.assertEqual(audio.convert_to_opus_ogg_temp(copy), first)
+            self.assertNotEqual(audio.convert_to_opus_ogg_temp(self.clip, bitrate="64k"), first)
+
+        self.assertEqual(run.call_count, 2)
+
+    def test_failed_conversion_is_not_cached(self):
+        error = audio.subprocess.CalledProcessError(1, "ffmpeg", stderr="bad input")
+        with mock.patch.object(audio.subprocess, "run", side_effect=error):
+            with self.assertRaises(RuntimeError):
+                audio.convert_to_opus_ogg_temp(self.clip)
+
+        self.assertEqual(os.listdir(media.CACHE_DIR) if os.path.isdir(media.CACHE_DIR) else [], [])
+
+
+class StreamedAudioTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        self.addCleanup(db.close_all_connections)
+        self.addCleanup(lambda: whatsapp._outbox_for_store().shutdown(timeout=5))
+        for module, name, value in [(media, "CACHE_DIR", os.path.join(self.temp_dir.name, "cache")), (audio, "_memory", audio.OrderedDict())]:
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.clip = os.path.join(self.temp_dir.name, "clip.m4a")
+        with open(self.clip, "wb") as f:
+            f.write(b"voice")
+        self.requests = []
+        bridge.close()
+        self.addCleanup(bridge.close)
+
+    def use_bridge(self, handle):
+        def record(request):
+            self.requests.append(request)
+            return handle(request)
+
+        bridge._client = bridge._build_client(httpx.MockTransport(record))
+
+    def test_bytes_are_piped_through_ffmpeg_and_cached_in_memory(self):
+        with mock.patch.object(audio.subprocess, "run", side_effect=fake_ffmpeg_pipe) as run:
+            self.assertEqual(audio.convert_to_opus_ogg_bytes(b"raw"), b"OggSraw")
+            self.assertEqual(audio.convert_to_opus_ogg_bytes(self.clip), b"OggSvoice")
+            self.assertEqual(audio.convert_to_opus_ogg_bytes(self.clip), b"OggSvoice")
+
+        self.assertEqual(run.call_count, 2)
+        self.assertFalse(os.path.exists(media.CACHE_DIR))
+
+    def test_voice_note_is_streamed_to_the_bridge(self):
+        self.use_bridge(lambda request: httpx.Response(200, json={"success": True, "message": "sent"}))
+
+        with mock.patch.object(audio.subprocess, "run", side_effect=fake_ffmpeg_pipe):
+            self.assertEqual(whatsapp.send_audio_message("40711111111", self.clip), (True, "sent"))
+
+        request = self.requests[0]
+        self.assertEqual(request.url.path, "/api/send_media")
+        self.assertEqual(request.content, b"OggSvoice")
+        self.assertEqual(request.url.params["filename"], "voice.ogg")
+        self.assertTrue(request.url.params["message_id"].startswith("3EB0"))
+
+    def test_bridges_without_streaming_get_a_cached_file(self):
+        def old_bridge(request):
+            if request.url.path == "/api/send_media":
+                return httpx.Response(404, text="404 page not found")
+            return httpx.Response(200, json={"success": True, "message": "sent"})
+
+        self.use_bridge(old_bridge)
+
+        def ffmpeg(cmd, **kwargs):
+            return fake_ffmpeg_pipe(cmd, **kwargs) if cmd[-1] == "pipe:1" else fake_ffmpeg(cmd)
+
+        with mock.patch.object(audio.subprocess, "run", side_effect=ffmpeg):
+            self.assertEqual(whatsapp.send_audio_message("40711111111", self.clip), (True, "sent"))
+
+        body = json.loads(self.requests[1].content)
+        self.assertTrue(body["media_path"].startswith(media.CACHE_DIR))
+        self.assertEqual(body["message_id"], self.requests[0].url.params["message_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
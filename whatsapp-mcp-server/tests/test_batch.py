@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+import bridge
+import whatsapp
+
+
+def mark_read_op(chat):
+    return {"op": "mark_read", "params": {"chat_jid": chat, "sender_jid": "s@s.whatsapp.net", "message_ids": ["m1"]}}
+
+
+class BatchTests(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.direct_reply = threading.Event()
+        self.direct_reply.set()
+        bridge.close()
+        bridge._client = bridge._build_client(httpx.MockTransport(self.handle))
+        self.addCleanup(bridge.close)
+
+    def handle(self, request):
+        body = json.loads(request.content)
+        self.requests.append((request.url.path, body))
+        if request.url.path != "/api/batch":
+            self.direct_reply.wait(5)
+            return httpx.Response(200, json={"success": True, "message": "direct"})
+        results = [
+            {"op": op["op"], "status_code": 200, "success": True, "response": {"success": True, "message": op["params"].get("chat_jid", "")}}
+            if op["params"].get("chat_jid") != "bad@s.whatsapp.net"
+            else {"op": op["op"], "status_code": 400, "success": False, "message": "Invalid JID"}
+            for op in body["operations"]
+        ]
+        return httpx.Response(200, json={"success": True, "results": results})
+
+    def test_operations_are_chunked_and_results_kept_in_order(self):
+        operations = [mark_read_op(f"{i}@s.whatsapp.net") for i in range(5)] + [mark_read_op("bad@s.whatsapp.net")]
+
+        with mock.patch.object(bridge, "BATCH_MAX_OPERATIONS", 4):
+            result = whatsapp.run_batch(operations)
+
+        self.assertEqual([len(body["operations"]) for _, body in self.requests], [4, 2])
+        self.assertEqual((result["succeeded"], result["failed"]), (5, 1))
+        self.assertEqual(result["results"][4]["message"], "4@s.whatsapp.net")
+        self.assertEqual(result["results"][5], {"op": "mark_read", "success": False, "message": "HTTP 400: Invalid JID"})
+
+    def test_unknown_operations_are_rejected_before_sending(self):
+        result = whatsapp.run_batch([mark_read_op("a@s.whatsapp.net"), {"op": "send", "params": {}}])
+
+        self.assertFalse(result["success"])
+        self.assertIn("send", result["message"])
+        self.assertEqual(self.requests, [])
+
+    def test_bridges_without_batch_get_one_request_per_operation(self):
+        def old_bridge(request):
+            self.requests.append((request.url.path, None))
+            if request.url.path == "/api/batch":
+                return httpx.Response(404, text="404 page not found")
+            return httpx.Response(200, json={"success": True, "message": "ok"})
+
+        bridge._client = bridge._build_client(httpx.MockTransport(old_bridge))
+        result = whatsapp.run_batch([mark_read_op("a@s.whatsapp.net"), mark_read_op("b@s.whatsapp.net")])
+
+        self.assertEqual(result["succeeded"], 2)
+        self.assertEqual([path for path, _ in self.requests], ["/api/batch", "/api/mark_read", "/api/mark_read"])
+
+    def test_group_edits_invalidate_cached_metadata(self):
+        whatsapp._metadata_cache.put("group_info", "g@g.us", {"success": True})
+        whatsapp._metadata_cache.put("contact_groups", "c@s.whatsapp.net", {"success": True})
+        self.addCleanup(whatsapp._metadata_cache.clear)
+
+        whatsapp.run_batch([{"op": "update_group_participants", "params": {"jid": "g@g.us", "action": "add", "participants": ["p"]}}])
+
+        self.assertEqual(whatsapp.metadata_cache_stats()["kinds"]["group_info"]["invalidations"], 1)
+        self.assertEqual(whatsapp.metadata_cache_stats()["kinds"]["contact_groups"]["invalidations"], 1)
+
+    def test_actions_made_during_another_share_one_request(self):
+        coalescer = bridge.Coalescer(window=0.2)
+        results = []
+
+        def mark(chat):
+            results.append(whatsapp.mark_read(chat, "s@s.whatsapp.net", ["m1"]))
+
+        # The first call is held in flight while the others arrive
+        self.direct_reply.clear()
+        with mock.patch.object(bridge, "coalescer", coalescer):
+            threads = [threading.Thread(target=mark, args=(f"{i}@s.whatsapp.net",)) for i in range(4)]
+            threads[0].start()
+            while not self.requests:
+                time.sleep(0.001)
+            for thread in threads[1:]:
+                thread.start()
+            while len(coalescer._pending) < 3:
+                time.sleep(0.001)
+            self.direct_reply.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual([path for path, _ in self.requests], ["/api/mark_read", "/api/batch"])
+        self.assertEqual(len(self.requests[1][1]["operations"]), 3)
+        self.assertEqual(sorted(message for _, message in results), [f"{i}@s.whatsapp.net" for i in range(1, 4)] + ["direct"])
+
+    def test_a_lone_action_is_sent_without_waiting(self):
+        with mock.patch.object(bridge, "coalescer", bridge.Coalescer(window=5)):
+            started = time.monotonic()
+            self.assertEqual(whatsapp.mark_read("a@s.whatsapp.net", "s@s.whatsapp.net", ["m1"]), (True, "direct"))
+
+        self.assertLess(time.monotonic() - started, 1)
+
+        self.assertEqual([path for path, _ in self.requests], ["/api/mark_read"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+
+import bridge
+import db
+import whatsapp
+
+
+class BridgeClientTests(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.responses = []
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.addCleanup(db.close_all_connections)
+        self.addCleanup(lambda: whatsapp._outbox_for_store().shutdown(timeout=5))
+        whatsapp.initialize_attachments_path(temp_dir.name)
+        bridge.close()
+        bridge._client = bridge._build_client(httpx.MockTransport(self.handle))
+        sleep = mock.patch.object(bridge.time, "sleep")
+        sleep.start()
+        self.addCleanup(sleep.stop)
+        self.addCleanup(bridge.close)
+
+    def handle(self, request):
+        self.calls.append(request)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def test_idempotent_reads_retry_gateway_errors(self):
+        self.responses = [httpx.Response(503, text="busy"), httpx.Response(200, json={"success": True, "group": {}})]
+
+        result = whatsapp._load_group_info("g@g.us")
+
+        self.assertTrue(result["success"])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_writes_are_not_retried_after_a_timeout(self):
+        self.responses = [httpx.ReadTimeout("slow"), httpx.Response(200, json={"success": True})]
+
+        success, message = whatsapp.create_poll("g@g.us", "Cand?", ["Luni", "Marti"])
+
+        self.assertFalse(success)
+        self.assertIn("Request error", message)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_writes_retry_when_the_connection_was_refused(self):
+        self.responses = [httpx.ConnectError("refused"), httpx.Response(200, json={"success": True, "message": "sent"})]
+
+        self.assertEqual(whatsapp.send_message("40711111111", "salut"), (True, "sent"))
+
+    def test_circuit_opens_after_repeated_failures_and_fails_fast(self):
+        self.responses = [httpx.ConnectError("refused")] * bridge.BREAKER_THRESHOLD
+
+        for _ in range(2):
+            whatsapp.set_status_message("in concediu")
+        calls_before = len(self.calls)
+        success, message = whatsapp.set_status_message("in concediu")
+
+        self.assertFalse(success)
+        self.assertIn("circuit open", message)
+        self.assertEqual(len(self.calls), calls_before)
+        self.assertEqual(bridge.stats()["state"], "open")
+
+    def test_probe_after_cooldown_closes_the_circuit(self):
+        self.responses = [httpx.ConnectError("refused")] * bridge.BREAKER_THRESHOLD
+        for _ in range(2):
+            whatsapp.set_status_message("in concediu")
+
+        self.responses = [httpx.Response(200, json={"connected": True, "logged_in": True})]
+        with mock.patch.object(bridge.time, "monotonic", return_value=bridge.time.monotonic() + bridge.BREAKER_COOLDOWN):
+            status = whatsapp.connection_status()
+
+        self.assertTrue(status["connected"])
+        self.assertEqual(bridge.stats()["state"], "closed")
+
+    def test_probe_that_raises_unexpectedly_lets_the_next_call_probe(self):
+        self.responses = [httpx.ConnectError("refused")] * bridge.BREAKER_THRESHOLD
+        for _ in range(2):
+            whatsapp.set_status_message("in concediu")
+
+        self.responses = [RuntimeError("boom"), httpx.Response(200, json={"connected": True, "logged_in": True})]
+        with mock.patch.object(bridge.time, "monotonic", return_value=bridge.time.monotonic() + bridge.BREAKER_COOLDOWN):
+            with self.assertRaises(RuntimeError):
+                bridge.request("status", method="GET")
+            status = whatsapp.connection_status()
+
+        self.assertTrue(status["connected"])
+        self.assertEqual(bridge.stats()["state"], "closed")
+
+    def test_http_errors_keep_the_helper_return_shape(self):
+        self.responses = [httpx.Response(500, text="boom")]
+
+        success, message, jid = whatsapp.create_group("Coaching", ["40711111111"])
+
+        self.assertFalse(success)
+        self.assertEqual(message, "HTTP 500: boom")
+        self.assertIsNone(jid)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+
+import db
+import main
+import whatsapp
+from fixtures import create_bridge_db, write
+
+
+ANA = "40711111111@s.whatsapp.net"
+BOGDAN = "40722222222@s.whatsapp.net"
+GROUP = "120363000000000001@g.us"
+
+INSERT = "INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+class ChatSummaryTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        self.db_path = create_bridge_db(
+            self.temp_dir.name,
+            chats=[
+                (ANA, "Ana", "2024-03-05 10:05:00+00:00"),
+                (BOGDAN, "Bogdan", "2024-03-05 09:00:00+00:00"),
+                (GROUP, "Coaching", "2024-03-05 11:00:00+00:00"),
+            ],
+            messages=[
+                ("a1", ANA, "40711111111", "salut", "2024-03-05 10:00:00+00:00", 0),
+                ("a2", ANA, "me", "buna", "2024-03-05 10:01:00+00:00", 1),
+                ("a3", ANA, "40711111111", "ai timp maine?", "2024-03-05 10:04:00+00:00", 0),
+                # Stored with another offset: same instant as 10:05 UTC
+                ("a4", ANA, "40711111111", "la 10?", "2024-03-05 12:05:00+02:00", 0),
+                ("b1", BOGDAN, "40722222222", "multumesc", "2024-03-05 09:00:00+00:00", 0),
+                ("g1", GROUP, "40722222222", "intrebare", "2024-03-05 11:00:00+00:00", 0),
+            ],
+        )
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_chat_carries_last_message_and_counters(self):
+        chat = whatsapp.get_chat(ANA)
+
+        self.assertEqual(chat.last_message, "la 10?")
+        self.assertEqual(chat.message_count, 4)
+        self.assertEqual(chat.unanswered_count, 2)
+        self.assertTrue(chat.awaiting_reply)
+        self.assertEqual(chat.last_outbound_time, "2024-03-05 10:01:00+00:00")
+
+    def test_reply_clears_awaiting_and_restored_messages_are_not_recounted(self):
+        whatsapp.get_chat(ANA)
+        write(self.db_path, INSERT, ("a5", ANA, "me", "da", "2024-03-05 10:06:00+00:00", 1))
+        write(self.db_path, INSERT.replace("INSERT", "INSERT OR REPLACE"),
+              ("a1", ANA, "40711111111", "salut!", "2024-03-05 10:00:00+00:00", 0))
+
+        chat = whatsapp.get_chat(ANA)
+
+        self.assertEqual(chat.message_count, 5)
+        self.assertEqual(chat.unanswered_count, 0)
+        self.assertFalse(chat.awaiting_reply)
+        self.assertEqual(chat.last_message, "da")
+
+    def test_inbox_lists_awaiting_direct_chats_newest_first(self):
+        self.assertEqual([chat.jid for chat in whatsapp.get_inbox()], [ANA, BOGDAN])
+        self.assertEqual([chat.jid for chat in whatsapp.get_inbox(include_groups=True)], [GROUP, ANA, BOGDAN])
+
+    def test_inbox_cursor_pages_do_not_shift_when_messages_arrive(self):
+        first, cursor = whatsapp.get_inbox_page(limit=1, include_groups=True)
+        # A new message moves Bogdan to the top; offset paging would show Group again
+        write(self.db_path, INSERT, ("b2", BOGDAN, "40722222222", "?", "2024-03-05 12:00:00+00:00", 0))
+        second, cursor = whatsapp.get_inbox_page(limit=1, include_groups=True, cursor=cursor)
+        last, cursor = whatsapp.get_inbox_page(limit=1, include_groups=True, cursor=cursor)
+
+        self.assertEqual([chat.jid for chat in first + second + last], [GROUP, ANA])
+        self.assertEqual([chat.jid for chat in whatsapp.get_inbox(limit=1, page=1, include_groups=True)], [GROUP])
+
+    def test_paginated_inbox_tool_returns_a_cursor_while_chats_remain(self):
+        first = main._get_chat_info("inbox", limit=2, include_groups=True, paginate=True)
+        rest = main._get_chat_info("inbox", limit=2, include_groups=True, cursor=first["next_cursor"])
+
+        self.assertEqual([chat.jid for chat in first["chats"] + rest["chats"]], [GROUP, ANA, BOGDAN])
+        self.assertIsNone(rest["next_cursor"])
+        self.assertIsInstance(main._get_chat_info("inbox"), list)
+
+    def test_list_chats_reads_last_message_from_summary(self):
+        chats = {chat.jid: chat for chat in whatsapp.list_chats()}
+
+        # chats.last_message_time (+00:00) never equals a4's stored text (+02:00)
+        self.assertEqual(chats[ANA].last_message, "la 10?")
+        self.assertEqual(chats[BOGDAN].message_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
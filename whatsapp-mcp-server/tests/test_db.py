@@ -0,0 +1,83 @@
+import gc
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import db
+
+
+class ReadOnlyConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "messages.db")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("CREATE TABLE chats (jid TEXT PRIMARY KEY, name TEXT)")
+            conn.execute("INSERT INTO chats VALUES ('1@s.whatsapp.net', 'Ana')")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_connection_is_reused_within_a_thread(self):
+        first = db.get_readonly_connection(self.db_path)
+        second = db.get_readonly_connection(self.db_path)
+
+        self.assertIs(first, second)
+
+    def test_threads_get_their_own_connection(self):
+        main_conn = db.get_readonly_connection(self.db_path)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(db.get_readonly_connection(self.db_path)))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(main_conn, other[0])
+
+    def test_connections_close_when_their_thread_exits(self):
+        opened = []
+        thread = threading.Thread(target=lambda: opened.append(db.get_readonly_connection(self.db_path)))
+        thread.start()
+        thread.join()
+        del thread
+        gc.collect()
+
+        with self.assertRaises(sqlite3.ProgrammingError):
+            opened[0].execute("SELECT 1")
+
+    def test_connection_rejects_writes(self):
+        conn = db.get_readonly_connection(self.db_path)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO chats VALUES ('2@s.whatsapp.net', 'Ion')")
+
+    def test_sees_rows_committed_by_other_writers(self):
+        conn = db.get_readonly_connection(self.db_path)
+        writer = sqlite3.connect(self.db_path)
+        try:
+            writer.execute("INSERT INTO chats VALUES ('2@s.whatsapp.net', 'Ion')")
+            writer.commit()
+        finally:
+            writer.close()
+
+        count = conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+        self.assertEqual(count, 2)
+
+    def test_close_all_connections_reopens_lazily(self):
+        first = db.get_readonly_connection(self.db_path)
+        db.close_all_connections()
+
+        second = db.get_readonly_connection(self.db_path)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.execute("SELECT name FROM chats").fetchone()[0], "Ana")
+
+
+if __name__ == "__main__":
+    unittest.main()
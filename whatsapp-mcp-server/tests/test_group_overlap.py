@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+import whatsapp
+
+
+MEMBERS = {
+    "g1@g.us": ["a", "b", "c"],
+    "g2@g.us": ["b", "c", "d"],
+    "g3@g.us": ["c", "e"],
+}
+
+
+def fake_group_info(jid):
+    if jid not in MEMBERS:
+        return {"success": False, "message": "not found"}
+    participants = [{"jid": f"{member}@s.whatsapp.net"} for member in MEMBERS[jid]]
+    return {"success": True, "group": {"jid": jid, "name": jid.split("@")[0].upper(), "participants": participants}}
+
+
+class GroupOverlapTests(unittest.TestCase):
+    def setUp(self):
+        whatsapp._metadata_cache.clear()
+        patcher = mock.patch.object(whatsapp, "_load_group_info", side_effect=fake_group_info)
+        self.group_info = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_common_and_unique_members(self):
+        result = whatsapp.get_group_overlap(list(MEMBERS), include_members=True)
+
+        self.assertEqual(result["common_members"], ["c@s.whatsapp.net"])
+        self.assertEqual(result["unique_per_group"], {
+            "G1": ["a@s.whatsapp.net"],
+            "G2": ["d@s.whatsapp.net"],
+            "G3": ["e@s.whatsapp.net"],
+        })
+        self.assertEqual(result["total_members"], 5)
+
+    def test_pairwise_matrices(self):
+        result = whatsapp.get_group_overlap(list(MEMBERS))
+
+        self.assertEqual(result["overlap_matrix"], [[3, 2, 1], [2, 3, 1], [1, 1, 2]])
+        self.assertEqual(result["jaccard_matrix"][0][1], 0.5)
+        self.assertEqual(result["jaccard_matrix"][0][2], 0.25)
+
+    def test_successful_lookups_are_reused_from_cache(self):
+        whatsapp.get_group_overlap(["g1@g.us", "g2@g.us"])
+        whatsapp.get_group_overlap(["g2@g.us", "g1@g.us", "missing@g.us"])
+
+        fetched = sorted(call.args[0] for call in self.group_info.call_args_list)
+        self.assertEqual(fetched, ["g1@g.us", "g2@g.us", "missing@g.us"])
+        whatsapp.get_group_overlap(["missing@g.us", "g1@g.us"])
+        self.assertEqual(self.group_info.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
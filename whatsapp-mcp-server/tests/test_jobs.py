@@ -0,0 +1,203 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import bridge
+import db
+import jobs
+import media
+import whatsapp
+
+
+class JobEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, jobs.STATE_DB_NAME)
+        self.sent = []
+        self.engines = []
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.shutdown(timeout=5)
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def engine(self, handler=None, repeatable=()):
+        def record(target, params):
+            self.sent.append(target)
+            return True, "sent"
+
+        engine = jobs.JobEngine(self.db_path, {"broadcast": handler or record}, repeatable=repeatable)
+        self.engines.append(engine)
+        return engine
+
+    def test_job_sends_every_target_and_reports_progress(self):
+        engine = self.engine()
+        job_id = engine.submit("broadcast", ["a", "b", "c"], {"message": "salut"})
+        self.assertTrue(engine.wait(job_id, timeout=5))
+
+        status = engine.status(job_id)
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual(status["counts"]["sent"], 3)
+        self.assertEqual(status["done"], 3)
+        self.assertEqual(self.sent, ["a", "b", "c"])
+
+    def test_cancel_keeps_pending_items_for_resume(self):
+        release = threading.Event()
+
+        def blocking(target, params):
+            release.wait(5)
+            self.sent.append(target)
+            return True, "sent"
+
+        engine = self.engine(blocking)
+        job_id = engine.submit("broadcast", ["a", "b", "c"], {})
+        time.sleep(0.1)
+        self.assertEqual(engine.cancel(job_id)[0], True)
+        release.set()
+        engine.wait(job_id, timeout=5)
+
+        status = engine.status(job_id)
+        self.assertEqual((status["status"], status["counts"]["sent"], status["counts"]["pending"]), ("cancelled", 1, 2))
+
+        self.assertTrue(engine.resume(job_id)[0])
+        engine.wait(job_id, timeout=5)
+        self.assertEqual(engine.status(job_id)["status"], "completed")
+        self.assertEqual(self.sent, ["a", "b", "c"])
+
+    def test_recovery_skips_sent_and_in_doubt_items(self):
+        engine = self.engine()
+        conn = engine._db()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, rate, concurrency, created_at, updated_at) "
+                "VALUES ('j1', 'broadcast', 'running', '{}', 0, 1, 0, 0)"
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, seq, target, status) VALUES ('j1', ?, ?, ?)",
+                [(0, "a", "sent"), (1, "b", "sending"), (2, "c", "pending")],
+            )
+
+        self.assertEqual(engine.recover(), ["j1"])
+        engine.wait("j1", timeout=5)
+
+        self.assertEqual(self.sent, ["c"])
+        self.assertEqual(engine.status("j1")["counts"]["unknown"], 1)
+
+    def test_recovery_retries_interrupted_items_of_repeatable_kinds(self):
+        engine = self.engine(repeatable=("broadcast",))
+        conn = engine._db()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, rate, concurrency, created_at, updated_at) "
+                "VALUES ('j1', 'broadcast', 'running', '{}', 0, 1, 0, 0)"
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, seq, target, status) VALUES ('j1', ?, ?, ?)",
+                [(0, "a", "sent"), (1, "b", "sending"), (2, "c", "pending")],
+            )
+
+        engine.recover()
+        engine.wait("j1", timeout=5)
+
+        self.assertEqual(self.sent, ["b", "c"])
+        self.assertEqual(engine.status("j1")["counts"]["unknown"], 0)
+
+    def test_retry_later_puts_the_item_back(self):
+        attempts = []
+
+        def flaky(target, params):
+            attempts.append(target)
+            if len(attempts) == 1:
+                raise jobs.RetryLater("bridge down")
+            return True, "sent"
+
+        engine = self.engine(flaky)
+        with mock.patch.object(jobs, "RETRY_LATER_SECONDS", 0.01):
+            job_id = engine.submit("broadcast", ["a"], {})
+            engine.wait(job_id, timeout=5)
+
+        self.assertEqual(attempts, ["a", "a"])
+        self.assertEqual(engine.status(job_id)["counts"]["sent"], 1)
+
+    def test_token_bucket_spaces_acquisitions(self):
+        bucket = jobs.TokenBucket(rate=20)
+        stop = threading.Event()
+        started = time.monotonic()
+        for _ in range(3):
+            bucket.acquire(stop)
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class BroadcastJobTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+
+    def tearDown(self):
+        whatsapp._jobs().shutdown(timeout=5)
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_broadcast_returns_a_job_handle_immediately(self):
+        with mock.patch.object(whatsapp.bridge, "post", return_value={"success": True, "message": "sent"}) as post:
+            handle = whatsapp.broadcast_to_groups(["g1@g.us", "g2@g.us", "g1@g.us"], "Anunt", delay_seconds=0)
+            self.assertTrue(handle["success"])
+            self.assertEqual(handle["total"], 2)
+            whatsapp._jobs().wait(handle["job_id"], timeout=5)
+
+        status = whatsapp.get_job_status(handle["job_id"])
+        self.assertEqual(status["counts"]["sent"], 2)
+        self.assertEqual(sorted(call.args[1]["recipient"] for call in post.call_args_list), ["g1@g.us", "g2@g.us"])
+
+    def test_broadcast_resends_keep_each_recipients_message_id(self):
+        with mock.patch.object(whatsapp.bridge, "post", side_effect=bridge.BridgeError("HTTP 500: boom")) as post:
+            handle = whatsapp.broadcast_to_groups(["g1@g.us", "g2@g.us"], "Anunt", delay_seconds=0)
+            whatsapp._jobs().wait(handle["job_id"], timeout=5)
+            whatsapp.resume_job(handle["job_id"], retry_failed=True)
+            whatsapp._jobs().wait(handle["job_id"], timeout=5)
+
+        ids = {}
+        for call in post.call_args_list:
+            self.assertTrue(call.kwargs["idempotent"])
+            ids.setdefault(call.args[1]["recipient"], set()).add(call.args[1]["message_id"])
+        self.assertEqual(post.call_count, 4)
+        self.assertEqual([len(ids["g1@g.us"]), len(ids["g2@g.us"])], [1, 1])
+        self.assertNotEqual(ids["g1@g.us"], ids["g2@g.us"])
+
+    def test_file_broadcast_prepares_the_file_in_the_job(self):
+        video = os.path.join(self.temp_dir.name, "promo.mov")
+        with open(video, "wb") as f:
+            f.write(b"video")
+        prepared = media.PreparedMedia(video + ".mp4", thumbnail_path=video + ".jpg", processed=True)
+        release = threading.Event()
+
+        def slow_prepare(path):
+            release.wait(5)
+            return prepared
+
+        with mock.patch.object(whatsapp.media, "prepare", side_effect=slow_prepare) as prepare, \
+                mock.patch.object(whatsapp.bridge, "post", return_value={"success": True, "message": "sent"}) as post:
+            handle = whatsapp.broadcast_to_groups(["g1@g.us", "g2@g.us", "g3@g.us"], "Promo", delay_seconds=0, media_path=video)
+            # The handle comes back while the conversion is still running
+            self.assertTrue(handle["success"])
+            release.set()
+            whatsapp._jobs().wait(handle["job_id"], timeout=5)
+
+        self.assertTrue(all(call.args == (video,) for call in prepare.call_args_list))
+        payloads = [call.args[1] for call in post.call_args_list]
+        self.assertEqual(len(payloads), 3)
+        self.assertTrue(all(p["media_path"] == prepared.path and p["message"] == "Promo" for p in payloads))
+        self.assertTrue(all(p["thumbnail_path"] == prepared.thumbnail_path for p in payloads))
+
+    def test_file_broadcast_needs_an_existing_file(self):
+        handle = whatsapp.broadcast_to_groups(["g1@g.us"], "", media_path="/nonexistent/promo.mp4")
+        self.assertFalse(handle["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import db
+import media
+import outbox
+import whatsapp
+
+
+class FakeFFmpeg:
+    """Answers ffprobe with fixed stream info and "encodes" by writing the args to the output."""
+
+    def __init__(self, streams):
+        self.streams = streams
+        self.encodes = []
+
+    def __call__(self, cmd, **kwargs):
+        if cmd[0] == "ffprobe":
+            return mock.Mock(returncode=0, stdout=json.dumps({"format": {}, "streams": self.streams}))
+        self.encodes.append(cmd)
+        with open(cmd[-1], "w") as f:
+            f.write(" ".join(cmd))
+        return mock.Mock(returncode=0)
+
+
+class MediaPipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        for name, value in [("CACHE_DIR", os.path.join(self.temp_dir.name, "cache")), ("_probes", media.OrderedDict())]:
+            patcher = mock.patch.object(media, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, name, size=10):
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_large_image_is_resized_once_and_gets_a_thumbnail(self):
+        ffmpeg = FakeFFmpeg([{"codec_type": "video", "width": 4000, "height": 3000, "pix_fmt": "yuvj420p"}])
+        photo = self.write("photo.jpg")
+
+        with mock.patch.object(media.subprocess, "run", side_effect=ffmpeg):
+            first = media.prepare(photo)
+            second = media.prepare(photo)
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.processed and first.path.endswith(".jpg"))
+        self.assertIn("scale=1600:1200", open(first.path).read())
+        self.assertIn("thumbnail,scale=100:100", open(first.thumbnail_path).read())
+        self.assertEqual(len(ffmpeg.encodes), 2)
+
+    def test_transparent_png_stays_png(self):
+        ffmpeg = FakeFFmpeg([{"codec_type": "video", "width": 3200, "height": 800, "pix_fmt": "rgba"}])
+        with mock.patch.object(media.subprocess, "run", side_effect=ffmpeg):
+            prepared = media.prepare(self.write("logo.png"))
+
+        self.assertTrue(prepared.path.endswith(".png"))
+        self.assertNotIn("-q:v", open(prepared.path).read())
+
+    def test_compatible_video_is_sent_as_is(self):
+        ffmpeg = FakeFFmpeg([
+            {"codec_type": "video", "codec_name": "h264", "height": 720},
+            {"codec_type": "audio", "codec_name": "aac"},
+        ])
+        clip = self.write("clip.mp4")
+        with mock.patch.object(media.subprocess, "run", side_effect=ffmpeg):
+            prepared = media.prepare(clip)
+
+        self.assertEqual((prepared.path, prepared.processed), (clip, False))
+        self.assertIsNotNone(prepared.thumbnail_path)
+
+    def test_other_videos_are_transcoded_to_h264_mp4(self):
+        ffmpeg = FakeFFmpeg([{"codec_type": "video", "codec_name": "prores", "height": 2160}])
+        with mock.patch.object(media.subprocess, "run", side_effect=ffmpeg):
+            prepared = media.prepare(self.write("screen.mov"))
+
+        args = open(prepared.path).read()
+        self.assertTrue(prepared.path.endswith(".mp4"))
+        self.assertIn("libx264", args)
+        self.assertIn("scale=-2:720", args)
+        self.assertIn("+faststart", args)
+
+    def test_missing_ffmpeg_sends_the_original(self):
+        photo = self.write("photo.jpg")
+        with mock.patch.object(media.subprocess, "run", side_effect=FileNotFoundError("ffprobe")):
+            self.assertEqual(media.prepare(photo), media.PreparedMedia(photo))
+
+    def test_documents_are_left_alone(self):
+        with mock.patch.object(media.subprocess, "run") as run:
+            report = self.write("report.pdf")
+            self.assertEqual(media.prepare(report), media.PreparedMedia(report))
+
+        run.assert_not_called()
+
+    def test_eviction_drops_least_recently_used_files(self):
+        os.makedirs(media.CACHE_DIR)
+        now = time.time()
+        for age, name in [(300, "old.ogg"), (200, "used.ogg"), (100, "new.ogg"), (400, "x.ogg.1.part.ogg")]:
+            path = os.path.join(media.CACHE_DIR, name)
+            with open(path, "wb") as f:
+                f.write(b"a" * 100)
+            os.utime(path, (now - age, now - age))
+        os.utime(os.path.join(media.CACHE_DIR, "used.ogg"))
+
+        deleted = media.evict(max_bytes=200, min_age=50)
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(sorted(os.listdir(media.CACHE_DIR)), ["new.ogg", "used.ogg"])
+
+    def test_send_file_passes_the_prepared_file_and_thumbnail(self):
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        self.addCleanup(db.close_all_connections)
+        self.addCleanup(lambda: whatsapp._outbox_for_store().shutdown(timeout=5))
+        ffmpeg = FakeFFmpeg([{"codec_type": "video", "width": 4000, "height": 3000, "pix_fmt": "yuvj420p"}])
+
+        with mock.patch.object(media.subprocess, "run", side_effect=ffmpeg), \
+                mock.patch.object(outbox.bridge, "post", return_value={"success": True, "message": "sent"}) as post:
+            self.assertEqual(whatsapp.send_file("40711111111", self.write("photo.jpg")), (True, "sent"))
+
+        payload = post.call_args.args[1]
+        self.assertTrue(payload["media_path"].startswith(media.CACHE_DIR))
+        self.assertTrue(payload["thumbnail_path"].startswith(media.CACHE_DIR))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import bridge
+import db
+import whatsapp
+from fixtures import create_bridge_db, write
+
+
+GROUP = "120363000000000001@g.us"
+OTHER_GROUP = "120363000000000002@g.us"
+
+
+class BulkMediaDownloadTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        path = create_bridge_db(
+            self.temp_dir.name,
+            chats=[(GROUP, "Coaching", "2024-03-05 11:00:00+00:00"), (OTHER_GROUP, "Alumni", "2024-03-05 10:00:00+00:00")],
+            messages=[
+                ("m1", GROUP, "a", "", "2024-03-01 09:00:00+00:00", 0),
+                ("m2", GROUP, "a", "salut", "2024-03-02 09:00:00+00:00", 0),
+                ("m3", GROUP, "b", "", "2024-03-03 09:00:00+00:00", 0),
+                ("m4", GROUP, "b", "", "2024-03-04 09:00:00+00:00", 0),
+                ("m5", OTHER_GROUP, "a", "", "2024-03-04 09:00:00+00:00", 0),
+            ],
+        )
+        for message_id, media_type in [("m1", "image"), ("m3", "video"), ("m4", "image"), ("m5", "image")]:
+            write(path, "UPDATE messages SET media_type = ? WHERE id = ?", (media_type, message_id))
+
+    def tearDown(self):
+        whatsapp._jobs().shutdown(timeout=5)
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def download(self, handler, **filters):
+        with mock.patch.object(whatsapp.bridge, "post", side_effect=handler) as post:
+            handle = whatsapp.download_chat_media(GROUP, **filters)
+            if handle.get("job_id"):
+                whatsapp._jobs().wait(handle["job_id"], timeout=5)
+        return handle, [call.args[1]["message_id"] for call in post.call_args_list]
+
+    def test_every_media_message_in_the_chat_is_downloaded(self):
+        def answer(endpoint, payload, **kwargs):
+            source = "existing" if payload["message_id"] == "m1" else "downloaded"
+            return {"success": True, "path": f"/store/{payload['message_id']}", "source": source}
+
+        handle, requested = self.download(answer)
+
+        self.assertEqual(handle["total"], 3)
+        self.assertEqual(sorted(requested), ["m1", "m3", "m4"])
+        status = whatsapp.get_job_status(handle["job_id"], include_items=True)
+        self.assertEqual(status["counts"]["sent"], 3)
+        messages = {item["target"]: item["message"] for item in status["items"]}
+        self.assertEqual(messages["m1"], "existing: /store/m1")
+
+    def test_filters_narrow_the_messages(self):
+        answer = lambda endpoint, payload, **kwargs: {"success": True, "path": "/store/x"}
+
+        handle, requested = self.download(answer, media_types=["image"], after="2024-03-02")
+        self.assertEqual(requested, ["m4"])
+
+        handle, requested = self.download(answer, before="2024-03-01T12:00:00+00:00")
+        self.assertEqual(requested, ["m1"])
+
+    def test_failed_downloads_are_reported_per_item(self):
+        def answer(endpoint, payload, **kwargs):
+            if payload["message_id"] == "m3":
+                raise bridge.BridgeError("HTTP 500: media expired")
+            return {"success": True, "path": "/store/x"}
+
+        handle, _ = self.download(answer)
+
+        status = whatsapp.get_job_status(handle["job_id"])
+        self.assertEqual((status["counts"]["sent"], status["counts"]["failed"]), (2, 1))
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertFalse(whatsapp.download_chat_media(GROUP, media_types=["gif"])["success"])
+        self.assertFalse(whatsapp.download_chat_media(GROUP, after="yesterday")["success"])
+        self.assertEqual(whatsapp.download_chat_media("empty@g.us")["total"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import re
+import tempfile
+import unittest
+
+import db
+import whatsapp
+from fixtures import create_bridge_db
+
+
+GROUP = "120363000000000001@g.us"
+DIRECT = "40711111111@s.whatsapp.net"
+
+
+def ids_in(output):
+    return re.findall(r"\[ID: (\w+)\]", output)
+
+
+class BatchedContextTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        group_messages = [
+            (f"g{i}", GROUP, "40722222222", f"group message {i}", f"2024-03-05 10:{i:02d}:00+00:00", 0)
+            for i in range(10)
+        ]
+        direct_messages = [
+            (f"d{i}", DIRECT, "40711111111", f"direct message {i}", f"2024-03-05 09:{i:02d}:00+00:00", 0)
+            for i in range(3)
+        ]
+        create_bridge_db(
+            self.temp_dir.name,
+            chats=[(GROUP, "Coaching", "2024-03-05 10:09:00+00:00"), (DIRECT, "Ana", "2024-03-05 09:02:00+00:00")],
+            messages=group_messages + direct_messages,
+        )
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_single_hit_gets_its_window_in_chronological_order(self):
+        output = whatsapp.list_messages(chat_jid=GROUP, query="message 5", context_before=2, context_after=1)
+
+        self.assertEqual(ids_in(output), ["g3", "g4", "g5", "g6"])
+
+    def test_overlapping_windows_merge_without_duplicates(self):
+        output = whatsapp.list_messages(chat_jid=GROUP, after="2024-03-05 10:04:30", before="2024-03-05 10:06:30",
+                                        context_before=1, context_after=1)
+
+        self.assertEqual(ids_in(output), ["g4", "g5", "g6", "g7"])
+
+    def test_windows_stop_at_chat_boundaries(self):
+        output = whatsapp.list_messages(chat_jid=DIRECT, context_before=5, context_after=5, limit=1)
+
+        self.assertEqual(ids_in(output), ["d0", "d1", "d2"])
+
+    def test_windows_in_different_chats_stay_separate(self):
+        output = whatsapp.list_messages(query="message 0", context_before=0, context_after=1)
+
+        self.assertEqual(ids_in(output), ["g0", "g1", "d0", "d1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
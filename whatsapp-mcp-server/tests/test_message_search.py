@@ -0,0 +1,95 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import db
+import message_index
+import whatsapp
+from fixtures import create_bridge_db, write
+
+
+GROUP = "120363000000000001@g.us"
+OTHER_GROUP = "120363000000000002@g.us"
+
+
+class MessageSearchTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        self.db_path = create_bridge_db(
+            self.temp_dir.name,
+            chats=[
+                (GROUP, "Coaching", "2024-03-05 10:03:00+00:00"),
+                (OTHER_GROUP, "Alumni", "2024-03-05 11:00:00+00:00"),
+            ],
+            messages=[
+                ("m1", GROUP, "40711111111", "Întâlnirea de mâine e la ora 10", "2024-03-05 10:00:00+00:00", 0),
+                ("m2", GROUP, "40722222222", "Perfect, ne vedem", "2024-03-05 10:01:00+00:00", 0),
+                ("m3", OTHER_GROUP, "40711111111", "Intalnirea lunara s-a mutat", "2024-03-05 11:00:00+00:00", 0),
+            ],
+        )
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def _write(self, sql, params=()):
+        write(self.db_path, sql, params)
+
+    def test_search_folds_diacritics(self):
+        results = whatsapp.cross_group_search("intalnirea")
+
+        self.assertEqual(sorted(r["message_id"] for r in results), ["m1", "m3"])
+
+    def test_search_respects_chat_pattern(self):
+        results = whatsapp.cross_group_search("intalnirea", chat_jid_pattern=GROUP)
+
+        self.assertEqual([r["message_id"] for r in results], ["m1"])
+
+    def test_search_returns_snippet_instead_of_full_content(self):
+        self._write(
+            "INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)",
+            ("m4", GROUP, "40722222222", " ".join(["cuvant"] * 200) + " agenda", "2024-03-05 10:02:00+00:00", 0),
+        )
+
+        results = whatsapp.cross_group_search("agenda", max_content_length=60)
+
+        self.assertTrue(results[0]["content"].startswith("..."))
+        self.assertTrue(results[0]["content"].endswith("agenda"))
+
+    def test_cold_index_is_built_in_the_background(self):
+        with mock.patch.object(message_index, "INLINE_SYNC_MAX_ROWS", 0), \
+                mock.patch.object(message_index, "sync", wraps=message_index.sync) as sync:
+            results = whatsapp.cross_group_search("s-a mutat")
+            whatsapp._index_sync_thread.join(5)
+
+        # Answered by scanning messages.db; the search itself did not build the index
+        self.assertEqual([r["message_id"] for r in results], ["m3"])
+        self.assertEqual(sync.call_count, 1)
+        conn = message_index.open_index(whatsapp.get_index_db_path(), whatsapp.get_messages_db_path())
+        self.assertEqual(message_index.pending_rows(conn), 0)
+
+    def test_index_picks_up_new_and_restored_messages(self):
+        whatsapp.cross_group_search("intalnirea")
+        self._write(
+            "INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)",
+            ("m5", GROUP, "40722222222", "Sedinta confirmata", "2024-03-05 10:03:00+00:00", 0),
+        )
+        self._write(
+            "INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)",
+            ("m3", OTHER_GROUP, "40711111111", "Sedinta lunara s-a mutat", "2024-03-05 11:00:00+00:00", 0),
+        )
+
+        self.assertEqual(sorted(r["message_id"] for r in whatsapp.cross_group_search("sedinta")), ["m3", "m5"])
+        self.assertEqual([r["message_id"] for r in whatsapp.cross_group_search("intalnirea")], ["m1"])
+
+    def test_list_messages_query_uses_index(self):
+        output = whatsapp.list_messages(query="intalnirea", include_context=False)
+
+        self.assertIn("[ID: m1]", output)
+        self.assertIn("[ID: m3]", output)
+        self.assertNotIn("[ID: m2]", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+
+import whatsapp
+
+
+def group_response(jid, name="Coaching", members=("a", "b", "c")):
+    participants = [{"jid": f"{member}@s.whatsapp.net"} for member in members]
+    return {"success": True, "group": {"jid": jid, "name": name, "participants": participants}}
+
+
+class MetadataCacheTests(unittest.TestCase):
+    def setUp(self):
+        whatsapp._metadata_cache.clear()
+        self.addCleanup(whatsapp._metadata_cache.clear)
+
+    def test_group_info_is_served_from_cache_without_sharing_slices(self):
+        with mock.patch.object(whatsapp, "_load_group_info", side_effect=group_response) as load:
+            first = whatsapp.get_group_info("g@g.us", include_participants=True, participant_limit=1)
+            second = whatsapp.get_group_info("g@g.us")
+            third = whatsapp.get_group_info("g@g.us", include_participants=True)
+
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(len(first["group"]["participants"]), 1)
+        self.assertNotIn("participants", second["group"])
+        self.assertEqual(len(third["group"]["participants"]), 3)
+        self.assertEqual(whatsapp.metadata_cache_stats()["kinds"]["group_info"]["hits"], 2)
+
+    def test_failures_are_not_cached(self):
+        with mock.patch.object(whatsapp, "_load_group_info", return_value={"success": False, "message": "down"}) as load:
+            whatsapp.get_group_info("g@g.us")
+            whatsapp.get_group_info("g@g.us")
+
+        self.assertEqual(load.call_count, 2)
+
+    def test_entries_expire_after_their_ttl(self):
+        with mock.patch.object(whatsapp, "_load_group_info", side_effect=group_response) as load, \
+                mock.patch.object(whatsapp.time, "monotonic", side_effect=[1000.0, 1000.0, 1299.0, 1301.0, 1301.0]):
+            whatsapp.get_group_info("g@g.us")
+            whatsapp.get_group_info("g@g.us")
+            whatsapp.get_group_info("g@g.us")
+
+        self.assertEqual(load.call_count, 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = whatsapp._MetadataCache(max_entries=2)
+        cache.put("group_info", "a", 1)
+        cache.put("group_info", "b", 2)
+        cache.get_or_load("group_info", "a", lambda: None, lambda value: True)
+        cache.put("group_info", "c", 3)
+
+        self.assertEqual(cache.get_or_load("group_info", "b", lambda: "reloaded", lambda value: False), "reloaded")
+        self.assertEqual(cache.get_or_load("group_info", "a", lambda: "reloaded", lambda value: False), 1)
+        self.assertEqual(cache.stats()["kinds"]["group_info"]["evictions"], 1)
+
+    def test_mutations_invalidate_affected_entries(self):
+        with mock.patch.object(whatsapp, "_load_group_info", side_effect=group_response) as load, \
+                mock.patch.object(whatsapp.bridge, "post", return_value={"success": True, "message": "ok"}):
+            whatsapp.get_group_info("g@g.us")
+            whatsapp.get_group_info("other@g.us")
+            whatsapp.set_group_name("g@g.us", "Coaching 2024")
+            whatsapp.get_group_info("g@g.us")
+            whatsapp.get_group_info("other@g.us")
+
+        self.assertEqual([call.args[0] for call in load.call_args_list], ["g@g.us", "other@g.us", "g@g.us"])
+
+    def test_leaving_a_group_drops_its_invite_link(self):
+        link = (True, "ok", "https://chat.whatsapp.com/abc")
+        with mock.patch.object(whatsapp, "_load_group_invite_link", return_value=link) as load, \
+                mock.patch.object(whatsapp.bridge, "post", return_value={"success": True, "message": "ok"}):
+            whatsapp.get_group_invite_link("g@g.us")
+            whatsapp.leave_group("g@g.us")
+            whatsapp.get_group_invite_link("g@g.us")
+
+        self.assertEqual(load.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
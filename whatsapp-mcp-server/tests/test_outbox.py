@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import bridge
+import db
+import outbox
+import whatsapp
+
+
+def delivered(endpoint, payload, **kwargs):
+    return {"success": True, "message": "Message sent"}
+
+
+class OutboxTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+
+    def tearDown(self):
+        whatsapp._outbox_for_store().shutdown(timeout=5)
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_send_is_recorded_with_a_pinned_message_id(self):
+        with mock.patch.object(outbox.bridge, "post", side_effect=delivered) as post:
+            self.assertEqual(whatsapp.send_message("40711111111", "salut", idempotency_key="k1"), (True, "Message sent"))
+
+        payload = post.call_args.args[1]
+        self.assertTrue(payload["message_id"].startswith("3EB0"))
+        status = whatsapp.get_delivery_status(idempotency_key="k1")
+        self.assertEqual((status["status"], status["message_id"]), ("sent", payload["message_id"]))
+
+    def test_repeated_idempotency_key_does_not_send_twice(self):
+        with mock.patch.object(outbox.bridge, "post", side_effect=delivered) as post:
+            whatsapp.send_message("40711111111", "salut", idempotency_key="k1")
+            success, message = whatsapp.send_message("40711111111", "salut din nou", idempotency_key="k1")
+
+        self.assertTrue(success)
+        self.assertIn("not sent again", message)
+        self.assertEqual(post.call_count, 1)
+
+    def test_identical_send_without_key_is_sent_again(self):
+        with mock.patch.object(outbox.bridge, "post", side_effect=delivered) as post:
+            first = whatsapp.send_message("40711111111", "ok")
+            second = whatsapp.send_message("40711111111", "ok")
+
+        self.assertEqual((first, second), ((True, "Message sent"), (True, "Message sent")))
+        self.assertEqual(post.call_count, 2)
+        ids = [call.args[1]["message_id"] for call in post.call_args_list]
+        self.assertNotEqual(ids[0], ids[1])
+
+    def test_unreachable_bridge_queues_and_retries_with_the_same_id(self):
+        responses = [bridge.BridgeUnavailable("Request error: refused"), {"success": True, "message": "Message sent"}]
+
+        def flaky(endpoint, payload, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch.object(outbox.bridge, "post", side_effect=flaky) as post, \
+                mock.patch.object(outbox, "RETRY_BASE_SECONDS", 0.05):
+            success, message = whatsapp.send_message("40711111111", "salut", idempotency_key="k1")
+            self.assertFalse(success)
+            self.assertIn("do not resend", message)
+
+            deadline = time.monotonic() + 5
+            while whatsapp.get_delivery_status(idempotency_key="k1")["status"] != "sent" and time.monotonic() < deadline:
+                time.sleep(0.02)
+
+        self.assertEqual(whatsapp.get_delivery_status(idempotency_key="k1")["status"], "sent")
+        first, second = (call.args[1]["message_id"] for call in post.call_args_list)
+        self.assertEqual(first, second)
+
+    def test_permanent_bridge_errors_fail_without_retrying(self):
+        error = bridge.BridgeError('HTTP 500: {"success":false,"message":"Error parsing JID: unexpected number of @s"}\n')
+        with mock.patch.object(outbox.bridge, "post", side_effect=error) as post:
+            success, message = whatsapp.send_message("bad@@jid", "hi")
+
+        self.assertFalse(success)
+        self.assertIn("Error parsing JID", message)
+        self.assertIn("failed", message)
+        self.assertEqual(post.call_count, 1)
+
+    def test_transient_bridge_errors_are_retried(self):
+        error = bridge.BridgeError('HTTP 500: {"success":false,"message":"Error uploading media: context deadline exceeded"}')
+        self.assertEqual(outbox._classify("send", {"recipient": "x"}, send=mock.Mock(side_effect=error))[0], "retry")
+        self.assertEqual(outbox._classify("send", {"recipient": "x"}, send=mock.Mock(side_effect=bridge.BridgeError("HTTP 502: Bad Gateway")))[0], "retry")
+
+    def test_outbox_from_before_content_hash_removal_is_migrated(self):
+        path = os.path.join(self.temp_dir.name, "old_state.db")
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE outbox (id INTEGER PRIMARY KEY, idempotency_key TEXT UNIQUE, content_hash TEXT NOT NULL,
+                endpoint TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL, last_error TEXT, result TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL);
+            CREATE INDEX idx_outbox_content ON outbox(content_hash, created_at);
+            INSERT INTO outbox VALUES (1, 'k1', 'abc', 'send', '{}', 'sent', 1, 0, NULL, 'ok', 0, 0);
+        """)
+        conn.commit()
+        conn.close()
+
+        box = outbox.Outbox(path)
+        self.addCleanup(box.shutdown, 5)
+        with mock.patch.object(outbox.bridge, "post", side_effect=delivered):
+            record, _ = box.enqueue("send", {"recipient": "x", "message": "salut"})
+
+        self.assertEqual(box.get(idempotency_key="k1")["status"], "sent")
+        self.assertEqual(record["outbox_id"], 2)
+
+    def test_unexpected_error_settles_the_send_and_keeps_the_worker_running(self):
+        responses = [RuntimeError("boom"), {"success": True, "message": "Message sent"}]
+
+        def broken(endpoint, payload, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch.object(outbox.bridge, "post", side_effect=broken):
+            first = whatsapp.send_message("40711111111", "salut", idempotency_key="k1")
+            second = whatsapp.send_message("40711111111", "salut", idempotency_key="k2")
+
+        self.assertFalse(first[0])
+        self.assertEqual(whatsapp.get_delivery_status(idempotency_key="k1")["status"], "unknown")
+        self.assertEqual(second, (True, "Message sent"))
+
+    def test_timeout_without_pinned_id_is_not_resent(self):
+        with mock.patch.object(outbox.bridge, "post", side_effect=bridge.BridgeError("Request error: ReadTimeout")) as post:
+            success, message = whatsapp.newsletter_send("123@newsletter", "Anunt")
+
+        self.assertFalse(success)
+        self.assertIn("unknown", message)
+        self.assertEqual(post.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import re
+import tempfile
+import unittest
+
+import db
+import whatsapp
+from fixtures import create_bridge_db, write
+
+
+GROUP = "120363000000000001@g.us"
+
+
+def ids_in(output):
+    return re.findall(r"\[ID: (\w+)\]", output)
+
+
+def next_cursor(output):
+    match = re.search(r"Next cursor: (\S+)", output)
+    return match.group(1) if match else None
+
+
+class KeysetPaginationTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        # m0..m4 share a timestamp so only the id tie-breaker orders them
+        messages = [(f"m{i}", GROUP, "40722222222", f"message {i}", "2024-03-05 10:00:00+00:00", 0) for i in range(5)]
+        messages += [(f"n{i}", GROUP, "40722222222", f"later {i}", f"2024-03-05 11:0{i}:00+00:00", 0) for i in range(3)]
+        chats = [(f"4070000000{i}@s.whatsapp.net", f"Contact {i}", f"2024-03-0{i + 1} 10:00:00+00:00") for i in range(5)]
+        chats.append(("40711111111@s.whatsapp.net", None, None))
+        chats.append((GROUP, "Coaching", "2024-03-05 11:02:00+00:00"))
+        self.db_path = create_bridge_db(self.temp_dir.name, chats=chats, messages=messages)
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def _all_message_pages(self, limit):
+        seen, cursor = [], None
+        while True:
+            output = whatsapp.list_messages(chat_jid=GROUP, limit=limit, include_context=False, cursor=cursor)
+            seen.extend(ids_in(output))
+            cursor = next_cursor(output)
+            if cursor is None:
+                return seen
+
+    def test_message_cursor_walks_every_message_once(self):
+        self.assertEqual(self._all_message_pages(3), ["n2", "n1", "n0", "m4", "m3", "m2", "m1", "m0"])
+
+    def test_message_cursor_is_stable_when_new_messages_arrive(self):
+        first = whatsapp.list_messages(chat_jid=GROUP, limit=3, include_context=False)
+        write(self.db_path, "INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)",
+              ("z0", GROUP, "40722222222", "newest", "2024-03-05 12:00:00+00:00", 0))
+
+        second = whatsapp.list_messages(chat_jid=GROUP, limit=3, include_context=False, cursor=next_cursor(first))
+
+        self.assertEqual(ids_in(second), ["m4", "m3", "m2"])
+
+    def test_budget_stops_between_messages_and_cursor_resumes(self):
+        first = whatsapp.list_messages(chat_jid=GROUP, limit=8, include_context=False, max_chars=200)
+
+        shown = ids_in(first)
+        self.assertLessEqual(len(first), 200 + 200)
+        self.assertLess(len(shown), 8)
+        rest = whatsapp.list_messages(chat_jid=GROUP, limit=8, include_context=False, cursor=next_cursor(first))
+        self.assertEqual(shown + ids_in(rest), ["n2", "n1", "n0", "m4", "m3", "m2", "m1", "m0"])
+
+    def test_budget_cuts_a_single_oversized_message(self):
+        write(self.db_path, "INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)",
+              ("big", GROUP, "40722222222", "x" * 100000, "2024-03-05 12:00:00+00:00", 0))
+
+        output = whatsapp.list_messages(chat_jid=GROUP, limit=2, include_context=False, max_chars=1000)
+
+        self.assertLess(len(output), 1300)
+        self.assertEqual(ids_in(output), ["big"])
+        self.assertIsNotNone(next_cursor(output))
+
+    def test_chat_cursor_walks_every_chat_once_including_null_sort_keys(self):
+        for sort_by in ("last_active", "name"):
+            seen, cursor = [], None
+            while True:
+                chats, cursor = whatsapp.list_chats_page(limit=4, sort_by=sort_by, cursor=cursor, include_last_message=False)
+                seen.extend(chat.jid for chat in chats)
+                if cursor is None:
+                    break
+            self.assertEqual(len(seen), 7, sort_by)
+            self.assertEqual(len(set(seen)), 7, sort_by)
+
+    def test_cursor_from_another_listing_is_rejected(self):
+        _, cursor = whatsapp.list_chats_page(limit=1)
+
+        with self.assertRaises(ValueError):
+            whatsapp.list_messages(cursor=cursor)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import db
+import whatsapp
+from fixtures import create_bridge_db, write
+
+
+ANA = "40711111111@s.whatsapp.net"
+GROUP = "120363000000000001@g.us"
+OTHER_GROUP = "120363000000000002@g.us"
+QUIET_GROUP = "120363000000000003@g.us"
+
+INSERT = "INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+class ParticipationTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        self.db_path = create_bridge_db(
+            self.temp_dir.name,
+            chats=[
+                (ANA, "Ana", "2024-03-05 09:00:00+00:00"),
+                (GROUP, "Coaching", "2024-03-05 11:00:00+00:00"),
+                (OTHER_GROUP, "Alumni", "2024-03-04 10:00:00+00:00"),
+                (QUIET_GROUP, "Anunturi", "2024-03-03 10:00:00+00:00"),
+            ],
+            messages=[
+                ("d1", ANA, "me", "salut", "2024-03-05 09:00:00+00:00", 1),
+                ("g1", GROUP, "40711111111", "prima", "2024-03-01 10:00:00+00:00", 0),
+                ("g2", GROUP, "40711111111", "a doua", "2024-03-05 10:30:00+00:00", 0),
+                ("g3", GROUP, "40722222222", "altcineva", "2024-03-05 11:00:00+00:00", 0),
+                ("o1", OTHER_GROUP, "40711111111", "alumni", "2024-03-04 10:00:00+00:00", 0),
+                # Contains Ana's number as a substring but is someone else
+                ("q1", QUIET_GROUP, "140711111111", "nu e Ana", "2024-03-03 10:00:00+00:00", 0),
+            ],
+        )
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_contact_chats_come_from_participation(self):
+        chats = whatsapp.get_contact_chats(ANA)
+
+        self.assertEqual([chat.jid for chat in chats], [GROUP, ANA, OTHER_GROUP])
+
+    def test_last_interaction_covers_groups_and_direct_chat(self):
+        self.assertIn("[ID: g2]", whatsapp.get_last_interaction(ANA))
+
+        write(self.db_path, INSERT, ("d2", ANA, "me", "ne vedem?", "2024-03-06 08:00:00+00:00", 1))
+
+        self.assertIn("[ID: d2]", whatsapp.get_last_interaction(ANA))
+
+    def test_journey_counts_exact_sender_per_group(self):
+        groups = [{"jid": GROUP, "name": "Coaching"}, {"jid": OTHER_GROUP, "name": "Alumni"}, {"jid": QUIET_GROUP, "name": "Anunturi"}]
+        with mock.patch.object(whatsapp, "get_contact_groups", return_value=groups):
+            journey = whatsapp.get_participant_journey(ANA)
+
+        by_group = {entry["group_jid"]: entry for entry in journey}
+        self.assertEqual(set(by_group), {GROUP, OTHER_GROUP})
+        self.assertEqual(by_group[GROUP]["message_count"], 2)
+        self.assertEqual(by_group[GROUP]["first_message"], "2024-03-01 10:00:00+00:00")
+        self.assertEqual(by_group[GROUP]["last_message"], "2024-03-05 10:30:00+00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
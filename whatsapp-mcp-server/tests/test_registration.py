@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import bridge
+import db
+import registration
+import whatsapp
+
+
+def answer(endpoint, payload, **kwargs):
+    # Numbers ending in an even digit are registered
+    results = [
+        {"phone": phone, "is_on_whatsapp": int(phone[-1]) % 2 == 0, "jid": f"{phone[1:]}@s.whatsapp.net"}
+        for phone in payload["phones"]
+    ]
+    return {"success": True, "message": f"checked {len(results)} numbers", "results": results}
+
+
+class RegistrationTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_numbers_are_normalized_to_e164(self):
+        self.assertEqual(registration.normalize_phone("+40 730-883-388"), "+40730883388")
+        self.assertEqual(registration.normalize_phone("0040730883388"), "+40730883388")
+        self.assertIsNone(registration.normalize_phone("12345"))
+
+    def test_large_lists_are_chunked_and_deduplicated(self):
+        phones = [f"+4073000{i:04d}" for i in range(25)] + ["0040730000000"]
+
+        with mock.patch.object(registration, "CHUNK_SIZE", 10), \
+                mock.patch.object(registration.bridge, "post", side_effect=answer) as post:
+            result = whatsapp.is_on_whatsapp(phones)
+
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(len(result["results"]), 25)
+        self.assertEqual((result["checked"], result["cache_hits"]), (25, 0))
+        self.assertTrue(result["results"][0]["is_on_whatsapp"])
+
+    def test_repeat_checks_are_served_from_the_cache(self):
+        phones = ["+40730883388", "+40730883381"]
+        with mock.patch.object(registration.bridge, "post", side_effect=answer) as post:
+            whatsapp.is_on_whatsapp(phones)
+            cached = whatsapp.is_on_whatsapp(["40 730 883 388", "+40730883381"])
+            fresh = whatsapp.is_on_whatsapp(phones, max_age=0)
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(cached["cache_hits"], 2)
+        self.assertTrue(all(item["cached"] for item in cached["results"]))
+        self.assertEqual(fresh["cache_hits"], 0)
+
+    def test_unregistered_numbers_expire_sooner(self):
+        with mock.patch.object(registration.bridge, "post", side_effect=answer) as post:
+            whatsapp.is_on_whatsapp(["+40730883388", "+40730883381"])
+            with mock.patch.object(registration.time, "time", return_value=registration.time.time() + 2 * 24 * 3600):
+                result = whatsapp.is_on_whatsapp(["+40730883388", "+40730883381"])
+
+        self.assertEqual(result["cache_hits"], 1)
+        self.assertEqual(post.call_args.args[1]["phones"], ["+40730883381"])
+
+    def test_a_failed_chunk_keeps_the_others(self):
+        def flaky(endpoint, payload, **kwargs):
+            if "+40730000003" in payload["phones"]:
+                raise bridge.BridgeError("Request error: ReadTimeout")
+            return answer(endpoint, payload)
+
+        phones = [f"+4073000000{i}" for i in range(6)]
+        with mock.patch.object(registration, "CHUNK_SIZE", 3), \
+                mock.patch.object(registration.bridge, "post", side_effect=flaky):
+            result = whatsapp.is_on_whatsapp(phones + ["123"])
+
+        self.assertTrue(result["success"])
+        self.assertEqual(len(result["results"]), 3)
+        self.assertEqual(result["failed"], phones[3:])
+        self.assertEqual(result["invalid"], ["123"])
+        self.assertIn("ReadTimeout", result["message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import tempfile
+import unittest
+
+import db
+import whatsapp
+from fixtures import create_bridge_db, write
+
+
+class SenderNameCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        self.db_path = create_bridge_db(
+            self.temp_dir.name,
+            chats=[
+                ("40711111111@s.whatsapp.net", "Ana Pop", None),
+                ("120363000000000001@g.us", "Coaching", None),
+            ],
+        )
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_resolves_full_jid_and_bare_phone_number(self):
+        names = whatsapp.resolve_sender_names(["40711111111@s.whatsapp.net", "40711111111"])
+
+        self.assertEqual(names, {"40711111111@s.whatsapp.net": "Ana Pop", "40711111111": "Ana Pop"})
+
+    def test_unknown_sender_falls_back_to_itself(self):
+        self.assertEqual(whatsapp.get_sender_name("40799999999"), "40799999999")
+
+    def test_picks_up_new_and_renamed_chats(self):
+        whatsapp.get_sender_name("40711111111")
+        write(self.db_path, "INSERT OR REPLACE INTO chats VALUES (?, ?, ?)",
+              ("40711111111@s.whatsapp.net", "Ana Popescu", None))
+        write(self.db_path, "INSERT INTO chats VALUES (?, ?, ?)",
+              ("40722222222@s.whatsapp.net", "Ion", None))
+
+        names = whatsapp.resolve_sender_names(["40711111111", "40722222222"])
+
+        self.assertEqual(names, {"40711111111": "Ana Popescu", "40722222222": "Ion"})
+
+
+if __name__ == "__main__":
+    unittest.main()
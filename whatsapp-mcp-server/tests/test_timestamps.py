@@ -0,0 +1,92 @@
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import db
+import main
+import message_index
+import whatsapp
+from fixtures import create_bridge_db
+
+
+GROUP = "120363000000000001@g.us"
+
+
+def _bridge_time(moment):
+    """Format a datetime the way the bridge's SQLite driver stores it."""
+    return moment.isoformat(sep=" ")
+
+
+class TimestampTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        whatsapp.initialize_attachments_path(self.temp_dir.name)
+        bucharest = timezone(timedelta(hours=2))
+        recent = datetime.now(bucharest) - timedelta(days=2)
+        old = datetime.now(bucharest) - timedelta(days=60)
+        self.db_path = create_bridge_db(
+            self.temp_dir.name,
+            chats=[(GROUP, "Coaching", _bridge_time(recent))],
+            messages=[
+                ("m1", GROUP, "40711111111", "la 10 acasa", "2024-03-05 10:00:00.123456789+02:00", 0),
+                # 09:30 UTC sorts after 10:00+02:00 as text but is half an hour later
+                ("m2", GROUP, "40722222222", "la 9:30 UTC", "2024-03-05 09:30:00+00:00", 0),
+                ("m3", GROUP, "40722222222", "recent", _bridge_time(recent), 0),
+                ("m4", GROUP, "40711111111", "vechi", _bridge_time(old), 0),
+            ],
+        )
+
+    def tearDown(self):
+        db.close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_time_range_compares_instants_not_text(self):
+        output = whatsapp.list_messages(
+            after="2024-03-05T08:15:00+00:00",
+            before="2024-03-05T09:45:00+00:00",
+            include_context=False,
+        )
+
+        self.assertIn("[ID: m2]", output)
+        self.assertNotIn("[ID: m1]", output)
+
+    def test_formatting_keeps_wall_clock_without_parsing(self):
+        output = whatsapp.list_messages(chat_jid=GROUP, query="acasa", include_context=False)
+
+        self.assertIn("[2024-03-05 10:00:00] [ID: m1]", output)
+
+    def test_tools_return_chat_times_as_datetimes(self):
+        chat = main._get_chat_info("get_chat", jid=GROUP)
+        page = main._get_chat_info("get_contact_chats", jid="40711111111@s.whatsapp.net", paginate=True)
+
+        self.assertIsInstance(chat.last_message_time, datetime)
+        self.assertEqual(chat.last_message_time.utcoffset(), timedelta(hours=2))
+        self.assertIsInstance(page["chats"][0].last_message_time, datetime)
+        # The library functions keep the stored text
+        self.assertIsInstance(whatsapp.get_chat(GROUP).last_message_time, str)
+
+    def test_activity_report_handles_zone_suffixes(self):
+        report = whatsapp.get_group_activity_report(GROUP, days=30)
+
+        self.assertEqual(report["total_messages"], 1)
+        self.assertEqual(report["unique_senders"], 1)
+
+    def test_index_built_by_older_schema_is_rebuilt(self):
+        whatsapp.sync_message_index()
+        db.close_all_connections()
+        conn = sqlite3.connect(whatsapp.get_index_db_path())
+        conn.execute("UPDATE index_state SET value = 1 WHERE name = 'schema_version'")
+        conn.execute("DELETE FROM message_times")
+        conn.commit()
+        conn.close()
+
+        index = message_index.open_index(whatsapp.get_index_db_path(), self.db_path)
+        message_index.sync(index)
+
+        count = index.execute("SELECT COUNT(*) FROM message_times").fetchone()[0]
+        self.assertEqual(count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
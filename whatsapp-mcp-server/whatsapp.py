@@ -1,17 +1,30 @@
+import base64
+import hashlib
 import sqlite3
+import threading
 import time
-from datetime import datetime
-from dataclasses import dataclass
-from typing import Any, Dict, Optional, List, Tuple
+from datetime import date, datetime
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, List, Tuple, Union
 import os.path
-import requests
 import json
 import audio
+import bridge
+import db
+import jobs
+import media
+import outbox
+import registration
+import message_index
 import os # Ensure os is imported
 import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # MESSAGES_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge', 'store', 'messages.db')
-WHATSAPP_API_BASE_URL = "http://localhost:8080/api"
+WHATSAPP_API_BASE_URL = bridge.BASE_URL
 
 # WhatsApp Desktop native database (macOS) — fallback for recent messages
 CHATSTORAGE_DB_PATH = os.path.expanduser(
@@ -29,6 +42,9 @@ def initialize_attachments_path(path: str) -> None:
         # For now, let's assume the input path from main.py is already absolute as per arg help text
         print(f"Warning: Attachments path '{path}' is not absolute. This might lead to unexpected behavior.")
     _global_attachments_path = path
+    # Pooled connections point at the previous store; reopen lazily against the new one.
+    db.close_all_connections()
+    _sender_names.reset()
     # You could add a check here to see if the path exists or try to create it,
     # but the Go bridge is primarily responsible for creating it.
     # For the Python side, it's mainly for constructing the DB path.
@@ -40,9 +56,82 @@ def get_messages_db_path() -> str:
     # consistent with how the Go bridge will now store it (e.g., /custom_path/messages.db)
     return os.path.join(_global_attachments_path, 'messages.db')
 
-@dataclass
+
+def get_index_db_path() -> str:
+    """Path of the MCP server's sidecar index, stored next to messages.db."""
+    return os.path.join(os.path.dirname(get_messages_db_path()), message_index.INDEX_DB_NAME)
+
+
+def get_state_db_path() -> str:
+    """Path of the MCP server's job state database, stored next to messages.db."""
+    return os.path.join(os.path.dirname(get_messages_db_path()), jobs.STATE_DB_NAME)
+
+
+def _register_sql_functions(conn: sqlite3.Connection) -> None:
+    conn.create_function("normalize_search", 1, _normalize_search_text, deterministic=True)
+
+
+def _messages_db() -> sqlite3.Connection:
+    """Pooled read-only connection to the bridge's messages.db."""
+    return db.get_readonly_connection(get_messages_db_path(), _register_sql_functions)
+
+
+def _chatstorage_db() -> sqlite3.Connection:
+    """Pooled read-only connection to WhatsApp Desktop's ChatStorage.sqlite."""
+    return db.get_readonly_connection(CHATSTORAGE_DB_PATH, _register_sql_functions)
+
+
+def _message_index_db() -> Optional[sqlite3.Connection]:
+    """Sidecar index connection, synced with messages.db. None if the index can't be used.
+
+    Plain messages.db queries also run on this connection (messages.db is attached).
+    Only a small backlog is indexed inline, and never while another thread is
+    syncing. A cold or far-behind index is built by the background sync, and
+    until it catches up this returns None so callers scan messages.db instead.
+    """
+    try:
+        conn = message_index.open_index(get_index_db_path(), get_messages_db_path())
+        if message_index.pending_rows(conn) > message_index.INLINE_SYNC_MAX_ROWS:
+            _start_index_sync()
+            return None
+        message_index.sync(conn, wait=False)
+        return conn
+    except sqlite3.Error as e:
+        print(f"Message index unavailable, falling back to scanning messages: {e}")
+        return None
+
+
+_index_sync_thread: Optional[threading.Thread] = None
+_index_sync_thread_lock = threading.Lock()
+
+
+def _start_index_sync() -> None:
+    """Run sync_message_index in the background unless it is already running."""
+    global _index_sync_thread
+    with _index_sync_thread_lock:
+        if _index_sync_thread is None or not _index_sync_thread.is_alive():
+            _index_sync_thread = threading.Thread(target=sync_message_index, daemon=True)
+            _index_sync_thread.start()
+
+
+def sync_message_index() -> None:
+    """Bring the sidecar index fully up to date (e.g. at startup, so the first search is fast)."""
+    try:
+        message_index.sync(message_index.open_index(get_index_db_path(), get_messages_db_path()))
+    except sqlite3.Error as e:
+        print(f"Message index unavailable, falling back to scanning messages: {e}")
+
+
+# messages.db rows keep the bridge's timestamp text; it is parsed only where a datetime is needed
+Timestamp = Union[datetime, str]
+
+# Row objects use __slots__: query results build one per row, and a per-instance
+# __dict__ makes them about 50% larger (see benchmarks/bench_row_objects.py).
+
+
+@dataclass(slots=True)
 class Message:
-    timestamp: datetime
+    timestamp: Timestamp
     sender: str
     content: str
     is_from_me: bool
@@ -51,27 +140,32 @@ class Message:
     chat_name: Optional[str] = None
     media_type: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class Chat:
     jid: str
     name: Optional[str]
-    last_message_time: Optional[datetime]
+    last_message_time: Optional[Timestamp]
     last_message: Optional[str] = None
     last_sender: Optional[str] = None
     last_is_from_me: Optional[bool] = None
+    message_count: Optional[int] = None
+    unanswered_count: Optional[int] = None
+    last_inbound_time: Optional[Timestamp] = None
+    last_outbound_time: Optional[Timestamp] = None
+    awaiting_reply: Optional[bool] = None
 
     @property
     def is_group(self) -> bool:
         """Determine if chat is a group based on JID pattern."""
         return self.jid.endswith("@g.us")
 
-@dataclass
+@dataclass(slots=True)
 class Contact:
     phone_number: str
     name: Optional[str]
     jid: str
 
-@dataclass
+@dataclass(slots=True)
 class MessageContext:
     message: Message
     before: List[Message]
@@ -90,79 +184,207 @@ def _normalize_search_text(value: Optional[str]) -> str:
     return without_marks.casefold()
 
 
+class _SenderNameCache:
+    """In-process JID -> display name map over the chats table.
+
+    The map is bulk-loaded once and then refreshed incrementally. The bridge
+    writes chats with INSERT OR REPLACE, so every new or updated chat gets a
+    fresh rowid and only rows above the last seen rowid need re-reading.
+    PRAGMA data_version on a dedicated connection tells cheaply whether anything
+    was committed since the last refresh, so most lookups run no SQL at all.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._max_rowid = 0
+        self._names: Dict[str, Optional[str]] = {}
+        # Phone number (user part of a non-group JID) -> JID, replacing `jid LIKE '%phone%'`
+        self._jids_by_phone: Dict[str, str] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._data_version = None
+            self._max_rowid = 0
+            self._names = {}
+            self._jids_by_phone = {}
+
+    def _refresh(self) -> None:
+        if self._conn is None:
+            self._conn = sqlite3.connect(
+                db.readonly_uri(get_messages_db_path()), uri=True, check_same_thread=False
+            )
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        rows = self._conn.execute(
+            "SELECT rowid, jid, name FROM chats WHERE rowid > ? ORDER BY rowid",
+            (self._max_rowid,),
+        ).fetchall()
+        for rowid, jid, name in rows:
+            self._names[jid] = name
+            if jid and not jid.endswith("@g.us"):
+                self._jids_by_phone.setdefault(jid.split("@")[0].split(":")[0], jid)
+        if rows:
+            self._max_rowid = rows[-1][0]
+        self._data_version = version
+
+    def _lookup(self, sender_jid: str) -> str:
+        if not sender_jid:
+            return sender_jid
+        name = self._names.get(sender_jid)
+        if not name:
+            phone_part = sender_jid.split("@")[0] if "@" in sender_jid else sender_jid
+            jid = self._jids_by_phone.get(phone_part)
+            name = self._names.get(jid) if jid else None
+        return name or sender_jid
+
+    def resolve(self, sender_jids) -> Dict[str, str]:
+        """Map each sender JID (or bare phone number) to a display name, falling back to itself."""
+        with self._lock:
+            try:
+                self._refresh()
+            except sqlite3.Error as e:
+                print(f"Database error while getting sender name: {e}")
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            return {jid: self._lookup(jid) for jid in sender_jids}
+
+
+_sender_names = _SenderNameCache()
+
+
 def get_sender_name(sender_jid: str) -> str:
+    return _sender_names.resolve([sender_jid])[sender_jid]
+
+
+def resolve_sender_names(sender_jids) -> Dict[str, str]:
+    """Resolve many senders at once; one cache refresh for the whole batch."""
+    return _sender_names.resolve(set(sender_jids))
+
+
+@lru_cache(maxsize=8192)
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _as_datetime(value: Timestamp) -> datetime:
+    """Parse a messages.db timestamp on demand (parsed values are cached)."""
+    return value if isinstance(value, datetime) else _parse_timestamp(value)
+
+
+def chat_with_datetimes(chat: Chat) -> Chat:
+    """Copy of chat with its times parsed, the shape tools return.
+
+    Rows keep the bridge's timestamp text so listings don't parse what they
+    never use; tools parse it once on the way out.
+    """
+    def parse(value: Optional[Timestamp]) -> Optional[datetime]:
+        return _as_datetime(value) if value else None
+
+    return replace(
+        chat,
+        last_message_time=parse(chat.last_message_time),
+        last_inbound_time=parse(chat.last_inbound_time),
+        last_outbound_time=parse(chat.last_outbound_time),
+    )
+
+
+def _format_timestamp(value: Timestamp) -> str:
+    """Render as YYYY-MM-DD HH:MM:SS in the sender's wall-clock time.
+
+    The bridge stores "YYYY-MM-DD HH:MM:SS[.fff][+zz:zz]", so the display form
+    is sliced out of the text instead of building a datetime per row.
+    """
+    if isinstance(value, str) and len(value) >= 19 and value[10] in " T":
+        return f"{value[:10]} {value[11:19]}"
+    return f"{_as_datetime(value):%Y-%m-%d %H:%M:%S}"
+
+
+def _epoch_bound(value: str, name: str) -> float:
+    """Parse an ISO-8601 filter bound to Unix seconds (naive values are local time)."""
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        
-        # First try matching by exact JID
-        cursor.execute("""
-            SELECT name
-            FROM chats
-            WHERE jid = ?
-            LIMIT 1
-        """, (sender_jid,))
-        
-        result = cursor.fetchone()
-        
-        # If no result, try looking for the number within JIDs
-        if not result:
-            # Extract the phone number part if it's a JID
-            if '@' in sender_jid:
-                phone_part = sender_jid.split('@')[0]
-            else:
-                phone_part = sender_jid
-                
-            cursor.execute("""
-                SELECT name
-                FROM chats
-                WHERE jid LIKE ? AND jid NOT LIKE '%@g.us'
-                LIMIT 1
-            """, (f"%{phone_part}%",))
-            
-            result = cursor.fetchone()
-        
-        if result and result[0]:
-            return result[0]
-        else:
-            return sender_jid
-        
-    except sqlite3.Error as e:
-        print(f"Database error while getting sender name: {e}")
-        return sender_jid
-    finally:
-        if 'conn' in locals():
-            conn.close()
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid date format for '{name}': {value}. Please use ISO-8601 format.")
 
-def format_message(message: Message, show_chat_info: bool = True) -> None:
-    """Print a single message with consistent formatting."""
-    output = ""
-    
+
+# Default response budget for formatted message listings, in characters
+MAX_RESPONSE_CHARS = 40000
+
+
+def format_message(message: Message, show_chat_info: bool = True, sender_names: Optional[Dict[str, str]] = None) -> str:
+    """Format a single message as one line of output.
+
+    sender_names: Optional pre-resolved names (see resolve_sender_names)
+    """
+    timestamp = _format_timestamp(message.timestamp)
     if show_chat_info and message.chat_name:
-        output += f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] [ID: {message.id}] Chat: {message.chat_name} "
+        header = f"[{timestamp}] [ID: {message.id}] Chat: {message.chat_name} "
     else:
-        output += f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] [ID: {message.id}] "
+        header = f"[{timestamp}] [ID: {message.id}] "
 
     content_prefix = ""
-    if hasattr(message, 'media_type') and message.media_type:
+    if message.media_type:
         content_prefix = f"[{message.media_type} - Chat JID: {message.chat_jid}] "
 
     try:
-        sender_name = get_sender_name(message.sender) if not message.is_from_me else "Me"
-        output += f"From: {sender_name}: {content_prefix}{message.content}\n"
+        if message.is_from_me:
+            sender_name = "Me"
+        elif sender_names is not None and message.sender in sender_names:
+            sender_name = sender_names[message.sender]
+        else:
+            sender_name = get_sender_name(message.sender)
+        return f"{header}From: {sender_name}: {content_prefix}{message.content}\n"
     except Exception as e:
         print(f"Error formatting message: {e}")
-    return output
+        return header
 
-def format_messages_list(messages: List[Message], show_chat_info: bool = True) -> None:
-    output = ""
-    if not messages:
-        output += "No messages to display."
-        return output
-    
+
+def iter_formatted_messages(
+    messages: List[Message],
+    show_chat_info: bool = True,
+    sender_names: Optional[Dict[str, str]] = None,
+) -> Iterator[str]:
+    """Yield one formatted line per message, resolving sender names once up front."""
+    if sender_names is None:
+        sender_names = resolve_sender_names(m.sender for m in messages if not m.is_from_me)
     for message in messages:
-        output += format_message(message, show_chat_info)
-    return output
+        yield format_message(message, show_chat_info, sender_names)
+
+
+def _take_within_budget(chunks: Iterable[str], max_chars: Optional[int]) -> Tuple[List[str], bool]:
+    """Collect chunks until the next one would exceed max_chars. Returns (chunks, truncated).
+
+    Chunks are consumed lazily, so nothing past the budget is formatted. The
+    first chunk is always kept (cut to max_chars if needed) so every page makes progress.
+    """
+    taken: List[str] = []
+    used = 0
+    for chunk in chunks:
+        if max_chars is not None and used + len(chunk) > max_chars:
+            if not taken:
+                taken.append(chunk[:max_chars] + " [truncated]\n")
+            return taken, True
+        taken.append(chunk)
+        used += len(chunk)
+    return taken, False
+
+
+def format_messages_list(messages: List[Message], show_chat_info: bool = True, max_chars: Optional[int] = None) -> str:
+    """Format messages one per line, stopping before the output exceeds max_chars."""
+    if not messages:
+        return "No messages to display."
+
+    lines, truncated = _take_within_budget(iter_formatted_messages(messages, show_chat_info), max_chars)
+    if truncated:
+        lines.append(f"[Output limit reached: showing {len(lines)} of {len(messages)} messages]\n")
+    return "".join(lines)
 
 def _chatstorage_available() -> bool:
     """Check if WhatsApp Desktop ChatStorage.sqlite exists and is readable."""
@@ -181,7 +403,7 @@ def _query_chatstorage_messages(
     if not _chatstorage_available():
         return []
     try:
-        conn = sqlite3.connect(f"file:{CHATSTORAGE_DB_PATH}?mode=ro", uri=True)
+        conn = _chatstorage_db()
         cursor = conn.cursor()
 
         sql_parts = ["""
@@ -253,9 +475,6 @@ def _query_chatstorage_messages(
     except sqlite3.Error as e:
         print(f"ChatStorage fallback error: {e}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def _query_chatstorage_chats(
@@ -267,7 +486,7 @@ def _query_chatstorage_chats(
     if not _chatstorage_available():
         return []
     try:
-        conn = sqlite3.connect(f"file:{CHATSTORAGE_DB_PATH}?mode=ro", uri=True)
+        conn = _chatstorage_db()
         cursor = conn.cursor()
 
         sql_parts = ["""
@@ -315,9 +534,6 @@ def _query_chatstorage_chats(
     except sqlite3.Error as e:
         print(f"ChatStorage chats fallback error: {e}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def _query_chatstorage_contacts(query_text: str) -> List[Contact]:
@@ -325,8 +541,7 @@ def _query_chatstorage_contacts(query_text: str) -> List[Contact]:
     if not _chatstorage_available():
         return []
     try:
-        conn = sqlite3.connect(f"file:{CHATSTORAGE_DB_PATH}?mode=ro", uri=True)
-        conn.create_function("normalize_search", 1, _normalize_search_text)
+        conn = _chatstorage_db()
         cursor = conn.cursor()
 
         pattern = f"%{_normalize_search_text(query_text)}%"
@@ -351,13 +566,25 @@ def _query_chatstorage_contacts(query_text: str) -> List[Contact]:
     except sqlite3.Error as e:
         print(f"ChatStorage contacts fallback error: {e}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
-def _normalize_timestamp(ts: datetime) -> datetime:
+def _message_from_row(row: Tuple) -> Message:
+    """Build a Message from (timestamp, sender, chat_name, content, is_from_me, chat_jid, id, media_type)."""
+    return Message(
+        timestamp=row[0],
+        sender=row[1],
+        chat_name=row[2],
+        content=row[3],
+        is_from_me=row[4],
+        chat_jid=row[5],
+        id=row[6],
+        media_type=row[7]
+    )
+
+
+def _normalize_timestamp(ts: Timestamp) -> datetime:
     """Strip timezone info for consistent comparison."""
+    ts = _as_datetime(ts)
     if ts.tzinfo is not None:
         return ts.replace(tzinfo=None)
     return ts
@@ -379,6 +606,23 @@ def _merge_messages(primary: List[Message], fallback: List[Message]) -> List[Mes
     return merged
 
 
+def _encode_cursor(kind: str, *key: Any) -> str:
+    """Opaque keyset-pagination token: the sort key of the last row on a page."""
+    raw = json.dumps([kind, *key], separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(token: str, kind: str) -> List[Any]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Invalid cursor: {token}")
+    if not isinstance(value, list) or not value or value[0] != kind:
+        raise ValueError(f"Cursor {token} does not belong to this listing")
+    return value[1:]
+
+
 def list_messages(
     after: Optional[str] = None,
     before: Optional[str] = None,
@@ -389,12 +633,30 @@ def list_messages(
     page: int = 0,
     include_context: bool = True,
     context_before: int = 1,
-    context_after: int = 1
-) -> List[Message]:
-    """Get messages matching the specified criteria with optional context."""
+    context_after: int = 1,
+    cursor: Optional[str] = None,
+    max_chars: Optional[int] = MAX_RESPONSE_CHARS
+) -> str:
+    """Get messages matching the specified criteria with optional context.
+
+    Pass the token from a previous page's "Next cursor:" line as cursor to continue
+    after it (keyset pagination); page is then ignored. Output stops before it
+    exceeds max_chars; the cursor then continues from the last match shown.
+    """
+    cursor_key = _decode_cursor(cursor, "messages") if cursor else None
+    row_keys: Dict[str, Tuple[str, str]] = {}
+    page_full = False
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
+        after_ts = _epoch_bound(after, "after") if after else None
+        before_ts = _epoch_bound(before, "before") if before else None
+
+        # Content search and time ranges go through the sidecar index when it is usable
+        fts_match = message_index.fts_query(query) if query else None
+        conn = _message_index_db() if fts_match or after or before else None
+        use_index = conn is not None
+        if not use_index:
+            fts_match = None
+            conn = _messages_db()
         
         # Build base query
         query_parts = ["SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type FROM messages"]
@@ -402,24 +664,25 @@ def list_messages(
         where_clauses = []
         params = []
         
-        # Add filters
-        if after:
-            try:
-                after = datetime.fromisoformat(after)
-            except ValueError:
-                raise ValueError(f"Invalid date format for 'after': {after}. Please use ISO-8601 format.")
-            
-            where_clauses.append("messages.timestamp > ?")
-            params.append(after)
-
-        if before:
-            try:
-                before = datetime.fromisoformat(before)
-            except ValueError:
-                raise ValueError(f"Invalid date format for 'before': {before}. Please use ISO-8601 format.")
-            
-            where_clauses.append("messages.timestamp < ?")
-            params.append(before)
+        # Add filters; timestamps are text with a zone suffix, so ranges compare epoch seconds
+        if after or before:
+            ts_column = "ts" if use_index else "CAST(strftime('%s', messages.timestamp) AS INTEGER)"
+            bounds = []
+            bound_params = []
+            if use_index and chat_jid:
+                bounds.append("chat_jid = ?")
+                bound_params.append(chat_jid)
+            if after:
+                bounds.append(f"{ts_column} > ?")
+                bound_params.append(after_ts)
+            if before:
+                bounds.append(f"{ts_column} < ?")
+                bound_params.append(before_ts)
+            if use_index:
+                where_clauses.append(f"messages.rowid IN (SELECT msg_rowid FROM message_times WHERE {' AND '.join(bounds)})")
+            else:
+                where_clauses.extend(bounds)
+            params.extend(bound_params)
 
         if sender_phone_number:
             where_clauses.append("messages.sender = ?")
@@ -429,82 +692,224 @@ def list_messages(
             where_clauses.append("messages.chat_jid = ?")
             params.append(chat_jid)
             
-        if query:
+        if fts_match:
+            where_clauses.append("messages.rowid IN (SELECT rowid FROM message_fts WHERE message_fts MATCH ?)")
+            params.append(fts_match)
+        elif query:
             where_clauses.append("LOWER(messages.content) LIKE LOWER(?)")
             params.append(f"%{query}%")
+
+        if cursor_key:
+            where_clauses.append("(messages.timestamp, messages.id) < (?, ?)")
+            params.extend(cursor_key)
             
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
-        # Add pagination
-        offset = page * limit
-        query_parts.append("ORDER BY messages.timestamp DESC")
-        query_parts.append("LIMIT ? OFFSET ?")
-        params.extend([limit, offset])
+        # Add pagination; id breaks timestamp ties so keyset pages never overlap
+        query_parts.append("ORDER BY messages.timestamp DESC, messages.id DESC")
+        if cursor_key:
+            query_parts.append("LIMIT ?")
+            params.append(limit)
+        else:
+            query_parts.append("LIMIT ? OFFSET ?")
+            params.extend([limit, page * limit])
         
-        cursor.execute(" ".join(query_parts), tuple(params))
-        messages = cursor.fetchall()
+        messages = conn.execute(" ".join(query_parts), tuple(params)).fetchall()
         
-        result = []
-        for msg in messages:
-            message = Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            )
-            result.append(message)
+        result = [_message_from_row(msg) for msg in messages]
+        row_keys = {msg[6]: (msg[0], msg[6]) for msg in messages}
+        page_full = len(messages) == limit
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         result = []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
     # ChatStorage.sqlite fallback: augment with WhatsApp Desktop native DB
     # Triggers when: no results, or newest message is older than 24h
     needs_fallback = not result
     if result and not needs_fallback:
-        newest = max(_normalize_timestamp(msg.timestamp) for msg in result)
+        newest = _normalize_timestamp(result[0].timestamp)  # rows are newest first
         age = datetime.now() - newest
         needs_fallback = age.total_seconds() > 86400  # 24 hours
 
     if needs_fallback and _chatstorage_available():
-        parsed_after = datetime.fromisoformat(after) if isinstance(after, str) else after
-        parsed_before = datetime.fromisoformat(before) if isinstance(before, str) else before
+        parsed_after = datetime.fromisoformat(after) if after else None
+        parsed_before = datetime.fromisoformat(before) if before else None
+        if cursor_key:
+            cursor_time = datetime.fromisoformat(cursor_key[0])
+            if parsed_before is None or _normalize_timestamp(cursor_time) < _normalize_timestamp(parsed_before):
+                parsed_before = cursor_time
         cs_messages = _query_chatstorage_messages(
             after=parsed_after,
             before=parsed_before,
             chat_jid=chat_jid,
             query_text=query,
             limit=limit,
-            page=page,
+            page=0 if cursor_key else page,
         )
         if cs_messages:
             result = _merge_messages(result, cs_messages)[:limit]
 
-    if include_context and result:
-        # Add context for each message
-        messages_with_context = []
-        for msg in result:
-            try:
-                context = get_message_context(msg.id, context_before, context_after)
-                messages_with_context.extend(context.before)
-                messages_with_context.append(context.message)
-                messages_with_context.extend(context.after)
-            except (ValueError, sqlite3.Error):
-                # Message from ChatStorage won't have context in messages.db
-                messages_with_context.append(msg)
+    if not result:
+        return format_messages_list(result)
+
+    # Each group is printed as a unit: a match on its own, or one context block
+    # shared by the matches whose windows overlap. Groups are (messages, hit indexes).
+    groups: List[Tuple[List[Message], List[int]]] = []
+    if include_context:
+        # Fetch every context window in one query; messages only in ChatStorage
+        # have no context in messages.db and are shown on their own
+        try:
+            blocks = _fetch_context_blocks(result, context_before, context_after)
+        except sqlite3.Error as e:
+            print(f"Database error while fetching context: {e}")
+            blocks = {}
+        group_of_block: Dict[int, Tuple[List[Message], List[int]]] = {}
+        for i, msg in enumerate(result):
+            block = blocks.get(i)
+            if block is None:
+                groups.append(([msg], [i]))
+            elif id(block) in group_of_block:
+                group_of_block[id(block)][1].append(i)
+            else:
+                group_of_block[id(block)] = (block, [i])
+                groups.append(group_of_block[id(block)])
+    else:
+        groups = [([msg], [i]) for i, msg in enumerate(result)]
+
+    sender_names = resolve_sender_names(
+        msg.sender for group, _ in groups for msg in group if not msg.is_from_me
+    )
+    chunks = ("".join(iter_formatted_messages(group, True, sender_names)) for group, _ in groups)
+    shown, truncated = _take_within_budget(chunks, max_chars)
+    output = "".join(shown)
+
+    # Continue after the last messages.db match before the first one not shown
+    next_cursor = None
+    resume_at = len(result)
+    if truncated:
+        shown_hits = {i for _, hits in groups[:len(shown)] for i in hits}
+        resume_at = next((i for i in range(len(result)) if i not in shown_hits), len(result))
+        output += f"[Output limit reached: showing {resume_at} of {len(result)} matches]\n"
+    if page_full or resume_at < len(result):
+        for msg in reversed(result[:resume_at]):
+            if msg.id in row_keys:
+                next_cursor = _encode_cursor("messages", *row_keys[msg.id])
+                break
+
+    return _with_next_cursor(output, next_cursor)
+
+
+def _with_next_cursor(output: str, next_cursor: Optional[str]) -> str:
+    if next_cursor:
+        output += f"Next cursor: {next_cursor}\n"
+    return output
 
-        return format_messages_list(messages_with_context, show_chat_info=True)
 
-    # Format and display messages without context
-    return format_messages_list(result, show_chat_info=True)
+# Batch size for context lookups; keeps bound parameters well under SQLite's limit
+_CONTEXT_HITS_PER_QUERY = 500
+
+_CONTEXT_WINDOWS_SQL = """
+    WITH hits(hit_order, hit_id, hit_chat) AS (VALUES {values}),
+    anchors AS (
+        SELECT
+            h.hit_order,
+            h.hit_id,
+            h.hit_chat,
+            COALESCE(
+                (SELECT b.timestamp FROM messages b
+                 WHERE b.chat_jid = h.hit_chat AND b.timestamp < m.timestamp
+                 ORDER BY b.timestamp DESC LIMIT 1 OFFSET :before - 1),
+                (SELECT MIN(b.timestamp) FROM messages b WHERE b.chat_jid = h.hit_chat)
+            ) AS low,
+            COALESCE(
+                (SELECT a.timestamp FROM messages a
+                 WHERE a.chat_jid = h.hit_chat AND a.timestamp > m.timestamp
+                 ORDER BY a.timestamp ASC LIMIT 1 OFFSET :after - 1),
+                (SELECT MAX(a.timestamp) FROM messages a WHERE a.chat_jid = h.hit_chat)
+            ) AS high
+        FROM hits h
+        JOIN messages m ON m.id = h.hit_id AND m.chat_jid = h.hit_chat
+    ),
+    windowed AS (
+        SELECT
+            a.hit_order,
+            m.rowid AS msg_rowid,
+            m.id,
+            m.chat_jid,
+            m.timestamp,
+            ROW_NUMBER() OVER (PARTITION BY a.hit_order ORDER BY m.timestamp, m.id) AS pos,
+            m.id = a.hit_id AS is_hit
+        FROM anchors a
+        JOIN messages m ON m.chat_jid = a.hit_chat AND m.timestamp BETWEEN a.low AND a.high
+    ),
+    ranked AS (
+        SELECT w.*, MAX(CASE WHEN w.is_hit THEN w.pos END) OVER (PARTITION BY w.hit_order) AS hit_pos
+        FROM windowed w
+    )
+    SELECT r.hit_order, r.msg_rowid,
+        m.timestamp, m.sender, c.name, m.content, m.is_from_me, m.chat_jid, m.id, m.media_type
+    FROM ranked r
+    JOIN messages m ON m.rowid = r.msg_rowid
+    JOIN chats c ON c.jid = m.chat_jid
+    WHERE r.pos BETWEEN r.hit_pos - :before AND r.hit_pos + :after
+    ORDER BY r.hit_order, r.pos
+"""
+
+
+def _fetch_context_blocks(hits: List[Message], before: int, after: int) -> Dict[int, List[Message]]:
+    """Fetch the context windows around many messages at once.
+
+    Windows are ordered by (timestamp, id) within each chat. Windows that share
+    messages are merged into one contiguous block, so nothing is shown twice.
+
+    Returns:
+        Mapping from index in hits to its block. Hits whose windows merged map to
+        the same list object. Hits not found in messages.db are absent.
+    """
+    before = max(before, 0)
+    after = max(after, 0)
+    conn = _messages_db()
+    windows: Dict[int, List[Tuple[int, Tuple[str, str], Message]]] = {}
+    for start in range(0, len(hits), _CONTEXT_HITS_PER_QUERY):
+        chunk = hits[start:start + _CONTEXT_HITS_PER_QUERY]
+        values = ", ".join(f"({start + i}, :id{i}, :chat{i})" for i in range(len(chunk)))
+        params: Dict[str, Any] = {"before": before, "after": after}
+        for i, msg in enumerate(chunk):
+            params[f"id{i}"] = msg.id
+            params[f"chat{i}"] = msg.chat_jid
+        for row in conn.execute(_CONTEXT_WINDOWS_SQL.format(values=values), params):
+            windows.setdefault(row[0], []).append((row[1], (row[2], row[8]), _message_from_row(row[2:])))
+
+    # Union windows that share a message (per chat, rowids are unique per message)
+    parent = {order: order for order in windows}
+
+    def find(order: int) -> int:
+        while parent[order] != order:
+            parent[order] = parent[parent[order]]
+            order = parent[order]
+        return order
+
+    owner: Dict[int, int] = {}
+    for order in sorted(windows):
+        for rowid, _, _ in windows[order]:
+            if rowid in owner:
+                parent[find(order)] = find(owner[rowid])
+            else:
+                owner[rowid] = order
+
+    merged: Dict[int, Dict[int, Tuple[Tuple[str, str], Message]]] = {}
+    for order, rows in windows.items():
+        block = merged.setdefault(find(order), {})
+        for rowid, sort_key, message in rows:
+            block[rowid] = (sort_key, message)
+
+    blocks = {
+        root: [message for _, message in sorted(rows.values(), key=lambda item: item[0])]
+        for root, rows in merged.items()
+    }
+    return {order: blocks[find(order)] for order in windows}
 
 
 def get_message_context(
@@ -514,12 +919,12 @@ def get_message_context(
 ) -> MessageContext:
     """Get context around a specific message."""
     try:
-        conn = sqlite3.connect(get_messages_db_path())
+        conn = _messages_db()
         cursor = conn.cursor()
         
         # Get the target message first
         cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.chat_jid, messages.media_type
+            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type, messages.chat_jid
             FROM messages
             JOIN chats ON messages.chat_jid = chats.jid
             WHERE messages.id = ?
@@ -529,16 +934,7 @@ def get_message_context(
         if not msg_data:
             raise ValueError(f"Message with ID {message_id} not found")
             
-        target_message = Message(
-            timestamp=datetime.fromisoformat(msg_data[0]),
-            sender=msg_data[1],
-            chat_name=msg_data[2],
-            content=msg_data[3],
-            is_from_me=msg_data[4],
-            chat_jid=msg_data[5],
-            id=msg_data[6],
-            media_type=msg_data[8]
-        )
+        target_message = _message_from_row(msg_data)
         
         # Get messages before
         cursor.execute("""
@@ -548,20 +944,9 @@ def get_message_context(
             WHERE messages.chat_jid = ? AND messages.timestamp < ?
             ORDER BY messages.timestamp DESC
             LIMIT ?
-        """, (msg_data[7], msg_data[0], before))
+        """, (msg_data[8], msg_data[0], before))
         
-        before_messages = []
-        for msg in cursor.fetchall():
-            before_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            ))
+        before_messages = [_message_from_row(msg) for msg in cursor.fetchall()]
         
         # Get messages after
         cursor.execute("""
@@ -571,20 +956,9 @@ def get_message_context(
             WHERE messages.chat_jid = ? AND messages.timestamp > ?
             ORDER BY messages.timestamp ASC
             LIMIT ?
-        """, (msg_data[7], msg_data[0], after))
+        """, (msg_data[8], msg_data[0], after))
         
-        after_messages = []
-        for msg in cursor.fetchall():
-            after_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            ))
+        after_messages = [_message_from_row(msg) for msg in cursor.fetchall()]
         
         return MessageContext(
             message=target_message,
@@ -595,9 +969,72 @@ def get_message_context(
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         raise
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+
+def _chat_from_row(row: Tuple) -> Chat:
+    """Build a Chat from the columns selected by _chat_select."""
+    return Chat(
+        jid=row[0],
+        name=row[1],
+        last_message_time=row[2] or None,
+        last_message=row[3],
+        last_sender=row[4],
+        last_is_from_me=None if row[5] is None else bool(row[5]),
+        message_count=row[6],
+        unanswered_count=row[7],
+        last_inbound_time=row[8],
+        last_outbound_time=row[9],
+        awaiting_reply=None if row[10] is None else bool(row[10])
+    )
+
+
+_CHAT_SUMMARY_SELECT = """
+    SELECT
+        chats.jid, chats.name, chats.last_message_time,
+        summary.last_content, summary.last_sender, summary.last_is_from_me,
+        summary.message_count, summary.unanswered_count,
+        summary.last_inbound_time, summary.last_outbound_time, summary.awaiting_reply
+    FROM chats
+    LEFT JOIN chat_summary summary ON summary.chat_jid = chats.jid
+"""
+
+# Without the index the last message is found by matching its timestamp; counters are unknown
+_CHAT_LAST_MESSAGE_SELECT = """
+    SELECT
+        chats.jid, chats.name, chats.last_message_time,
+        last.content, last.sender, last.is_from_me,
+        NULL, NULL, NULL, NULL, NULL
+    FROM chats
+    LEFT JOIN messages last ON last.chat_jid = chats.jid AND last.timestamp = chats.last_message_time
+"""
+
+_CHAT_ONLY_SELECT = "SELECT chats.jid, chats.name, chats.last_message_time, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL FROM chats"
+
+
+def _chat_select(include_last_message: bool = True) -> Tuple[sqlite3.Connection, str]:
+    """Connection and SELECT ... FROM chats clause producing rows for _chat_from_row.
+
+    The last message and counters come from the index's chat_summary table when
+    it is available; WHERE/ORDER BY clauses can refer to chats.* either way.
+    """
+    if not include_last_message:
+        return _messages_db(), _CHAT_ONLY_SELECT
+    conn = _message_index_db()
+    if conn is not None:
+        return conn, _CHAT_SUMMARY_SELECT
+    return _messages_db(), _CHAT_LAST_MESSAGE_SELECT
+
+
+def _chats_after_cursor(cursor_key: List[Any], sort_by: str) -> Tuple[str, List[Any]]:
+    """WHERE clause selecting chats that sort after cursor_key (NULLs sort lowest in SQLite)."""
+    value, jid = cursor_key
+    if sort_by == "last_active":
+        if value is None:
+            return "(chats.last_message_time IS NULL AND chats.jid < ?)", [jid]
+        return "((chats.last_message_time, chats.jid) < (?, ?) OR chats.last_message_time IS NULL)", [value, jid]
+    if value is None:
+        return "((chats.name IS NULL AND chats.jid > ?) OR chats.name IS NOT NULL)", [jid]
+    return "(chats.name, chats.jid) > (?, ?)", [value, jid]
 
 
 def list_chats(
@@ -605,84 +1042,138 @@ def list_chats(
     limit: int = 20,
     page: int = 0,
     include_last_message: bool = True,
-    sort_by: str = "last_active"
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None
 ) -> List[Chat]:
     """Get chats matching the specified criteria."""
+    return list_chats_page(query, limit, page, include_last_message, sort_by, cursor)[0]
+
+
+def list_chats_page(
+    query: Optional[str] = None,
+    limit: int = 20,
+    page: int = 0,
+    include_last_message: bool = True,
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None
+) -> Tuple[List[Chat], Optional[str]]:
+    """Get one page of chats plus the cursor for the next page (None on the last page).
+
+    With a cursor, the page is read with an index seek after the previous page's
+    last chat instead of OFFSET, and page is ignored.
+    """
+    if sort_by != "last_active":
+        sort_by = "name"
+    cursor_key = _decode_cursor(cursor, f"chats:{sort_by}") if cursor else None
+    next_cursor = None
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        
-        # Build base query
-        query_parts = ["""
-            SELECT 
-                chats.jid,
-                chats.name,
-                chats.last_message_time,
-                messages.content as last_message,
-                messages.sender as last_sender,
-                messages.is_from_me as last_is_from_me
-            FROM chats
-        """]
-        
-        if include_last_message:
-            query_parts.append("""
-                LEFT JOIN messages ON chats.jid = messages.chat_jid 
-                AND chats.last_message_time = messages.timestamp
-            """)
-            
+        conn, select = _chat_select(include_last_message)
+        query_parts = [select]
+
         where_clauses = []
         params = []
         
         if query:
             where_clauses.append("(LOWER(chats.name) LIKE LOWER(?) OR chats.jid LIKE ?)")
             params.extend([f"%{query}%", f"%{query}%"])
+
+        if cursor_key:
+            clause, clause_params = _chats_after_cursor(cursor_key, sort_by)
+            where_clauses.append(clause)
+            params.extend(clause_params)
             
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
-        # Add sorting
-        order_by = "chats.last_message_time DESC" if sort_by == "last_active" else "chats.name"
+        # Add sorting; jid breaks ties so keyset pages never overlap
+        order_by = "chats.last_message_time DESC, chats.jid DESC" if sort_by == "last_active" else "chats.name, chats.jid"
         query_parts.append(f"ORDER BY {order_by}")
         
         # Add pagination
-        offset = (page ) * limit
-        query_parts.append("LIMIT ? OFFSET ?")
-        params.extend([limit, offset])
-        
-        cursor.execute(" ".join(query_parts), tuple(params))
-        chats = cursor.fetchall()
+        if cursor_key:
+            query_parts.append("LIMIT ?")
+            params.append(limit)
+        else:
+            query_parts.append("LIMIT ? OFFSET ?")
+            params.extend([limit, page * limit])
         
-        result = []
-        for chat_data in chats:
-            chat = Chat(
-                jid=chat_data[0],
-                name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-                last_message=chat_data[3],
-                last_sender=chat_data[4],
-                last_is_from_me=chat_data[5]
-            )
-            result.append(chat)
+        chats = conn.execute(" ".join(query_parts), tuple(params)).fetchall()
+        result = [_chat_from_row(chat_data) for chat_data in chats]
+        if len(chats) == limit:
+            last = chats[-1]
+            sort_value = last[2] if sort_by == "last_active" else last[1]
+            next_cursor = _encode_cursor(f"chats:{sort_by}", sort_value, last[0])
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         result = []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
     # ChatStorage fallback for chats
-    if not result and _chatstorage_available():
+    if not result and not cursor_key and _chatstorage_available():
         result = _query_chatstorage_chats(query_text=query, limit=limit, page=page)
 
-    return result
+    return result, next_cursor
+
+
+def get_inbox(limit: int = 20, page: int = 0, include_groups: bool = False, cursor: Optional[str] = None) -> List[Chat]:
+    """Chats whose latest message is from the other side, most recently received first.
+
+    Read straight from the index's chat_summary table (one scan of its inbox
+    index); returns an empty list if the index is unavailable.
+    """
+    return get_inbox_page(limit, page, include_groups, cursor)[0]
+
+
+# The inbox pages on last_inbound_ts, selected after the columns _chat_from_row reads
+_INBOX_SELECT = _CHAT_SUMMARY_SELECT.replace("summary.awaiting_reply", "summary.awaiting_reply, summary.last_inbound_ts", 1)
+
+
+def get_inbox_page(
+    limit: int = 20, page: int = 0, include_groups: bool = False, cursor: Optional[str] = None
+) -> Tuple[List[Chat], Optional[str]]:
+    """Get one page of the inbox plus the cursor for the next page (None on the last page).
+
+    With a cursor, the page is read with an index seek after the previous page's
+    last chat, so deep pages do not rescan and do not shift while new messages
+    arrive; page is then ignored.
+    """
+    cursor_key = _decode_cursor(cursor, "inbox") if cursor else None
+    conn = _message_index_db()
+    if conn is None:
+        return [], None
+    sql = _INBOX_SELECT + " WHERE summary.awaiting_reply = 1"
+    params: List[Any] = []
+    if not include_groups:
+        sql += " AND chats.jid NOT LIKE '%@g.us'"
+    if cursor_key:
+        ts, jid = cursor_key
+        if ts is None:
+            sql += " AND summary.last_inbound_ts IS NULL AND chats.jid < ?"
+            params.append(jid)
+        else:
+            sql += " AND ((summary.last_inbound_ts, chats.jid) < (?, ?) OR summary.last_inbound_ts IS NULL)"
+            params.extend([ts, jid])
+    # jid breaks ties so keyset pages never overlap
+    sql += " ORDER BY summary.last_inbound_ts DESC, chats.jid DESC"
+    if cursor_key:
+        sql += " LIMIT ?"
+        params.append(limit)
+    else:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([limit, page * limit])
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return [], None
+    next_cursor = _encode_cursor("inbox", rows[-1][11], rows[-1][0]) if len(rows) == limit else None
+    return [_chat_from_row(row) for row in rows], next_cursor
 
 
 def search_contacts(query: str) -> List[Contact]:
     """Search contacts by name or phone number."""
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        conn.create_function("normalize_search", 1, _normalize_search_text)
+        conn = _messages_db()
         cursor = conn.cursor()
 
         search_pattern = '%' + _normalize_search_text(query) + '%'
@@ -713,9 +1204,6 @@ def search_contacts(query: str) -> List[Contact]:
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         result = []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
     # ChatStorage fallback for contacts
     if not result and _chatstorage_available():
@@ -724,469 +1212,723 @@ def search_contacts(query: str) -> List[Contact]:
     return result
 
 
-def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Chat]:
+def get_contact_chats(jid: str, limit: int = 20, page: int = 0, cursor: Optional[str] = None) -> List[Chat]:
     """Get all chats involving the contact.
     
     Args:
         jid: The contact's JID to search for
         limit: Maximum number of chats to return (default 20)
         page: Page number for pagination (default 0)
+        cursor: Token from get_contact_chats_page to continue after (overrides page)
     """
+    return get_contact_chats_page(jid, limit, page, cursor)[0]
+
+
+def get_contact_chats_page(
+    jid: str, limit: int = 20, page: int = 0, cursor: Optional[str] = None
+) -> Tuple[List[Chat], Optional[str]]:
+    """Get one page of the contact's chats plus the cursor for the next page."""
+    cursor_key = _decode_cursor(cursor, "contact_chats") if cursor else None
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT DISTINCT
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-            JOIN messages m ON c.jid = m.chat_jid
-            WHERE m.sender = ? OR c.jid = ?
-            ORDER BY c.last_message_time DESC
-            LIMIT ? OFFSET ?
-        """, (jid, jid, limit, page * limit))
+        conn, select = _chat_select()
+
+        # The index's participation table lists a sender's chats directly
+        sender = message_index.sender_key(jid)
+        if select is _CHAT_SUMMARY_SELECT:
+            where_clauses = ["(chats.jid = ? OR chats.jid IN (SELECT chat_jid FROM participation WHERE sender = ?))"]
+        else:
+            where_clauses = ["""(chats.jid = ? OR EXISTS (
+                SELECT 1 FROM messages s WHERE s.chat_jid = chats.jid AND s.sender = ?
+            ))"""]
+        params: List[Any] = [jid, sender]
+        if cursor_key:
+            clause, clause_params = _chats_after_cursor(cursor_key, "last_active")
+            where_clauses.append(clause)
+            params.extend(clause_params)
         
-        chats = cursor.fetchall()
+        sql = f"""
+            {select}
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY chats.last_message_time DESC, chats.jid DESC
+        """
+        if cursor_key:
+            sql += " LIMIT ?"
+            params.append(limit)
+        else:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, page * limit])
         
-        result = []
-        for chat_data in chats:
-            chat = Chat(
-                jid=chat_data[0],
-                name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-                last_message=chat_data[3],
-                last_sender=chat_data[4],
-                last_is_from_me=chat_data[5]
-            )
-            result.append(chat)
-            
-        return result
+        chats = conn.execute(sql, tuple(params)).fetchall()
+        next_cursor = None
+        if len(chats) == limit:
+            next_cursor = _encode_cursor("contact_chats", chats[-1][2], chats[-1][0])
+        return [_chat_from_row(chat_data) for chat_data in chats], next_cursor
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
+        return [], None
 
 
-def get_contact_groups(jid: str) -> List[Dict[str, Any]]:
-    """Get all WhatsApp groups where both you and the contact are members.
-    Uses live WhatsApp data (not just message history) so finds ALL common groups.
+# --- Bridge metadata cache ---
 
-    Args:
-        jid: The contact's JID (e.g., "40730883388@s.whatsapp.net") or phone number
-    """
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/get_contact_groups"
-        payload = {"jid": jid}
-        response = requests.post(url, json=payload)
-
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success", False):
-                return result.get("groups", [])
-            else:
-                print(f"Failed: {result.get('message', 'Unknown error')}")
-                return []
-        else:
-            print(f"Error: HTTP {response.status_code} - {response.text}")
-            return []
-    except requests.RequestException as e:
-        print(f"Request error: {str(e)}")
-        return []
-    except json.JSONDecodeError:
-        print(f"Error parsing response: {response.text}")
-        return []
+# Seconds a cached bridge lookup stays fresh, per kind of entity
+METADATA_TTLS = {
+    "group_info": 300,
+    "contact_groups": 600,
+    "sub_groups": 600,
+    "newsletters": 900,
+    "invite_link": 3600,
+}
+# Entries kept across all kinds before the least recently used are evicted
+METADATA_CACHE_SIZE = 1024
 
 
-# --- Group Info & Management ---
+class _MetadataCache:
+    """LRU cache of bridge metadata responses with per-kind TTLs and hit/miss counters.
 
-def get_group_info(jid: str, include_participants: bool = False, participant_limit: int = 50, participant_offset: int = 0) -> Dict[str, Any]:
-    """Get group metadata with optional participant list."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/get_group_info"
-        payload = {"jid": jid}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success") and "group" in result:
-                group = result["group"]
-                participants = group.get("participants", [])
-                group["participant_count"] = len(participants)
-                if not include_participants:
-                    del group["participants"]
-                else:
-                    group["participants"] = participants[participant_offset:participant_offset + participant_limit]
-            return result
-        else:
-            return {"success": False, "message": f"HTTP {response.status_code}: {response.text}"}
-    except requests.RequestException as e:
-        return {"success": False, "message": f"Request error: {str(e)}"}
+    Values are shared between callers and must not be mutated.
+    """
 
+    def __init__(self, max_entries: int) -> None:
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        # (kind, key) -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, counter: str) -> None:
+        counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0})
+        counters[counter] += 1
+
+    def get_or_load(self, kind: str, key: str, load: Callable[[], Any], cacheable: Callable[[Any], bool]) -> Any:
+        """Return the fresh cached value or call load(); results passing cacheable are stored."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end((kind, key))
+                self._count(kind, "hits")
+                return entry[1]
+            self._count(kind, "misses")
+
+        value = load()
+        if cacheable(value):
+            self.put(kind, key, value)
+        return value
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[(kind, key)] = (time.monotonic() + METADATA_TTLS[kind], value)
+            self._entries.move_to_end((kind, key))
+            while len(self._entries) > self._max_entries:
+                (evicted_kind, _), _ = self._entries.popitem(last=False)
+                self._count(evicted_kind, "evictions")
+
+    def invalidate(self, kind: str, key: Optional[str] = None) -> None:
+        """Drop one entry, or every entry of kind when key is None."""
+        with self._lock:
+            if key is not None:
+                removed = [(kind, key)] if (kind, key) in self._entries else []
+            else:
+                removed = [entry_key for entry_key in self._entries if entry_key[0] == kind]
+            for entry_key in removed:
+                del self._entries[entry_key]
+                self._count(kind, "invalidations")
 
-def get_group_invite_link(jid: str, reset: bool = False) -> Tuple[bool, str, str]:
-    """Get or reset group invite link."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/get_group_invite_link"
-        payload = {"jid": jid, "reset": reset}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", ""), result.get("link", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}", ""
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}", ""
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
 
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes: Dict[str, int] = {}
+            for kind, _ in self._entries:
+                sizes[kind] = sizes.get(kind, 0) + 1
+            kinds = {
+                kind: {**self._counters.get(kind, {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}),
+                       "entries": sizes.get(kind, 0), "ttl_seconds": ttl}
+                for kind, ttl in METADATA_TTLS.items()
+            }
+            return {"entries": len(self._entries), "max_entries": self._max_entries, "kinds": kinds}
 
-def set_group_topic(jid: str, topic: str) -> Tuple[bool, str]:
-    """Set group description/topic."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/set_group_topic"
-        payload = {"jid": jid, "topic": topic}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
 
+_metadata_cache = _MetadataCache(METADATA_CACHE_SIZE)
 
-def set_group_announce(jid: str, announce: bool) -> Tuple[bool, str]:
-    """Toggle admin-only messaging for a group."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/set_group_announce"
-        payload = {"jid": jid, "announce": announce}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
 
+def metadata_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters and sizes of the bridge metadata cache."""
+    return _metadata_cache.stats()
 
-def set_group_locked(jid: str, locked: bool) -> Tuple[bool, str]:
-    """Toggle admin-only info editing for a group."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/set_group_locked"
-        payload = {"jid": jid, "locked": locked}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
 
+def _succeeded(result: Any) -> bool:
+    return isinstance(result, dict) and bool(result.get("success"))
 
-def set_group_join_approval(jid: str, mode: bool) -> Tuple[bool, str]:
-    """Toggle join approval mode for a group."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/set_group_join_approval"
-        payload = {"jid": jid, "mode": mode}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
 
+def _invalidates_metadata(targets: Callable[..., List[Tuple[str, Optional[str]]]]):
+    """Decorate a mutating bridge call to drop the cached metadata it affects.
 
-def is_on_whatsapp(phones: List[str]) -> Dict[str, Any]:
-    """Check if phone numbers are registered on WhatsApp."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/is_on_whatsapp"
-        payload = {"phones": phones}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"success": False, "message": f"HTTP {response.status_code}: {response.text}"}
-    except requests.RequestException as e:
-        return {"success": False, "message": f"Request error: {str(e)}"}
+    targets receives the call's arguments and returns (kind, key) pairs; a None
+    key drops every entry of that kind. Entries are dropped after the call, so
+    the next lookup fetches fresh state. This is not a barrier: a lookup that
+    started before the write can still store what it read once the write has
+    finished, and that entry then lives until its TTL expires.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                for kind, key in targets(*args, **kwargs):
+                    _metadata_cache.invalidate(kind, key)
+        return wrapper
+    return decorator
 
 
-# --- Message Operations ---
+def _bridge_call(endpoint: str, payload: Optional[Dict[str, Any]] = None, idempotent: bool = False,
+                 coalesce: bool = False) -> Dict[str, Any]:
+    """Call the bridge, folding transport and HTTP failures into the bridge's own
+    {"success": False, "message": ...} shape so callers handle a single result.
 
-def send_reaction(chat_jid: str, sender_jid: str, message_id: str, reaction: str) -> Tuple[bool, str]:
-    """Send a reaction to a message."""
+    With coalesce, the call may share a /api/batch request with calls made by
+    other threads at the same moment."""
     try:
-        url = f"{WHATSAPP_API_BASE_URL}/send_reaction"
-        payload = {"chat_jid": chat_jid, "sender_jid": sender_jid, "message_id": message_id, "reaction": reaction}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+        if coalesce:
+            return bridge.coalesced(endpoint, payload or {})
+        return bridge.post(endpoint, payload, idempotent=idempotent)
+    except bridge.BridgeError as e:
+        return {"success": False, "message": str(e)}
+
+
+def _bridge_action(endpoint: str, payload: Dict[str, Any], coalesce: bool = False) -> Tuple[bool, str]:
+    """Run a bridge write and return its (success, message) pair."""
+    result = _bridge_call(endpoint, payload, coalesce=coalesce)
+    return result.get("success", False), result.get("message", "")
+
+
+
+_outbox: Optional[outbox.Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def _outbox_for_store() -> outbox.Outbox:
+    """The send outbox for the current store, created on first use."""
+    global _outbox
+    path = get_state_db_path()
+    with _outbox_lock:
+        if _outbox is None or _outbox.db_path != path:
+            if _outbox is not None:
+                _outbox.shutdown(timeout=5)
+            _outbox = outbox.Outbox(path, senders={"send_media": _send_streamed_audio})
+        return _outbox
+
+
+def _send_via_outbox(endpoint: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
+    """Queue a send in the outbox and wait for its first delivery attempt.
+
+    A send that is still queued for retry comes back as (False, message)
+    naming its outbox id; it is delivered later without being sent again.
+    """
+    box = _outbox_for_store()
+    try:
+        record, duplicate = box.enqueue(endpoint, payload, idempotency_key)
+        if not duplicate:
+            wait = bridge.ENDPOINT_TIMEOUTS.get(endpoint, bridge.DEFAULT_TIMEOUT) + 5
+            record = box.wait(record["outbox_id"], wait)
+    except sqlite3.Error as e:
+        print(f"Outbox unavailable, sending directly: {e}")
+        return _bridge_action(endpoint, payload)
+
+    outbox_id, status = record["outbox_id"], record["status"]
+    if status == "sent":
+        note = f"Duplicate of outbox entry {outbox_id}, not sent again: " if duplicate else ""
+        return True, note + (record["result"] or "Sent")
+    if status in ("failed", "unknown"):
+        return False, f"{record['last_error']} (outbox entry {outbox_id}: {status})"
+    reason = record["last_error"] or "waiting for its turn"
+    return False, (
+        f"Not delivered yet ({reason}). Queued as outbox entry {outbox_id} and retried "
+        f"automatically; do not resend, check it with the outbox tool instead."
+    )
+
+
+def get_delivery_status(outbox_id: Optional[int] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+    """Delivery state of one outgoing message, by outbox id or idempotency key."""
+    record = _outbox_for_store().get(outbox_id=outbox_id, idempotency_key=idempotency_key)
+    if record is None:
+        return {"success": False, "message": "No outbox entry matches"}
+    return {"success": True, **record}
+
+
+def list_outbox(status: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Recent outgoing messages and their delivery state, newest first."""
+    return _outbox_for_store().list(status=status, limit=limit)
+
+
+def retry_outbox(outbox_id: int) -> Tuple[bool, str]:
+    """Queue a failed outgoing message again."""
+    return _outbox_for_store().retry(outbox_id)
+
+
+def start_outbox() -> None:
+    """Start delivering sends left queued by a previous server run."""
+    try:
+        _outbox_for_store().start()
+    except sqlite3.Error as e:
+        print(f"Could not start outbox: {e}")
+
+
+def _load_contact_groups(jid: str) -> Optional[List[Dict[str, Any]]]:
+    """Shared groups from the bridge, or None if the lookup failed."""
+    result = _bridge_call("get_contact_groups", {"jid": jid}, idempotent=True)
+    if result.get("success", False):
+        return result.get("groups", [])
+    print(f"Failed: {result.get('message', 'Unknown error')}")
+    return None
+
+
+def get_contact_groups(jid: str) -> List[Dict[str, Any]]:
+    """Get all WhatsApp groups where both you and the contact are members.
+    Uses live WhatsApp data (not just message history) so finds ALL common groups.
+
+    Args:
+        jid: The contact's JID (e.g., "40730883388@s.whatsapp.net") or phone number
+    """
+    groups = _metadata_cache.get_or_load(
+        "contact_groups", jid, lambda: _load_contact_groups(jid), lambda groups: groups is not None
+    )
+    return groups or []
+
+
+# --- Group Info & Management ---
+
+def _load_group_info(jid: str) -> Dict[str, Any]:
+    return _bridge_call("get_group_info", {"jid": jid}, idempotent=True)
+
+
+def get_group_info(jid: str, include_participants: bool = False, participant_limit: int = 50, participant_offset: int = 0) -> Dict[str, Any]:
+    """Get group metadata with optional participant list."""
+    result = _metadata_cache.get_or_load("group_info", jid, lambda: _load_group_info(jid), _succeeded)
+    if not (result.get("success") and "group" in result):
+        return result
+    # The cached response is shared; shape a copy for this caller
+    group = dict(result["group"])
+    participants = group.pop("participants", None) or []
+    group["participant_count"] = len(participants)
+    if include_participants:
+        group["participants"] = participants[participant_offset:participant_offset + participant_limit]
+    return {**result, "group": group}
+
+
+def get_group_invite_link(jid: str, reset: bool = False) -> Tuple[bool, str, str]:
+    """Get or reset group invite link."""
+    if reset:
+        result = _load_group_invite_link(jid, reset=True)
+        _metadata_cache.invalidate("invite_link", jid)
+        if result[0]:
+            _metadata_cache.put("invite_link", jid, result)
+        return result
+    return _metadata_cache.get_or_load(
+        "invite_link", jid, lambda: _load_group_invite_link(jid, reset=False), lambda result: result[0]
+    )
+
+
+def _load_group_invite_link(jid: str, reset: bool) -> Tuple[bool, str, str]:
+    # Resetting revokes the current link, so only plain lookups are retried
+    result = _bridge_call("get_group_invite_link", {"jid": jid, "reset": reset}, idempotent=not reset)
+    return result.get("success", False), result.get("message", ""), result.get("link", "")
+
+
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid)])
+def set_group_topic(jid: str, topic: str) -> Tuple[bool, str]:
+    """Set group description/topic."""
+    return _bridge_action("set_group_topic", {"jid": jid, "topic": topic}, coalesce=True)
+
+
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid)])
+def set_group_announce(jid: str, announce: bool) -> Tuple[bool, str]:
+    """Toggle admin-only messaging for a group."""
+    return _bridge_action("set_group_announce", {"jid": jid, "announce": announce}, coalesce=True)
+
+
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid)])
+def set_group_locked(jid: str, locked: bool) -> Tuple[bool, str]:
+    """Toggle admin-only info editing for a group."""
+    return _bridge_action("set_group_locked", {"jid": jid, "locked": locked}, coalesce=True)
+
+
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid)])
+def set_group_join_approval(jid: str, mode: bool) -> Tuple[bool, str]:
+    """Toggle join approval mode for a group."""
+    return _bridge_action("set_group_join_approval", {"jid": jid, "mode": mode}, coalesce=True)
+
+
+_registrations: Optional[registration.Registrations] = None
+
+
+def is_on_whatsapp(phones: List[str], max_age: Optional[float] = None) -> Dict[str, Any]:
+    """Check if phone numbers are registered on WhatsApp.
+
+    Large lists are checked in parallel chunks and results are cached per
+    E.164 number; max_age=0 ignores cached results.
+    """
+    global _registrations
+    path = get_state_db_path()
+    if _registrations is None or _registrations.db_path != path:
+        _registrations = registration.Registrations(path)
+    try:
+        return _registrations.check(phones, max_age=max_age)
+    except sqlite3.Error as e:
+        print(f"Registration cache error: {e}")
+        return _bridge_call("is_on_whatsapp", {"phones": phones}, idempotent=True)
+
+
+# --- Message Operations ---
+
+def send_reaction(chat_jid: str, sender_jid: str, message_id: str, reaction: str) -> Tuple[bool, str]:
+    """Send a reaction to a message."""
+    return _bridge_action("send_reaction", {"chat_jid": chat_jid, "sender_jid": sender_jid, "message_id": message_id, "reaction": reaction}, coalesce=True)
 
 
 def edit_message(chat_jid: str, message_id: str, new_text: str) -> Tuple[bool, str]:
     """Edit a sent message."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/edit_message"
-        payload = {"chat_jid": chat_jid, "message_id": message_id, "new_text": new_text}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("edit_message", {"chat_jid": chat_jid, "message_id": message_id, "new_text": new_text}, coalesce=True)
 
 
 def delete_message(chat_jid: str, sender_jid: str, message_id: str) -> Tuple[bool, str]:
     """Delete/revoke a message."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/delete_message"
-        payload = {"chat_jid": chat_jid, "sender_jid": sender_jid, "message_id": message_id}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("delete_message", {"chat_jid": chat_jid, "sender_jid": sender_jid, "message_id": message_id}, coalesce=True)
 
 
 def mark_read(chat_jid: str, sender_jid: str, message_ids: List[str]) -> Tuple[bool, str]:
     """Mark messages as read."""
+    return _bridge_action("mark_read", {"chat_jid": chat_jid, "sender_jid": sender_jid, "message_ids": message_ids}, coalesce=True)
+
+
+# Operations the bridge's /api/batch accepts, with the cached metadata each
+# group edit makes stale (same targets as the single-call helpers)
+def _group_info_only(params: Dict[str, Any]) -> List[Tuple[str, Optional[str]]]:
+    return [("group_info", params.get("jid"))]
+
+
+BATCH_OPERATIONS: Dict[str, Optional[Callable[[Dict[str, Any]], List[Tuple[str, Optional[str]]]]]] = {
+    "mark_read": None,
+    "send_reaction": None,
+    "edit_message": None,
+    "delete_message": None,
+    "send_presence": None,
+    "is_on_whatsapp": None,
+    "get_group_info": None,
+    "get_contact_groups": None,
+    "get_group_invite_link": None,
+    "get_sub_groups": None,
+    "set_group_name": lambda params: [("group_info", params.get("jid")), ("sub_groups", None), ("contact_groups", None)],
+    "set_group_topic": _group_info_only,
+    "set_group_announce": _group_info_only,
+    "set_group_locked": _group_info_only,
+    "set_group_join_approval": _group_info_only,
+    "update_group_participants": lambda params: [("group_info", params.get("jid")), ("contact_groups", None)],
+}
+
+
+def run_batch(operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run many small bridge operations in as few requests as possible.
+
+    Args:
+        operations: [{"op": "mark_read", "params": {...}}, ...] where params is the
+            body the op's own endpoint takes
+
+    Returns:
+        Dict with success, succeeded/failed counts and one result per operation, in order
+    """
+    if not operations:
+        return {"success": False, "message": "No operations given"}
+    unknown = sorted({str(op.get("op")) for op in operations if op.get("op") not in BATCH_OPERATIONS})
+    if unknown:
+        return {
+            "success": False,
+            "message": f"Cannot batch: {', '.join(unknown)}. Supported: {', '.join(sorted(BATCH_OPERATIONS))}",
+        }
+
     try:
-        url = f"{WHATSAPP_API_BASE_URL}/mark_read"
-        payload = {"chat_jid": chat_jid, "sender_jid": sender_jid, "message_ids": message_ids}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+        results = bridge.batch([(op["op"], op.get("params") or {}) for op in operations])
+    except bridge.BridgeError as e:
+        return {"success": False, "message": str(e)}
+    finally:
+        # Invalidate even on failure: some operations may have been applied
+        for op in operations:
+            stale = BATCH_OPERATIONS[op["op"]]
+            for kind, key in (stale(op.get("params") or {}) if stale else []):
+                _metadata_cache.invalidate(kind, key)
+
+    succeeded = sum(1 for result in results if result.get("success"))
+    return {
+        "success": True,
+        "message": f"{succeeded} of {len(results)} operations succeeded",
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": [{"op": op["op"], **result} for op, result in zip(operations, results)],
+    }
 
 
 def create_poll(chat_jid: str, question: str, options: List[str], max_selections: int = 1) -> Tuple[bool, str]:
     """Create a WhatsApp poll."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/create_poll"
-        payload = {"chat_jid": chat_jid, "question": question, "options": options, "max_selections": max_selections}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("create_poll", {"chat_jid": chat_jid, "question": question, "options": options, "max_selections": max_selections})
 
 
-def send_reply(chat_jid: str, quoted_message_id: str, quoted_sender_jid: str, message: str, quoted_content: str = "") -> Tuple[bool, str]:
+def send_reply(chat_jid: str, quoted_message_id: str, quoted_sender_jid: str, message: str, quoted_content: str = "", idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     """Reply to a specific message."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/send_reply"
-        payload = {
-            "chat_jid": chat_jid,
-            "quoted_message_id": quoted_message_id,
-            "quoted_sender_jid": quoted_sender_jid,
-            "message": message,
-            "quoted_content": quoted_content,
-        }
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    payload = {
+        "chat_jid": chat_jid,
+        "quoted_message_id": quoted_message_id,
+        "quoted_sender_jid": quoted_sender_jid,
+        "message": message,
+        "quoted_content": quoted_content,
+    }
+    return _send_via_outbox("send_reply", payload, idempotency_key)
 
 
 # --- Advanced ---
 
 def send_presence(presence: str) -> Tuple[bool, str]:
     """Set online/offline presence."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/send_presence"
-        payload = {"presence": presence}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("send_presence", {"presence": presence})
 
 
 def set_status_message(message: str) -> Tuple[bool, str]:
     """Change the 'About' status text."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/set_status_message"
-        payload = {"message": message}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("set_status_message", {"message": message})
 
 
+@_invalidates_metadata(lambda *_, **__: [("newsletters", None)])
 def create_newsletter(name: str, description: str = "") -> Dict[str, Any]:
     """Create a WhatsApp Channel/Newsletter."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/create_newsletter"
-        payload = {"name": name, "description": description}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"success": False, "message": f"HTTP {response.status_code}: {response.text}"}
-    except requests.RequestException as e:
-        return {"success": False, "message": f"Request error: {str(e)}"}
+    return _bridge_call("create_newsletter", {"name": name, "description": description})
 
 
 def get_newsletters() -> Dict[str, Any]:
     """List subscribed newsletters/channels."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/get_newsletters"
-        response = requests.post(url, json={})
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"success": False, "message": f"HTTP {response.status_code}: {response.text}"}
-    except requests.RequestException as e:
-        return {"success": False, "message": f"Request error: {str(e)}"}
+    return _metadata_cache.get_or_load("newsletters", "", _load_newsletters, _succeeded)
+
 
+def _load_newsletters() -> Dict[str, Any]:
+    return _bridge_call("get_newsletters", idempotent=True)
 
-def newsletter_send(jid: str, message: str) -> Tuple[bool, str]:
+
+def newsletter_send(jid: str, message: str, idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     """Send a message to a newsletter channel."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/newsletter_send"
-        payload = {"jid": jid, "message": message}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _send_via_outbox("newsletter_send", {"jid": jid, "message": message}, idempotency_key)
 
 
 def send_status(message: str) -> Tuple[bool, str]:
     """Post to WhatsApp Status (stories, 24h)."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/send_status"
-        payload = {"message": message}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("send_status", {"message": message})
 
 
 # --- Community ---
 
+@_invalidates_metadata(lambda parent_jid, child_jid, **__: [("sub_groups", parent_jid), ("group_info", parent_jid), ("group_info", child_jid)])
 def link_group(parent_jid: str, child_jid: str) -> Tuple[bool, str]:
     """Link a group to a community."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/link_group"
-        payload = {"parent_jid": parent_jid, "child_jid": child_jid}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("link_group", {"parent_jid": parent_jid, "child_jid": child_jid})
 
 
+@_invalidates_metadata(lambda parent_jid, child_jid, **__: [("sub_groups", parent_jid), ("group_info", parent_jid), ("group_info", child_jid)])
 def unlink_group(parent_jid: str, child_jid: str) -> Tuple[bool, str]:
     """Unlink a group from a community."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/unlink_group"
-        payload = {"parent_jid": parent_jid, "child_jid": child_jid}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"HTTP {response.status_code}: {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+    return _bridge_action("unlink_group", {"parent_jid": parent_jid, "child_jid": child_jid})
 
 
 def get_sub_groups(jid: str) -> Dict[str, Any]:
     """Get community sub-groups."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/get_sub_groups"
-        payload = {"jid": jid}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"success": False, "message": f"HTTP {response.status_code}: {response.text}"}
-    except requests.RequestException as e:
-        return {"success": False, "message": f"Request error: {str(e)}"}
+    return _metadata_cache.get_or_load("sub_groups", jid, lambda: _load_sub_groups(jid), _succeeded)
+
+
+def _load_sub_groups(jid: str) -> Dict[str, Any]:
+    return _bridge_call("get_sub_groups", {"jid": jid}, idempotent=True)
 
 
 # --- SQL Analytics (direct SQLite, no Go bridge needed) ---
 
-def get_group_activity_report(chat_jid: str, days: int = 30) -> Dict[str, Any]:
-    """Message count, unique senders, messages/day for a group over N days."""
-    try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                COUNT(*) as total_messages,
-                COUNT(DISTINCT sender) as unique_senders,
-                MIN(timestamp) as first_message,
-                MAX(timestamp) as last_message
-            FROM messages
-            WHERE chat_jid = ? AND timestamp > datetime('now', ?)
-        """, (chat_jid, f"-{days} days"))
-        row = cursor.fetchone()
-        if not row or row[0] == 0:
-            return {"success": True, "chat_jid": chat_jid, "days": days, "total_messages": 0, "unique_senders": 0, "messages_per_day": 0.0}
-        total = row[0]
-        return {
-            "success": True,
-            "chat_jid": chat_jid,
-            "days": days,
+# Activity windows start at the top of the hour: the rollup is bucketed by hour
+_HOUR = 3600
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def _activity_buckets(chat_jids: List[str], days: int) -> Tuple[int, Dict[str, List[Tuple]]]:
+    """Hourly (hour_ts, sender, count, first_ts, first_time, last_ts, last_time) rows per chat.
+
+    Returns the window start (epoch seconds) and each chat's rows, read in one
+    pass from the index's activity_hours rollup, or computed from messages.db
+    if the index is unavailable.
+
+    Raises:
+        sqlite3.Error: If the databases cannot be read
+    """
+    since = (int(time.time()) - days * 86400) // _HOUR * _HOUR
+    params = (json.dumps(chat_jids), since)
+    conn = _message_index_db()
+    if conn is not None:
+        rows = conn.execute("""
+            SELECT chat_jid, hour_ts, sender, message_count, first_ts, first_time, last_ts, last_time
+            FROM activity_hours
+            WHERE chat_jid IN (SELECT value FROM json_each(?)) AND hour_ts >= ?
+        """, params).fetchall()
+    else:
+        rows = _messages_db().execute(f"""
+            SELECT chat_jid, ts - ts % {_HOUR}, sender, COUNT(*), MIN(ts), MIN(timestamp), MAX(ts), MAX(timestamp)
+            FROM (
+                SELECT chat_jid, CAST(strftime('%s', timestamp) AS INTEGER) AS ts, sender, timestamp
+                FROM messages
+                WHERE chat_jid IN (SELECT value FROM json_each(?))
+            )
+            WHERE ts >= ?
+            GROUP BY 1, 2, 3
+        """, params).fetchall()
+    buckets: Dict[str, List[Tuple]] = {jid: [] for jid in chat_jids}
+    for row in rows:
+        buckets[row[0]].append(row[1:])
+    return since, buckets
+
+
+def _activity_timeseries(since: int, rows: List[Tuple]) -> Dict[str, Any]:
+    """Daily message counts and an hour-of-week heatmap (local time) from hourly buckets."""
+    start = datetime.fromtimestamp(since).date()
+    today = datetime.now().date()
+    daily = {date.fromordinal(day): 0 for day in range(start.toordinal(), today.toordinal() + 1)}
+    heatmap = {weekday: [0] * 24 for weekday in _WEEKDAYS}
+    for hour_ts, _, count, *_ in rows:
+        local = datetime.fromtimestamp(hour_ts)
+        daily[local.date()] = daily.get(local.date(), 0) + count
+        heatmap[_WEEKDAYS[local.weekday()]][local.hour] += count
+    return {
+        "daily_counts": [{"date": day.isoformat(), "count": count} for day, count in sorted(daily.items())],
+        "hour_of_week_heatmap": heatmap,
+    }
+
+
+def _activity_report(days: int, since: int, rows: List[Tuple], include_timeseries: bool) -> Dict[str, Any]:
+    total = sum(row[2] for row in rows)
+    if total == 0:
+        report = {"total_messages": 0, "unique_senders": 0, "messages_per_day": 0.0}
+    else:
+        first = min((row for row in rows if row[3] is not None), key=lambda row: row[3])
+        last = max((row for row in rows if row[5] is not None), key=lambda row: row[5])
+        report = {
             "total_messages": total,
-            "unique_senders": row[1],
-            "first_message": row[2],
-            "last_message": row[3],
+            "unique_senders": len({row[1] for row in rows}),
+            "first_message": first[4],
+            "last_message": last[6],
             "messages_per_day": round(total / max(days, 1), 2),
         }
+    if include_timeseries:
+        report.update(_activity_timeseries(since, rows))
+    return report
+
+
+def _select_chat_jids(
+    chat_jids: Optional[List[str]] = None,
+    chat_jid_pattern: Optional[str] = None,
+    community_jid: Optional[str] = None,
+) -> List[str]:
+    """Chats named explicitly, matching a SQL LIKE pattern on the JID, or in a community.
+
+    Raises:
+        ValueError: If no selection was given or the community's sub-groups can't be fetched
+        sqlite3.Error: If messages.db cannot be read
+    """
+    selected = list(chat_jids or [])
+    if chat_jid_pattern:
+        rows = _messages_db().execute("SELECT jid FROM chats WHERE jid LIKE ? ORDER BY jid", (chat_jid_pattern,)).fetchall()
+        selected.extend(row[0] for row in rows)
+    if community_jid:
+        sub_groups = get_sub_groups(community_jid)
+        if not sub_groups.get("success"):
+            raise ValueError(f"Could not fetch sub-groups of {community_jid}: {sub_groups.get('message', '')}")
+        selected.extend(group["jid"] for group in sub_groups.get("groups") or [])
+    if not selected and not (chat_jid_pattern or community_jid):
+        raise ValueError("Provide chat_jids, chat_jid_pattern or community_jid")
+    return list(dict.fromkeys(selected))
+
+
+def get_group_activity_report(chat_jid: str, days: int = 30, include_timeseries: bool = False) -> Dict[str, Any]:
+    """Message count, unique senders, messages/day for a group over N days.
+
+    With include_timeseries, also returns daily_counts and an hour_of_week_heatmap
+    (message counts per weekday and local hour).
+    """
+    try:
+        since, buckets = _activity_buckets([chat_jid], days)
     except sqlite3.Error as e:
         return {"success": False, "message": f"Database error: {e}"}
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    report = {"success": True, "chat_jid": chat_jid, "days": days}
+    report.update(_activity_report(days, since, buckets[chat_jid], include_timeseries))
+    return report
+
+
+def get_group_activity_batch(
+    chat_jids: Optional[List[str]] = None,
+    chat_jid_pattern: Optional[str] = None,
+    community_jid: Optional[str] = None,
+    days: int = 30,
+    include_timeseries: bool = False,
+) -> Dict[str, Any]:
+    """Activity reports for many chats at once, plus totals across all of them.
+
+    Chats are selected by list, JID LIKE pattern and/or community (its sub-groups);
+    all buckets are read in one query.
+    """
+    try:
+        selected = _select_chat_jids(chat_jids, chat_jid_pattern, community_jid)
+        since, buckets = _activity_buckets(selected, days)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Database error: {e}"}
+    all_rows = [row for rows in buckets.values() for row in rows]
+    totals = _activity_report(days, since, all_rows, include_timeseries)
+    totals["active_chats"] = sum(1 for rows in buckets.values() if rows)
+    return {
+        "success": True,
+        "days": days,
+        "chats_analyzed": len(selected),
+        "totals": totals,
+        "chats": {jid: _activity_report(days, since, rows, include_timeseries) for jid, rows in buckets.items()},
+    }
+
+
+def _engagement_tier(count: int) -> str:
+    if count >= 50:
+        return "very_active"
+    if count >= 20:
+        return "active"
+    if count >= 5:
+        return "moderate"
+    return "inactive"
+
+
+def _member_engagement(rows: List[Tuple], names: Dict[str, str]) -> Dict[str, Any]:
+    # sender -> [message count, last_ts, last_time]
+    per_sender: Dict[str, List[Any]] = {}
+    for _, sender, count, _, _, last_ts, last_time in rows:
+        entry = per_sender.setdefault(sender, [0, None, None])
+        entry[0] += count
+        if last_ts is not None and (entry[1] is None or last_ts > entry[1]):
+            entry[1:] = last_ts, last_time
+    ranked = sorted(per_sender.items(), key=lambda item: item[1][0], reverse=True)
+    members = [
+        {
+            "sender": sender,
+            "name": names[sender],
+            "message_count": count,
+            "last_active": last_active,
+            "classification": _engagement_tier(count),
+        }
+        for sender, (count, _, last_active) in ranked
+    ]
+    total_messages = sum(member["message_count"] for member in members)
+    return {"total_messages": total_messages, "unique_senders": len(members), "members": members}
 
 
 def get_member_engagement(chat_jid: str, days: int = 30) -> Dict[str, Any]:
@@ -1195,72 +1937,100 @@ def get_member_engagement(chat_jid: str, days: int = 30) -> Dict[str, Any]:
     Classification criteria: very_active (50+ msgs), active (20+), moderate (5+), inactive (<5).
     """
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                sender,
-                COUNT(*) as message_count,
-                MAX(timestamp) as last_active
-            FROM messages
-            WHERE chat_jid = ? AND timestamp > datetime('now', ?)
-            GROUP BY sender
-            ORDER BY message_count DESC
-        """, (chat_jid, f"-{days} days"))
-        rows = cursor.fetchall()
-        members = []
-        total_messages = 0
-        for row in rows:
-            count = row[1]
-            total_messages += count
-            if count >= 50:
-                classification = "very_active"
-            elif count >= 20:
-                classification = "active"
-            elif count >= 5:
-                classification = "moderate"
-            else:
-                classification = "inactive"
-            name = get_sender_name(row[0])
-            members.append({
-                "sender": row[0],
-                "name": name,
-                "message_count": count,
-                "last_active": row[2],
-                "classification": classification,
-            })
-        return {"total_messages": total_messages, "unique_senders": len(members), "members": members}
+        _, buckets = _activity_buckets([chat_jid], days)
     except sqlite3.Error as e:
         return [{"error": f"Database error: {e}"}]
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    rows = buckets[chat_jid]
+    return _member_engagement(rows, resolve_sender_names(row[1] for row in rows))
+
+
+def get_member_engagement_batch(
+    chat_jids: Optional[List[str]] = None,
+    chat_jid_pattern: Optional[str] = None,
+    community_jid: Optional[str] = None,
+    days: int = 30,
+    include_members: bool = False,
+) -> Dict[str, Any]:
+    """Member engagement for many chats at once, plus community-wide members.
+
+    Per chat: totals and the number of members in each tier (with include_members,
+    the full member list). The totals rank members by their messages across all chats.
+    """
+    try:
+        selected = _select_chat_jids(chat_jids, chat_jid_pattern, community_jid)
+        _, buckets = _activity_buckets(selected, days)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Database error: {e}"}
+    all_rows = [row for rows in buckets.values() for row in rows]
+    names = resolve_sender_names(row[1] for row in all_rows)
+    chats = {}
+    for jid, rows in buckets.items():
+        engagement = _member_engagement(rows, names)
+        tiers = {tier: 0 for tier in ("very_active", "active", "moderate", "inactive")}
+        for member in engagement["members"]:
+            tiers[member["classification"]] += 1
+        engagement["tiers"] = tiers
+        if not include_members:
+            del engagement["members"]
+        chats[jid] = engagement
+    return {
+        "success": True,
+        "days": days,
+        "chats_analyzed": len(selected),
+        "totals": _member_engagement(all_rows, names),
+        "chats": chats,
+    }
 
 
 def cross_group_search(query: str, chat_jid_pattern: Optional[str] = None, limit: int = 50, max_content_length: int = 200) -> List[Dict[str, Any]]:
-    """Search messages across all groups or groups matching a pattern."""
+    """Search messages across all groups or groups matching a pattern.
+
+    Uses the FTS index when available: results are ranked by relevance (bm25) and
+    content is returned as a snippet around the match. Otherwise falls back to a
+    substring scan ordered by recency.
+    """
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        if chat_jid_pattern:
-            cursor.execute("""
-                SELECT m.id, m.chat_jid, c.name, m.sender, m.content, m.timestamp, m.is_from_me
-                FROM messages m
+        fts_match = message_index.fts_query(query)
+        conn = _message_index_db() if fts_match else None
+        if conn is not None:
+            if max_content_length:
+                # Assume ~8 characters per token so snippets fit the length budget;
+                # FTS5 caps snippets at 64 tokens
+                snippet_tokens = max(1, min(64, max_content_length // 8))
+                content_expr = f"snippet(message_fts, 0, '', '', '...', {snippet_tokens})"
+            else:
+                content_expr = "m.content"
+            sql = f"""
+                SELECT m.id, m.chat_jid, c.name, m.sender, {content_expr}, m.timestamp, m.is_from_me
+                FROM message_fts
+                JOIN messages m ON m.rowid = message_fts.rowid
                 JOIN chats c ON m.chat_jid = c.jid
-                WHERE LOWER(m.content) LIKE LOWER(?) AND m.chat_jid LIKE ?
-                ORDER BY m.timestamp DESC
-                LIMIT ?
-            """, (f"%{query}%", chat_jid_pattern, limit))
+                WHERE message_fts MATCH ?
+            """
+            params: List[Any] = [fts_match]
+            if chat_jid_pattern:
+                sql += " AND m.chat_jid LIKE ?"
+                params.append(chat_jid_pattern)
+            sql += " ORDER BY message_fts.rank LIMIT ?"
+            params.append(limit)
         else:
-            cursor.execute("""
+            conn = _messages_db()
+            sql = """
                 SELECT m.id, m.chat_jid, c.name, m.sender, m.content, m.timestamp, m.is_from_me
                 FROM messages m
                 JOIN chats c ON m.chat_jid = c.jid
                 WHERE LOWER(m.content) LIKE LOWER(?)
-                ORDER BY m.timestamp DESC
-                LIMIT ?
-            """, (f"%{query}%", limit))
-        rows = cursor.fetchall()
+            """
+            params = [f"%{query}%"]
+            if chat_jid_pattern:
+                sql += " AND m.chat_jid LIKE ?"
+                params.append(chat_jid_pattern)
+            sql += " ORDER BY m.timestamp DESC LIMIT ?"
+            params.append(limit)
+
+        rows = conn.execute(sql, tuple(params)).fetchall()
         result = []
         for row in rows:
             content = row[4] or ""
@@ -1278,9 +2048,27 @@ def cross_group_search(query: str, chat_jid_pattern: Optional[str] = None, limit
         return result
     except sqlite3.Error as e:
         return [{"error": f"Database error: {e}"}]
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+
+def _participation_by_chat(jid: str) -> Dict[str, Tuple[int, Optional[str], Optional[str]]]:
+    """Map chat JID -> (message count, first message time, last message time) for a sender.
+
+    Raises:
+        sqlite3.Error: If messages.db cannot be read
+    """
+    sender = message_index.sender_key(jid)
+    conn = _message_index_db()
+    if conn is not None:
+        rows = conn.execute(
+            "SELECT chat_jid, message_count, first_time, last_time FROM participation WHERE sender = ?",
+            (sender,),
+        ).fetchall()
+    else:
+        rows = _messages_db().execute(
+            "SELECT chat_jid, COUNT(*), MIN(timestamp), MAX(timestamp) FROM messages WHERE sender = ? GROUP BY chat_jid",
+            (sender,),
+        ).fetchall()
+    return {row[0]: (row[1], row[2], row[3]) for row in rows}
 
 
 def get_participant_journey(jid: str, include_empty: bool = False) -> List[Dict[str, Any]]:
@@ -1288,164 +2076,329 @@ def get_participant_journey(jid: str, include_empty: bool = False) -> List[Dict[
     groups = get_contact_groups(jid)
     result = []
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        for group in groups:
-            group_jid = group.get("jid", "")
-            cursor.execute("""
-                SELECT COUNT(*), MIN(timestamp), MAX(timestamp)
-                FROM messages
-                WHERE chat_jid = ? AND sender LIKE ?
-            """, (group_jid, f"%{jid.split('@')[0] if '@' in jid else jid}%"))
-            row = cursor.fetchone()
-            msg_count = row[0] if row else 0
-            if not include_empty and msg_count == 0:
-                continue
-            result.append({
-                "group_jid": group_jid,
-                "group_name": group.get("name", ""),
-                "message_count": msg_count,
-                "first_message": row[1] if row else None,
-                "last_message": row[2] if row else None,
-            })
-        return result
+        activity = _participation_by_chat(jid)
     except sqlite3.Error as e:
         return [{"error": f"Database error: {e}"}]
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    for group in groups:
+        group_jid = group.get("jid", "")
+        msg_count, first_message, last_message = activity.get(group_jid, (0, None, None))
+        if not include_empty and msg_count == 0:
+            continue
+        result.append({
+            "group_jid": group_jid,
+            "group_name": group.get("name", ""),
+            "message_count": msg_count,
+            "first_message": first_message,
+            "last_message": last_message,
+        })
+    return result
 
 
-def broadcast_to_groups(group_jids: List[str], message: str, delay_seconds: int = 3) -> List[Dict[str, Any]]:
-    """Send same message to multiple groups with delay between sends."""
-    results = []
-    for jid in group_jids:
-        success, msg = send_message(jid, message)
-        results.append({"jid": jid, "success": success, "message": msg})
-        if jid != group_jids[-1]:
-            time.sleep(delay_seconds)
-    return results
+# Broadcast sends allowed in flight at once; pacing comes from delay_seconds
+BROADCAST_CONCURRENCY = 2
+# Bulk media downloads allowed in flight at once; they are not rate limited
+MEDIA_DOWNLOAD_CONCURRENCY = 4
 
+_job_engine: Optional[jobs.JobEngine] = None
+_job_engine_lock = threading.Lock()
 
-def get_group_overlap(group_jids: List[str], include_members: bool = False) -> Dict[str, Any]:
-    """Compare members across 2+ groups. Returns counts by default."""
-    all_participants = {}
-    group_names = {}
-    for jid in group_jids:
-        info = get_group_info(jid, include_participants=True, participant_limit=10000)
-        if info.get("success") and info.get("group"):
-            group_data = info["group"]
-            group_names[jid] = group_data.get("name", jid)
-            members = set()
-            for p in group_data.get("participants", []):
-                members.add(p.get("jid", ""))
-            all_participants[jid] = members
-        else:
-            all_participants[jid] = set()
-            group_names[jid] = jid
 
-    if not all_participants:
+def _broadcast_message_id(broadcast_id: str, jid: str) -> str:
+    """The message ID a broadcast always uses for one recipient, in WhatsApp's own format."""
+    return "3EB0" + hashlib.sha256(f"{broadcast_id}:{jid}".encode()).hexdigest()[:16].upper()
+
+
+def _broadcast_send(jid: str, params: Dict[str, Any]) -> Tuple[bool, str]:
+    """Job handler: send one broadcast message, deferring it while the bridge is down.
+
+    Every attempt for a recipient carries the same message ID, so the bridge
+    drops a repeat of a send that already went through.
+    """
+    payload = {"recipient": jid, "message": params.get("message", "")}
+    # Jobs queued before broadcasts had an ID go out unpinned, as they did then
+    pinned = bool(params.get("broadcast_id"))
+    if pinned:
+        payload["message_id"] = _broadcast_message_id(params["broadcast_id"], jid)
+    if params.get("media_path"):
+        if not os.path.isfile(params["media_path"]):
+            return False, f"Media file not found: {params['media_path']}"
+        # Processed once: later recipients find the result in the media cache,
+        # and sends running together share the one in-flight conversion
+        prepared = _prepare_media(params["media_path"])
+        payload["media_path"] = prepared.path
+        if prepared.thumbnail_path:
+            payload["thumbnail_path"] = prepared.thumbnail_path
+    try:
+        result = bridge.post("send", payload, idempotent=pinned)
+    except bridge.BridgeUnavailable as e:
+        raise jobs.RetryLater(str(e)) from e
+    except bridge.BridgeError as e:
+        return False, str(e)
+    return result.get("success", False), result.get("message", "Unknown response")
+
+
+def _media_download(message_id: str, params: Dict[str, Any]) -> Tuple[bool, str]:
+    """Job handler: download one message's media, deferring it while the bridge is down."""
+    try:
+        result = bridge.post("download", {"message_id": message_id, "chat_jid": params["chat_jid"]}, idempotent=True)
+    except bridge.BridgeUnavailable as e:
+        raise jobs.RetryLater(str(e)) from e
+    except bridge.BridgeError as e:
+        return False, str(e)
+    if not result.get("success", False):
+        return False, result.get("message", "Unknown response")
+    # Older bridges do not say whether the file was already there
+    return True, f"{result.get('source') or 'downloaded'}: {result.get('path', '')}"
+
+
+def _jobs() -> jobs.JobEngine:
+    """The job engine for the current store, created on first use."""
+    global _job_engine
+    path = get_state_db_path()
+    with _job_engine_lock:
+        if _job_engine is None or _job_engine.db_path != path:
+            if _job_engine is not None:
+                _job_engine.shutdown(timeout=5)
+            _job_engine = jobs.JobEngine(
+                path,
+                {"broadcast": _broadcast_send, "media_download": _media_download},
+                repeatable=("media_download",),
+            )
+        return _job_engine
+
+
+def broadcast_to_groups(group_jids: List[str], message: str = "", delay_seconds: int = 3,
+                        media_path: Optional[str] = None) -> Dict[str, Any]:
+    """Queue a job sending the same message or file to multiple chats and return its handle.
+
+    Sends run in the background, starting at most one every delay_seconds.
+    Follow them with get_job_status(job_id); cancel_job and resume_job pause
+    and continue the job. Each recipient's result is stored as it completes, so
+    a restarted server carries on without resending.
+
+    With media_path, the file is sent with message as its caption. The job
+    processes it once, before the first send, and the bridge uploads it to
+    WhatsApp once and reuses the upload for every other recipient.
+    """
+    targets = list(dict.fromkeys(jid for jid in group_jids if jid))
+    if not targets:
+        return {"success": False, "message": "group_jids must contain at least one JID"}
+    params: Dict[str, Any] = {"message": message, "broadcast_id": uuid.uuid4().hex}
+    if media_path:
+        if not os.path.isfile(media_path):
+            return {"success": False, "message": f"Media file not found: {media_path}"}
+        params["media_path"] = media_path
+    elif not message:
+        return {"success": False, "message": "message or media_path required"}
+    rate = 1.0 / delay_seconds if delay_seconds > 0 else 0.0
+    try:
+        job_id = _jobs().submit("broadcast", targets, params, rate=rate, concurrency=BROADCAST_CONCURRENCY)
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Could not queue broadcast: {e}"}
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "total": len(targets),
+        "message": f"Broadcast to {len(targets)} chats queued",
+    }
+
+
+def get_job_status(job_id: str, include_items: bool = False) -> Dict[str, Any]:
+    """Progress of a background job: counts per item state and failures (or every item)."""
+    status = _jobs().status(job_id, include_items=include_items)
+    if status is None:
+        return {"success": False, "message": f"Job {job_id} not found"}
+    return {"success": True, **status}
+
+
+def list_jobs(limit: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Most recent background jobs, optionally filtered by status."""
+    return _jobs().list_jobs(limit=limit, status=status)
+
+
+def cancel_job(job_id: str) -> Tuple[bool, str]:
+    """Stop a background job; unsent items can be continued with resume_job."""
+    return _jobs().cancel(job_id)
+
+
+def resume_job(job_id: str, retry_failed: bool = False) -> Tuple[bool, str]:
+    """Continue a cancelled or finished job, optionally retrying failed items."""
+    return _jobs().resume(job_id, retry_failed=retry_failed)
+
+
+def resume_interrupted_jobs() -> List[str]:
+    """Restart jobs left active by a previous server run."""
+    try:
+        return _jobs().recover()
+    except sqlite3.Error as e:
+        print(f"Could not resume jobs: {e}")
+        return []
+
+
+# Parallel get_group_info calls when fetching many groups' participants
+PARTICIPANT_FETCH_WORKERS = 8
+
+
+def _fetch_participants(jid: str) -> Optional[Tuple[str, List[str]]]:
+    """(group name, member jids) for a group, None if the bridge call fails.
+
+    Goes through get_group_info, so recent lookups come from the metadata cache.
+    """
+    info = get_group_info(jid, include_participants=True, participant_limit=10000)
+    if not info.get("success") or not info.get("group"):
+        return None
+    group = info["group"]
+    members = [p["jid"] for p in group.get("participants", []) if p.get("jid")]
+    return group.get("name") or jid, members
+
+
+def _fetch_all_participants(group_jids: List[str]) -> Dict[str, Optional[Tuple[str, List[str]]]]:
+    """Fetch many groups' participants concurrently (at most PARTICIPANT_FETCH_WORKERS at a time)."""
+    unique_jids = list(dict.fromkeys(group_jids))
+    if len(unique_jids) <= 1:
+        return {jid: _fetch_participants(jid) for jid in unique_jids}
+    with ThreadPoolExecutor(max_workers=min(PARTICIPANT_FETCH_WORKERS, len(unique_jids))) as pool:
+        return dict(zip(unique_jids, pool.map(_fetch_participants, unique_jids)))
+
+
+def _bitset(positions: List[int]) -> int:
+    """Int with the given bits set, built in one pass (OR-ing in bits one by one is quadratic)."""
+    if not positions:
+        return 0
+    buf = bytearray(max(positions) // 8 + 1)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, "little")
+
+
+def get_group_overlap(group_jids: List[str], include_members: bool = False, include_matrix: bool = True) -> Dict[str, Any]:
+    """Compare members across 2+ groups. Returns counts by default.
+
+    Members are interned to bit positions so each group is one int bitset;
+    common, unique and pairwise counts are AND/OR/popcount operations. With
+    include_matrix, also returns pairwise overlap counts and Jaccard similarity
+    (rows and columns in the order of matrix_groups).
+    """
+    fetched = _fetch_all_participants(group_jids)
+    group_jids = list(fetched)
+    if not group_jids:
         return {"success": False, "message": "Could not fetch group info"}
 
-    # Find common members (in ALL groups)
-    sets = list(all_participants.values())
-    common = sets[0].copy() if sets else set()
-    for s in sets[1:]:
-        common &= s
+    member_bits: Dict[str, int] = {}
+    bitsets: List[int] = []
+    names: List[str] = []
+    for jid in group_jids:
+        name, members = fetched[jid] or (jid, [])
+        positions = [member_bits.setdefault(member, len(member_bits)) for member in members]
+        bitsets.append(_bitset(positions))
+        names.append(name)
+    members_by_bit = list(member_bits)
+
+    def decode(bits: int) -> List[str]:
+        # Jump from one set bit to the next instead of testing every position
+        result = []
+        while bits:
+            lowest = bits & -bits
+            result.append(members_by_bit[lowest.bit_length() - 1])
+            bits ^= lowest
+        return result
+
+    # Members in every group
+    common = bitsets[0]
+    for bits in bitsets[1:]:
+        common &= bits
 
-    # Find unique per group
+    # Members seen in exactly one group: one pass, tracking "seen once" and "seen again"
+    seen = repeated = 0
+    for bits in bitsets:
+        repeated |= seen & bits
+        seen |= bits
     unique_per_group = {}
-    for jid, members in all_participants.items():
-        others = set()
-        for other_jid, other_members in all_participants.items():
-            if other_jid != jid:
-                others |= other_members
-        unique_per_group[group_names[jid]] = list(members - others) if include_members else len(members - others)
+    for name, bits in zip(names, bitsets):
+        unique = bits & ~repeated
+        unique_per_group[name] = decode(unique) if include_members else unique.bit_count()
 
     result = {
         "success": True,
         "groups_analyzed": len(group_jids),
-        "common_count": len(common),
+        "total_members": len(member_bits),
+        "common_count": common.bit_count(),
         "unique_per_group": unique_per_group,
     }
+    failed = [jid for jid in group_jids if fetched[jid] is None]
+    if failed:
+        result["failed_groups"] = failed
     if include_members:
-        result["common_members"] = list(common)
+        result["common_members"] = decode(common)
+    if include_matrix:
+        sizes = [bits.bit_count() for bits in bitsets]
+        overlap = [[0] * len(bitsets) for _ in bitsets]
+        jaccard = [[0.0] * len(bitsets) for _ in bitsets]
+        for i, a in enumerate(bitsets):
+            overlap[i][i] = sizes[i]
+            jaccard[i][i] = 1.0 if sizes[i] else 0.0
+            for j in range(i + 1, len(bitsets)):
+                shared = (a & bitsets[j]).bit_count()
+                union = sizes[i] + sizes[j] - shared
+                overlap[i][j] = overlap[j][i] = shared
+                jaccard[i][j] = jaccard[j][i] = round(shared / union, 4) if union else 0.0
+        result["matrix_groups"] = [{"jid": jid, "name": name} for jid, name in zip(group_jids, names)]
+        result["overlap_matrix"] = overlap
+        result["jaccard_matrix"] = jaccard
     return result
 
 
 def get_last_interaction(jid: str) -> str:
     """Get most recent message involving the contact."""
     try:
-        conn = sqlite3.connect(get_messages_db_path())
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                m.timestamp,
-                m.sender,
-                c.name,
-                m.content,
-                m.is_from_me,
-                c.jid,
-                m.id,
-                m.media_type
-            FROM messages m
-            JOIN chats c ON m.chat_jid = c.jid
-            WHERE m.sender = ? OR c.jid = ?
-            ORDER BY m.timestamp DESC
-            LIMIT 1
-        """, (jid, jid))
-        
-        msg_data = cursor.fetchone()
+        sender = message_index.sender_key(jid)
+        columns = "m.timestamp, m.sender, c.name, m.content, m.is_from_me, c.jid, m.id, m.media_type"
+        conn = _message_index_db()
+        if conn is not None:
+            # Latest message they wrote anywhere, or the latest in their direct chat
+            msg_data = conn.execute(f"""
+                SELECT {columns}
+                FROM messages m
+                JOIN chats c ON m.chat_jid = c.jid
+                WHERE m.rowid = (
+                    SELECT last_rowid FROM (
+                        SELECT last_rowid, last_ts FROM participation WHERE sender = ?
+                        UNION ALL
+                        SELECT last_rowid, last_ts FROM chat_summary WHERE chat_jid = ?
+                    )
+                    ORDER BY last_ts DESC
+                    LIMIT 1
+                )
+            """, (sender, jid)).fetchone()
+        else:
+            msg_data = _messages_db().execute(f"""
+                SELECT {columns}
+                FROM messages m
+                JOIN chats c ON m.chat_jid = c.jid
+                WHERE m.sender = ? OR c.jid = ?
+                ORDER BY m.timestamp DESC
+                LIMIT 1
+            """, (sender, jid)).fetchone()
         
         if not msg_data:
             return None
             
-        message = Message(
-            timestamp=datetime.fromisoformat(msg_data[0]),
-            sender=msg_data[1],
-            chat_name=msg_data[2],
-            content=msg_data[3],
-            is_from_me=msg_data[4],
-            chat_jid=msg_data[5],
-            id=msg_data[6],
-            media_type=msg_data[7]
-        )
+        message = _message_from_row(msg_data)
         
         return format_message(message)
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def get_chat(chat_jid: str, include_last_message: bool = True) -> Optional[Chat]:
     """Get chat metadata by JID."""
     try:
-        conn = sqlite3.connect(get_messages_db_path())
+        conn, select = _chat_select(include_last_message)
         cursor = conn.cursor()
-        
-        query = """
-            SELECT 
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-        """
-        
-        if include_last_message:
-            query += """
-                LEFT JOIN messages m ON c.jid = m.chat_jid 
-                AND c.last_message_time = m.timestamp
-            """
-            
-        query += " WHERE c.jid = ?"
+        query = select + " WHERE chats.jid = ?"
         
         cursor.execute(query, (chat_jid,))
         chat_data = cursor.fetchone()
@@ -1453,41 +2406,21 @@ def get_chat(chat_jid: str, include_last_message: bool = True) -> Optional[Chat]
         if not chat_data:
             return None
             
-        return Chat(
-            jid=chat_data[0],
-            name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-            last_message=chat_data[3],
-            last_sender=chat_data[4],
-            last_is_from_me=chat_data[5]
-        )
+        return _chat_from_row(chat_data)
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def get_direct_chat_by_contact(sender_phone_number: str) -> Optional[Chat]:
     """Get chat metadata by sender phone number."""
     try:
-        conn = sqlite3.connect(get_messages_db_path())
+        conn, select = _chat_select()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT 
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-            LEFT JOIN messages m ON c.jid = m.chat_jid 
-                AND c.last_message_time = m.timestamp
-            WHERE c.jid LIKE ? AND c.jid NOT LIKE '%@g.us'
+        cursor.execute(select + """
+            WHERE chats.jid LIKE ? AND chats.jid NOT LIKE '%@g.us'
             LIMIT 1
         """, (f"%{sender_phone_number}%",))
         
@@ -1496,69 +2429,64 @@ def get_direct_chat_by_contact(sender_phone_number: str) -> Optional[Chat]:
         if not chat_data:
             return None
             
-        return Chat(
-            jid=chat_data[0],
-            name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-            last_message=chat_data[3],
-            last_sender=chat_data[4],
-            last_is_from_me=chat_data[5]
-        )
+        return _chat_from_row(chat_data)
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 def connection_status() -> Dict[str, Any]:
     try:
-        response = requests.get(f"{WHATSAPP_API_BASE_URL}/status", timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        return {"connected": False, "logged_in": False, "error": f"HTTP {response.status_code}"}
-    except requests.RequestException as e:
-        return {"connected": False, "logged_in": False, "error": f"Bridge unreachable: {e}"}
+        return bridge.request("status", method="GET", idempotent=True)
+    except bridge.BridgeError as e:
+        return {"connected": False, "logged_in": False, "error": f"Bridge unreachable: {e}", "circuit": bridge.stats()}
 
 
 def reconnect() -> Dict[str, Any]:
     try:
-        response = requests.post(f"{WHATSAPP_API_BASE_URL}/reconnect", timeout=15)
-        return response.json()
-    except requests.RequestException as e:
+        return bridge.post("reconnect")
+    except bridge.BridgeError as e:
         return {"success": False, "message": f"Bridge unreachable: {e}"}
 
 
-def send_message(recipient: str, message: str) -> Tuple[bool, str]:
+async def aconnection_status() -> Dict[str, Any]:
+    try:
+        return await bridge.arequest("status", method="GET", idempotent=True)
+    except bridge.BridgeError as e:
+        return {"connected": False, "logged_in": False, "error": f"Bridge unreachable: {e}", "circuit": bridge.stats()}
+
+
+async def areconnect() -> Dict[str, Any]:
+    try:
+        return await bridge.arequest("reconnect")
+    except bridge.BridgeError as e:
+        return {"success": False, "message": f"Bridge unreachable: {e}"}
+
+
+def send_message(recipient: str, message: str, idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     try:
         # Validate input
         if not recipient:
             return False, "Recipient must be provided"
         
-        url = f"{WHATSAPP_API_BASE_URL}/send"
         payload = {
             "recipient": recipient,
             "message": message,
         }
-        
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-            
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
+
+        return _send_via_outbox("send", payload, idempotency_key)
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
-def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
+# Images and videos are resized/transcoded and given a thumbnail before sending (see media.py)
+MEDIA_PREPROCESSING = True
+
+
+def _prepare_media(media_path: str) -> media.PreparedMedia:
+    return media.prepare(media_path) if MEDIA_PREPROCESSING else media.PreparedMedia(media_path)
+
+
+def send_file(recipient: str, media_path: str, idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     try:
         # Validate input
         if not recipient:
@@ -1570,29 +2498,47 @@ def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
         if not os.path.isfile(media_path):
             return False, f"Media file not found: {media_path}"
         
-        url = f"{WHATSAPP_API_BASE_URL}/send"
         payload = {
             "recipient": recipient,
             "media_path": media_path
         }
-        
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-            
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
+        prepared = _prepare_media(media_path)
+        payload["media_path"] = prepared.path
+        if prepared.thumbnail_path:
+            payload["thumbnail_path"] = prepared.thumbnail_path
+
+        return _send_via_outbox("send", payload, idempotency_key)
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
-def send_audio_message(recipient: str, media_path: str) -> Tuple[bool, str]:
+# Voice notes that need converting are encoded in memory and streamed to the
+# bridge; when off, they go through the on-disk conversion cache instead
+AUDIO_STREAMING = True
+
+
+def _send_streamed_audio(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Outbox sender for "send_media": encode a voice note through ffmpeg pipes
+    and stream it to the bridge, so no converted file is written."""
+    params = {"recipient": payload["recipient"], "filename": "voice.ogg", "message_id": payload.get("message_id", "")}
+    try:
+        data = audio.convert_to_opus_ogg_bytes(payload["source_path"])
+    except (OSError, RuntimeError) as e:
+        return {"success": False, "message": f"Error converting file to opus ogg. You likely need to install ffmpeg: {e}"}
+    try:
+        return bridge.upload("send_media", data, params, idempotent=True)
+    except bridge.BridgeError as e:
+        if not str(e).startswith("HTTP 404"):
+            raise
+    # Bridges without /api/send_media only read media from a file path
+    try:
+        media_path = audio.convert_to_opus_ogg_temp(payload["source_path"])
+    except (OSError, RuntimeError) as e:
+        return {"success": False, "message": f"Error converting file to opus ogg. You likely need to install ffmpeg: {e}"}
+    fallback = {"recipient": payload["recipient"], "media_path": media_path, "message_id": params["message_id"]}
+    return bridge.post("send", fallback, idempotent=True)
+
+
+def send_audio_message(recipient: str, media_path: str, idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     try:
         # Validate input
         if not recipient:
@@ -1605,30 +2551,21 @@ def send_audio_message(recipient: str, media_path: str) -> Tuple[bool, str]:
             return False, f"Media file not found: {media_path}"
 
         if not media_path.endswith(".ogg"):
+            if AUDIO_STREAMING:
+                # Encoded in memory when the outbox delivers it; see _send_streamed_audio
+                payload = {"recipient": recipient, "source_path": media_path}
+                return _send_via_outbox("send_media", payload, idempotency_key)
             try:
                 media_path = audio.convert_to_opus_ogg_temp(media_path)
             except Exception as e:
                 return False, f"Error converting file to opus ogg. You likely need to install ffmpeg: {str(e)}"
         
-        url = f"{WHATSAPP_API_BASE_URL}/send"
         payload = {
             "recipient": recipient,
             "media_path": media_path
         }
-        
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-            
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
+
+        return _send_via_outbox("send", payload, idempotency_key)
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
@@ -1642,136 +2579,107 @@ def download_media(message_id: str, chat_jid: str) -> Optional[str]:
     Returns:
         The local file path if download was successful, None otherwise
     """
+    payload = {
+        "message_id": message_id,
+        "chat_jid": chat_jid
+    }
+    result = _bridge_call("download", payload, idempotent=True)
+    if result.get("success", False):
+        path = result.get("path")
+        print(f"Media downloaded successfully: {path}")
+        return path
+    print(f"Download failed: {result.get('message', 'Unknown error')}")
+    return None
+
+
+MEDIA_TYPES = ("image", "video", "audio", "document", "sticker")
+
+
+def download_chat_media(chat_jid: str, after: Optional[str] = None, before: Optional[str] = None,
+                        media_types: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Queue a job downloading every media file in a chat and return its handle.
+
+    Args:
+        chat_jid: The chat to archive
+        after: Only messages after this ISO-8601 date
+        before: Only messages before this ISO-8601 date
+        media_types: Only these types (image, video, audio, document, sticker)
+
+    Files already downloaded are skipped, and the bridge stores each distinct
+    file once however many chats it was forwarded to. Follow progress with
+    get_job_status(job_id); each item's message says whether the file was
+    downloaded, linked to an existing copy or already present.
+    """
+    types = list(dict.fromkeys(media_types or MEDIA_TYPES))
+    unknown = [t for t in types if t not in MEDIA_TYPES]
+    if unknown:
+        return {"success": False, "message": f"Unknown media types: {', '.join(unknown)}. Valid: {', '.join(MEDIA_TYPES)}"}
+    query = [f"SELECT id FROM messages WHERE chat_jid = ? AND media_type IN ({','.join('?' * len(types))})"]
+    params: List[Any] = [chat_jid, *types]
     try:
-        url = f"{WHATSAPP_API_BASE_URL}/download"
-        payload = {
-            "message_id": message_id,
-            "chat_jid": chat_jid
-        }
-        
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success", False):
-                path = result.get("path")
-                print(f"Media downloaded successfully: {path}")
-                return path
-            else:
-                print(f"Download failed: {result.get('message', 'Unknown error')}")
-                return None
-        else:
-            print(f"Error: HTTP {response.status_code} - {response.text}")
-            return None
-            
-    except requests.RequestException as e:
-        print(f"Request error: {str(e)}")
-        return None
-    except json.JSONDecodeError:
-        print(f"Error parsing response: {response.text}")
-        return None
-    except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        return None
+        # Timestamps are text with a zone suffix, so ranges compare epoch seconds
+        if after:
+            query.append("AND CAST(strftime('%s', timestamp) AS INTEGER) > ?")
+            params.append(_epoch_bound(after, "after"))
+        if before:
+            query.append("AND CAST(strftime('%s', timestamp) AS INTEGER) < ?")
+            params.append(_epoch_bound(before, "before"))
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    query.append("ORDER BY timestamp")
+    try:
+        message_ids = [row[0] for row in _messages_db().execute(" ".join(query), params)]
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Database error: {e}"}
+    if not message_ids:
+        return {"success": True, "total": 0, "message": f"No media in {chat_jid} matches the filters"}
+    try:
+        job_id = _jobs().submit("media_download", message_ids, {"chat_jid": chat_jid},
+                                concurrency=MEDIA_DOWNLOAD_CONCURRENCY)
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Could not queue download: {e}"}
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "total": len(message_ids),
+        "message": f"Download of {len(message_ids)} media files from {chat_jid} queued",
+    }
 
 
+@_invalidates_metadata(lambda *_, **__: [("contact_groups", None)])
 def create_group(name: str, participants: List[str]) -> Tuple[bool, str, Optional[str]]:
     """Create a new WhatsApp group."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/create_group"
-        payload = {"name": name, "participants": participants}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", ""), result.get("jid")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}", None
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}", None
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}", None
+    result = _bridge_call("create_group", {"name": name, "participants": participants})
+    return result.get("success", False), result.get("message", ""), result.get("jid")
 
 
+@_invalidates_metadata(lambda *_, **__: [("contact_groups", None)])
 def join_group_with_link(invite: str) -> Tuple[bool, str, Optional[str]]:
     """Join a WhatsApp group via invite link."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/join_group"
-        payload = {"invite": invite}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", ""), result.get("jid")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}", None
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}", None
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}", None
+    result = _bridge_call("join_group", {"invite": invite})
+    return result.get("success", False), result.get("message", ""), result.get("jid")
 
 
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid), ("invite_link", jid), ("sub_groups", None), ("contact_groups", None)])
 def leave_group(jid: str) -> Tuple[bool, str]:
     """Leave a WhatsApp group."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/leave_group"
-        payload = {"jid": jid}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
+    return _bridge_action("leave_group", {"jid": jid})
 
 
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid), ("contact_groups", None)])
 def update_group_participants(jid: str, action: str, participants: List[str]) -> Tuple[bool, str]:
     """Manage participants in a WhatsApp group."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/update_group_participants"
-        payload = {"jid": jid, "action": action, "participants": participants}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
+    return _bridge_action("update_group_participants", {"jid": jid, "action": action, "participants": participants})
 
 
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid), ("sub_groups", None), ("contact_groups", None)])
 def set_group_name(jid: str, name: str) -> Tuple[bool, str]:
     """Set WhatsApp group name."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/set_group_name"
-        payload = {"jid": jid, "name": name}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
+    return _bridge_action("set_group_name", {"jid": jid, "name": name})
 
 
+@_invalidates_metadata(lambda jid, *_, **__: [("group_info", jid)])
 def set_group_photo(jid: str, image_path: str) -> Tuple[bool, str]:
     """Set WhatsApp group photo."""
-    try:
-        url = f"{WHATSAPP_API_BASE_URL}/set_group_photo"
-        payload = {"jid": jid, "image_path": image_path}
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
+    return _bridge_action("set_group_photo", {"jid": jid, "image_path": image_path})